@@ -3,20 +3,59 @@ import requests
 import os
 import json
 import logging
-from fastapi import FastAPI, HTTPException, Depends, Query, status, Form, Request
+from fastapi import FastAPI, HTTPException, Depends, Query, status, Form, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from bs4 import BeautifulSoup
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from dotenv import load_dotenv
 from pydantic import BaseModel
 from typing import List, Optional
 from sqlalchemy.orm import Session
-from database.config import get_db
+from database.config import get_db, pool_metrics
+from database.async_db import async_pool_metrics, get_async_db
+from database.replicas import get_async_read_db, get_read_db, replica_router
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
 from database import models, schemas
-from sqlalchemy import func
-from database.security import auth, get_current_user, RateLimitMiddleware, generate_token
+from sqlalchemy import func, or_, and_, select, tuple_
+from database.security import (
+    auth, client_ip, get_current_user, get_optional_user, RateLimitMiddleware, generate_token, rate_limiter,
+    password_hasher, revoke_token, token_deny_list
+)
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from database.reanalysis import ReanalysisScheduler, crossed_threshold
+from database.analysis_store import (
+    PROJECTABLE_ANALYSIS_FIELDS,
+    get_latest_analysis,
+    get_projected_analysis_fields,
+    latest_analysis_version,
+    load_analysis_version,
+    save_first_analysis,
+)
+from database.precompute import PrecomputeJob, estimate_analysis_tokens
+from database.view_counter import ViewCounterBuffer
+from database.upserts import ensure_song_reference, upsert_song_reference
+from database.leaderboard import Leaderboard, most_viewed_order, song_item
+from database.pagination import RowCountEstimator, decode_cursor, encode_cursor
+from database.trending import TRENDING_WINDOWS, RollupRetentionJob, trending_songs
+from database.comment_aggregates import TopCommentsCache, update_comment_aggregates
+from database.votes import DuplicateVoteError, VoteRecorder, voter_key
+from database.etags import (
+    ANALYSIS_VERSION_CACHE_CONTROL,
+    COMMENTS_CACHE_CONTROL,
+    LATEST_ANALYSIS_CACHE_CONTROL,
+    MOST_VIEWED_CACHE_CONTROL,
+    MOST_VIEWED_MAX_AGE,
+    conditional_response,
+    make_etag,
+)
+from database.song_events import SongEventHub, TooManySubscribers
+from database.fast_json import fast_json_response
+from database.middleware import ReadYourWritesMiddleware, RequestTimingMiddleware
+from database.llm_budget import LLMBudget, record_llm_usage
 import functools
 import time
+from datetime import datetime
 from fastapi.responses import JSONResponse
 from fastapi.middleware.gzip import GZipMiddleware
 
@@ -51,6 +90,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allows all methods
     allow_headers=["*"],  # Allows all headers
+    expose_headers=["X-Next-Cursor"],  # Comment pagination cursor
 )
 
 # Make sure these environment variables are set in your system or .env:
@@ -67,6 +107,12 @@ GENIUS_LYRICS_URL = "https://genius-song-lyrics1.p.rapidapi.com/song/lyrics/"
 # Add rate limiting middleware
 app.add_middleware(RateLimitMiddleware)
 
+# Send clients that just wrote to the primary for their next reads
+app.add_middleware(ReadYourWritesMiddleware)
+
+# Add request timing middleware (wraps rate limiting, so rejected requests are timed too)
+app.add_middleware(RequestTimingMiddleware)
+
 # Add GZip compression middleware
 app.add_middleware(GZipMiddleware, minimum_size=1000)
 
@@ -111,15 +157,15 @@ class Token(BaseModel):
 
 # Add authentication endpoints
 @app.post("/register", response_model=Token)
-def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = auth.create_user(user.username, user.password, db, user.email)
+async def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+    db_user = await auth.create_user_async(user.username, user.password, db, user.email)
     token = generate_token(db_user)
     return {"access_token": token, "token_type": "bearer"}
 
 
 @app.post("/token", response_model=Token)
-def login(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = auth.authenticate_user(user.username, user.password, db)
+async def login(user: schemas.UserCreate, db: Session = Depends(get_db)):
+    db_user = await auth.authenticate_user_async(user.username, user.password, db)
     if not db_user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -130,6 +176,18 @@ def login(user: schemas.UserCreate, db: Session = Depends(get_db)):
     return {"access_token": token, "token_type": "bearer"}
 
 
+@app.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+def logout(credentials: HTTPAuthorizationCredentials = Depends(HTTPBearer()), db: Session = Depends(get_db)):
+    """Revoke the bearer token for the rest of its lifetime."""
+    if not revoke_token(credentials.credentials, db):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
 # Helper function to get lyrics by song ID
 @cache_lyrics
 def get_lyrics_by_id(song_id: int):
@@ -282,10 +340,21 @@ def search_lyrics_endpoint(
 
 # FastAPI route for analyzing lyrics
 @app.get("/analyze_lyrics")
-async def analyze_lyrics_endpoint(record_id: int, track: str = "", artist: str = ""):
+async def analyze_lyrics_endpoint(
+        record_id: int,
+        request: Request,
+        track: str = "",
+        artist: str = "",
+        db: AsyncSession = Depends(get_async_db),
+        current_user: Optional[models.User] = Depends(get_optional_user)
+):
+    """
+    Get the analysis for a song, generating and storing it on first request.
+    Generating draws on the caller's LLM token budget; stored analyses do not.
+    """
     try:
-        # Get lyrics from cache or API
-        lyrics_data = get_lyrics_by_id(song_id=record_id)
+        # Get lyrics from cache or API; blocking HTTP stays off the event loop
+        lyrics_data = await run_in_threadpool(get_lyrics_by_id, song_id=record_id)
         lyrics_text = lyrics_data.get("plainLyrics", "")
 
         if ENV == "test":
@@ -301,28 +370,40 @@ async def analyze_lyrics_endpoint(record_id: int, track: str = "", artist: str =
                 "lyrics": lyrics_text
             }
 
-        # Analyze lyrics with optimized function
-        analysis_json = analyze_lyrics_with_function_call(
-            song_title=track or "Unknown Title",
-            artist=artist or "Unknown Artist",
-            lyrics=lyrics_text
-        )
+        # Serve the stored (possibly precomputed) analysis when there is one
+        latest_analysis = await db.run_sync(get_latest_analysis, record_id)
+        if latest_analysis:
+            analysis_json = latest_analysis.analysis_data
+        else:
+            # Analyze lyrics with optimized function
+            with llm_budget.reserve(
+                    estimate_analysis_tokens(lyrics_text),
+                    current_user.id if current_user else None,
+                    client_ip(request.scope)
+            ):
+                analysis_json = await run_in_threadpool(
+                    analyze_lyrics_with_function_call,
+                    song_title=track or "Unknown Title",
+                    artist=artist or "Unknown Artist",
+                    lyrics=lyrics_text
+                )
 
-        # Update view count in database
-        db = next(get_db())
-        song_ref = db.query(models.ExternalSongReference).filter(
-            models.ExternalSongReference.external_id == record_id
-        ).first()
-        
-        if song_ref:
-            song_ref.view_count += 1
-            db.commit()
+            await db.run_sync(ensure_song_reference, record_id, title=track, artist=artist)
+            # A concurrent request may have saved version 1 first; keep theirs
+            await db.run_sync(save_first_analysis, record_id, analysis_json)
+
+        await db.commit()
+
+        # Count the view; it reaches the database with the next flush
+        view_counter.increment(record_id)
 
         return JSONResponse({
             "analysis": analysis_json,
             "lyrics": lyrics_text
         })
 
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error in /analyze_lyrics: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -383,6 +464,7 @@ def analyze_lyrics_with_function_call(song_title: str, artist: str, lyrics: str)
             max_tokens=800,  # Reduced token count
             temperature=0.7  # Added temperature for faster response
         )
+        record_llm_usage(response)
 
         analysis = response['choices'][0]['message']['content'].strip()
         return json.loads(analysis)
@@ -398,8 +480,17 @@ class ReAnalyzeRequest(BaseModel):
     artist: str
     track: str
 
-@app.post("/re_analyze")
-def re_analyze_endpoint(data: ReAnalyzeRequest):
+# Prompt instructions around the analysis and feedback in a re-analysis
+REANALYSIS_PROMPT_TOKENS = 350
+
+
+def estimate_reanalysis_tokens(data: ReAnalyzeRequest) -> int:
+    """Rough token count for one re-analysis: the analysis goes in and comes back out."""
+    analysis_tokens = len(json.dumps(data.oldAnalysis)) // 4
+    return REANALYSIS_PROMPT_TOKENS + len(data.newComment) // 4 + 2 * analysis_tokens
+
+
+def re_analyze(data: ReAnalyzeRequest) -> dict:
     """
     Accepts an existing analysis and a new viewer comment, and returns an updated analysis.
     The endpoint instructs the AI to update the analysis by integrating the new viewer comment into the narrative.
@@ -452,6 +543,7 @@ def re_analyze_endpoint(data: ReAnalyzeRequest):
             model="gpt-4",  # Or another model like "gpt-3.5-turbo" if preferred
             messages=messages
         )
+        record_llm_usage(response)
 
         # Extract the result from the response
         result = response['choices'][0]['message']['content']
@@ -481,104 +573,151 @@ def re_analyze_endpoint(data: ReAnalyzeRequest):
     return updated_analysis
 
 
-@app.get("/")
-def home():
-    return {"message": "API is running!"}
-
-
-@app.get("/api/mostViewed", response_model=schemas.PaginatedResponse)
-def get_most_viewed(
-        page: int = Query(1, ge=1),
-        size: int = Query(10, ge=1, le=100),
-        db: Session = Depends(get_db)
+@app.post("/re_analyze")
+def re_analyze_endpoint(
+        data: ReAnalyzeRequest,
+        request: Request,
+        current_user: Optional[models.User] = Depends(get_optional_user)
 ):
     """
-    Get the most viewed songs based on view count.
-    Includes pagination support.
+    Return the analysis updated with a new viewer comment (see re_analyze).
+    Draws on the caller's LLM token budget.
     """
-    # Calculate total count
-    total = db.query(models.Song).count()
-
-    # Get paginated results
-    songs = (
-        db.query(models.Song)
-        .order_by(models.Song.view_count.desc())
-        .offset((page - 1) * size)
-        .limit(size)
-        .all()
+    with llm_budget.reserve(
+            estimate_reanalysis_tokens(data),
+            current_user.id if current_user else None,
+            client_ip(request.scope)
+    ):
+        return re_analyze(data)
+
+
+def reanalyze_with_comments(old_analysis: dict, comments: List[str], artist: str, track: str) -> dict:
+    """Fold a batch of highly upvoted comments into an analysis with one LLM call."""
+    re_analyze_data = ReAnalyzeRequest(
+        oldAnalysis=old_analysis,
+        newComment="\n".join(f"- {comment}" for comment in comments),
+        artist=artist,
+        track=track
     )
+    return re_analyze(re_analyze_data)
+
+
+reanalysis_scheduler = ReanalysisScheduler(reanalyze=reanalyze_with_comments)
+llm_budget = LLMBudget()
+
 
+def precompute_song_analysis(song_id: int, title: str, artist: str):
+    """Generate an analysis for the precompute job; returns it with its estimated token cost."""
+    lyrics_data = get_lyrics_by_id(song_id=song_id)
+    if "error" in lyrics_data:
+        raise ValueError(lyrics_data["error"])
+    lyrics_text = lyrics_data.get("plainLyrics", "")
+    analysis = analyze_lyrics_with_function_call(song_title=title, artist=artist, lyrics=lyrics_text)
+    return analysis, estimate_analysis_tokens(lyrics_text)
+
+
+precompute_job = PrecomputeJob(generate=precompute_song_analysis)
+
+
+view_counter = ViewCounterBuffer()
+most_viewed_leaderboard = Leaderboard()
+song_count_estimate = RowCountEstimator(models.ExternalSongReference)
+rollup_retention_job = RollupRetentionJob()
+top_comments_cache = TopCommentsCache()
+vote_recorder = VoteRecorder()
+song_events = SongEventHub()
+song_events.track_analysis_commits()
+view_counter.listeners.append(most_viewed_leaderboard.apply_views)
+
+
+@app.on_event("startup")
+def start_background_jobs():
+    view_counter.start()
+    rate_limiter.start()
+    llm_budget.start()
+    replica_router.start()
+    if ENV != "test":
+        precompute_job.start()
+        most_viewed_leaderboard.start()
+        rollup_retention_job.start()
+        token_deny_list.start()
+
+
+@app.on_event("shutdown")
+def stop_background_jobs():
+    reanalysis_scheduler.shutdown()
+    precompute_job.stop()
+    view_counter.stop()
+    most_viewed_leaderboard.stop()
+    rollup_retention_job.stop()
+    rate_limiter.stop()
+    llm_budget.stop()
+    token_deny_list.stop()
+    replica_router.stop()
+
+
+@app.get("/api/metrics")
+def get_metrics():
+    """
+    Operational metrics for the in-process background workers and the database pool.
+    """
     return {
-        "items": songs,
-        "total": total,
-        "page": page,
-        "size": size,
-        "pages": (total + size - 1) // size
+        "view_counter": view_counter.metrics(),
+        "password_hashing": password_hasher.metrics(),
+        "db_pool": pool_metrics.snapshot(),
+        "async_db_pool": async_pool_metrics.snapshot(),
+        "replicas": replica_router.metrics(),
     }
 
 
-@app.post("/api/songs/{song_id}/view")
-def increment_view_count(
-        song_id: int,
-        db: Session = Depends(get_db),
-        current_user: Optional[str] = Depends(get_current_user)
-):
+@app.get("/")
+def home():
+    return {"message": "API is running!"}
+
+
+def save_comment(
+        db: Session,
+        comment: schemas.CommentCreate,
+        title: Optional[str],
+        artist: Optional[str],
+        user_id: Optional[int] = None
+) -> models.Comment:
     """
-    Increment the view count for a song.
-    Requires authentication.
+    Add a comment and make sure its song reference exists. The caller commits
+    and then invalidates the song in top_comments_cache.
+    The reference is written with INSERT ... ON CONFLICT, so concurrent first
+    comments on a song cannot race into the external_id unique constraint.
     """
-    song = db.query(models.Song).filter(models.Song.id == song_id).first()
-    if not song:
-        raise HTTPException(status_code=404, detail="Song not found")
+    if title and artist:  # Update existing reference if new info is provided
+        upsert_song_reference(db, comment.song_id, title=title, artist=artist)
+    else:
+        ensure_song_reference(db, comment.song_id, title=title, artist=artist)
 
-    song.view_count += 1
-    db.commit()
-    return {"message": "View count updated successfully"}
+    db_comment = models.Comment(
+        content=comment.content,
+        external_song_id=comment.song_id,
+        user_id=user_id
+    )
+    db.add(db_comment)
+    db.flush()  # Assigns the id; the timestamps are client-side defaults, so no refresh is needed
+
+    update_comment_aggregates(db, comment.song_id, 1, 0, db_comment.id)
+    return db_comment
 
 
 @app.post("/api/comments/authenticated", response_model=schemas.CommentResponse)
-def create_authenticated_comment(
+async def create_authenticated_comment(
         comment: schemas.CommentCreate,
         title: Optional[str] = Query(None),
         artist: Optional[str] = Query(None),
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_async_db),
         current_user: models.User = Depends(get_current_user)
 ):
     """
     Create a new comment for a song from Genius API for authenticated users.
     Uses the actual username of the logged-in user.
     """
-    # First, check if the external song reference exists
-    song_reference = db.query(models.ExternalSongReference).filter(
-        models.ExternalSongReference.external_id == comment.song_id
-    ).first()
-
-    # If not, create a new reference with title and artist from query params
-    if not song_reference:
-        # Create a new external song reference
-        song_reference = models.ExternalSongReference(
-            external_id=comment.song_id,
-            title=title or "Unknown",
-            artist=artist or "Unknown"
-        )
-        db.add(song_reference)
-        db.commit()
-        db.refresh(song_reference)
-    elif title and artist:  # Update existing reference if new info is provided
-        song_reference.title = title
-        song_reference.artist = artist
-        db.commit()
-        db.refresh(song_reference)
-
-    # Create comment with user_id
-    db_comment = models.Comment(
-        content=comment.content,
-        external_song_id=comment.song_id,
-        user_id=current_user.id
-    )
-    db.add(db_comment)
-    db.commit()
-    db.refresh(db_comment)
+    db_comment = await db.run_sync(save_comment, comment, title, artist, user_id=current_user.id)
 
     # Create response object with actual username
     response = schemas.CommentResponse(
@@ -589,51 +728,25 @@ def create_authenticated_comment(
         updated_at=db_comment.updated_at,
         username=current_user.username
     )
+    await db.commit()
+    top_comments_cache.invalidate(comment.song_id)
+    song_events.publish(comment.song_id, "comment", response.model_dump(mode="json"))
 
     return response
 
 
 @app.post("/api/comments/anonymous", response_model=schemas.CommentResponse)
-def create_anonymous_comment(
+async def create_anonymous_comment(
         comment: schemas.CommentCreate,
         title: Optional[str] = Query(None),
         artist: Optional[str] = Query(None),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
     """
     Create a new comment for a song from Genius API for anonymous users.
     Uses 'Anonymous' as the username.
     """
-    # First, check if the external song reference exists
-    song_reference = db.query(models.ExternalSongReference).filter(
-        models.ExternalSongReference.external_id == comment.song_id
-    ).first()
-
-    # If not, create a new reference with title and artist from query params
-    if not song_reference:
-        # Create a new external song reference
-        song_reference = models.ExternalSongReference(
-            external_id=comment.song_id,
-            title=title or "Unknown",
-            artist=artist or "Unknown"
-        )
-        db.add(song_reference)
-        db.commit()
-        db.refresh(song_reference)
-    elif title and artist:  # Update existing reference if new info is provided
-        song_reference.title = title
-        song_reference.artist = artist
-        db.commit()
-        db.refresh(song_reference)
-
-    # Create comment without user_id
-    db_comment = models.Comment(
-        content=comment.content,
-        external_song_id=comment.song_id
-    )
-    db.add(db_comment)
-    db.commit()
-    db.refresh(db_comment)
+    db_comment = await db.run_sync(save_comment, comment, title, artist)
 
     # Create response object with 'Anonymous' username
     response = schemas.CommentResponse(
@@ -644,38 +757,197 @@ def create_anonymous_comment(
         updated_at=db_comment.updated_at,
         username="Anonymous"
     )
+    await db.commit()
+    top_comments_cache.invalidate(comment.song_id)
+    song_events.publish(comment.song_id, "comment", response.model_dump(mode="json"))
 
     return response
 
 
+COMMENT_ORDERS = ("newest", "top")
+
+# schemas.CommentResponse fields, selected straight from SQL
+COMMENT_RESPONSE_COLUMNS = (
+    models.Comment.content,
+    models.Comment.external_song_id.label("song_id"),
+    models.Comment.id,
+    models.Comment.created_at,
+    models.Comment.updated_at,
+    func.coalesce(models.User.username, "Anonymous").label("username"),
+    func.coalesce(models.Comment.upvote_count, 0).label("upvote_count"),
+)
+
+
 @app.get("/api/songs/{song_id}/comments", response_model=List[schemas.CommentResponse])
-def get_song_comments(
+async def get_song_comments(
         song_id: int,
-        db: Session = Depends(get_db)
+        request: Request,
+        response: Response,
+        order: str = Query("newest"),
+        limit: int = Query(50, ge=1, le=100),
+        cursor: Optional[str] = Query(None),
+        db: AsyncSession = Depends(get_async_read_db)
 ):
     """
-    Get all comments for a specific song from Genius API.
+    Get a page of comments for a specific song from Genius API.
+    Comments are ordered newest first or by upvotes (`order=top`).
+    When more comments follow, the X-Next-Cursor header holds the `cursor`
+    for the next page.
+    Supports If-None-Match: unchanged comment sections return 304.
     """
+    if order not in COMMENT_ORDERS:
+        raise HTTPException(status_code=400, detail="order must be one of: newest, top")
+
+    # Creates and deletes bump the song row's comment_count and updated_at; upvotes
+    # bump the comment's updated_at, read with one probe of ix_comments_song_updated_at
+    last_comment_update = select(func.max(models.Comment.updated_at)) \
+        .where(models.Comment.external_song_id == song_id) \
+        .scalar_subquery()
+    comment_count, song_updated, comment_updated = (await db.execute(
+        select(models.ExternalSongReference.comment_count, models.ExternalSongReference.updated_at,
+               last_comment_update)
+        .where(models.ExternalSongReference.external_id == song_id)
+    )).one_or_none() or (0, None, None)
+    etag = make_etag("comments", song_id, comment_count, song_updated, comment_updated, order, limit, cursor)
+    not_modified = conditional_response(request, response, etag, COMMENTS_CACHE_CONTROL)
+    if not_modified:
+        return not_modified
+
+    sort_column = models.Comment.created_at if order == "newest" else models.Comment.upvote_count
+
     # Get comments with user information
-    comments = db.query(models.Comment, models.User.username) \
+    query = select(*COMMENT_RESPONSE_COLUMNS) \
         .outerjoin(models.User, models.Comment.user_id == models.User.id) \
-        .filter(models.Comment.external_song_id == song_id) \
-        .all()
+        .where(models.Comment.external_song_id == song_id)
+
+    if cursor is not None:
+        try:
+            after_value, after_id = decode_cursor(cursor, 2, types=(str if order == "newest" else int, int))
+            if order == "newest":
+                after_value = datetime.fromisoformat(after_value)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        # Keyset page: rows after the cursor in (sort column DESC, id DESC) order; the
+        # row-value comparison bounds the scan of the (song, sort column, id) index
+        query = query.where(tuple_(sort_column, models.Comment.id) < tuple_(after_value, after_id))
+
+    comments = (await db.execute(
+        query.order_by(sort_column.desc(), models.Comment.id.desc()).limit(limit)
+    )).all()
+
+    if len(comments) == limit:
+        last = comments[-1]
+        last_value = last.created_at.isoformat() if order == "newest" else last.upvote_count
+        response.headers["X-Next-Cursor"] = encode_cursor(last_value, last.id)
+
+    # Rows already match CommentResponse, so they are encoded without building models
+    return fast_json_response([comment._asdict() for comment in comments], response)
+
+
+@app.get("/api/songs/{song_id}/comments/top", response_model=schemas.TopComments)
+def get_top_comments(
+        song_id: int,
+        db: Session = Depends(get_db)
+):
+    """
+    Get the comment count and most upvoted comments for a song from Genius API.
+    Served from the denormalized song fields through a per-song cache.
+    """
+    return top_comments_cache.get(db, song_id)
+
+
+@app.get("/api/songs/{song_id}/events")
+async def stream_song_events(song_id: int):
+    """
+    Subscribe to live updates for a song as Server-Sent Events.
+    Events: comment, comment_deleted, upvote and analysis (a new version).
+    A `resync` event means the client fell behind and should refetch.
+    """
+    try:
+        subscription = song_events.subscribe(song_id)
+    except TooManySubscribers:
+        raise HTTPException(status_code=503, detail="Too many subscribers, try again later")
+    return StreamingResponse(
+        song_events.stream(subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/api/songs/{song_id}/analysis")
+async def get_song_analysis(
+        song_id: int,
+        request: Request,
+        response: Response,
+        version: Optional[int] = Query(None, ge=1),
+        db: AsyncSession = Depends(get_async_read_db)
+):
+    """
+    Get the stored analysis for a song from Genius API.
+    Returns the latest version unless a specific version is requested.
+    Supports If-None-Match: a client holding the version returns 304.
+    """
+    if version is None:
+        latest_version = await db.run_sync(latest_analysis_version, song_id)
+        if latest_version is not None:
+            not_modified = conditional_response(
+                request, response, make_etag("analysis", song_id, latest_version), LATEST_ANALYSIS_CACHE_CONTROL
+            )
+            if not_modified:
+                return not_modified
+    else:
+        not_modified = conditional_response(
+            request, response, make_etag("analysis", song_id, version), ANALYSIS_VERSION_CACHE_CONTROL
+        )
+        if not_modified:
+            return not_modified
+
+    if version is None:
+        latest_analysis = await db.run_sync(get_latest_analysis, song_id)
+        if not latest_analysis:
+            raise HTTPException(status_code=404, detail="Analysis not found")
+        version = latest_analysis.version
+        analysis = latest_analysis.analysis_data
+    else:
+        analysis = await db.run_sync(load_analysis_version, song_id, version)
+        if analysis is None:
+            raise HTTPException(status_code=404, detail="Analysis not found")
+
+    return {"song_id": song_id, "version": version, "analysis": analysis}
+
+
+MAX_PROJECTED_SONGS = 100
+
 
-    # Format the results
-    result = []
-    for comment, username in comments:
-        result.append(schemas.CommentResponse(
-            id=comment.id,
-            content=comment.content,
-            song_id=comment.external_song_id,
-            created_at=comment.created_at,
-            updated_at=comment.updated_at,
-            username=username if username else "Anonymous",
-            upvote_count=comment.upvote_count
-        ))
+@app.get("/api/analyses/headlines", response_model=List[schemas.AnalysisHeadline])
+def get_analysis_headlines(
+        song_ids: List[int] = Query(...),
+        db: Session = Depends(get_read_db)
+):
+    """
+    Get the latest analysis headline and version for each of the given songs.
+    Songs without an analysis are omitted.
+    """
+    if len(song_ids) > MAX_PROJECTED_SONGS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_PROJECTED_SONGS} song_ids are allowed")
+    return get_projected_analysis_fields(db, song_ids, ["overallHeadline"])
 
-    return result
+
+@app.get("/api/analyses/fields")
+def get_analysis_fields(
+        song_ids: List[int] = Query(...),
+        fields: List[str] = Query(["overallHeadline"]),
+        db: Session = Depends(get_read_db)
+):
+    """
+    Get selected top-level fields of the latest analysis for each of the given songs.
+    """
+    if len(song_ids) > MAX_PROJECTED_SONGS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_PROJECTED_SONGS} song_ids are allowed")
+    unknown_fields = [field for field in fields if field not in PROJECTABLE_ANALYSIS_FIELDS]
+    if unknown_fields:
+        raise HTTPException(status_code=400, detail=f"Unsupported fields: {', '.join(unknown_fields)}")
+    return {"items": get_projected_analysis_fields(db, song_ids, fields)}
 
 
 @app.delete("/api/comments/{comment_id}")
@@ -690,8 +962,14 @@ def delete_comment(
     if not comment:
         raise HTTPException(status_code=404, detail="Comment not found")
 
+    song_id, upvote_count = comment.external_song_id, comment.upvote_count or 0
+    db.query(models.CommentVote).filter(models.CommentVote.comment_id == comment_id).delete(synchronize_session=False)
     db.delete(comment)
+    db.flush()
+    update_comment_aggregates(db, song_id, -1, upvote_count, comment_id)
     db.commit()
+    top_comments_cache.invalidate(song_id)
+    song_events.publish(song_id, "comment_deleted", {"comment_id": comment_id})
     return {"message": "Comment deleted successfully"}
 
 
@@ -700,135 +978,157 @@ def increment_view_count(
         song_id: int,
         title: Optional[str] = None,
         artist: Optional[str] = None,
-        db: Session = Depends(get_db),
         current_user: Optional[models.User] = Depends(get_current_user)
 ):
     """
     Increment the view count for an external song.
     Works for both anonymous and authenticated users.
+    The view is buffered and written to the database by the next flush.
     """
-    # Find or create the external song reference
-    song_reference = db.query(models.ExternalSongReference).filter(
-        models.ExternalSongReference.external_id == song_id
-    ).first()
-
-    if not song_reference:
-        # Create a new external song reference
-        song_reference = models.ExternalSongReference(
-            external_id=song_id,
-            title=title or "Unknown",
-            artist=artist or "Unknown",
-            view_count=0
-        )
-        db.add(song_reference)
-
-    # Increment the view count
-    song_reference.view_count += 1
-
-    # Update title and artist if provided
-    if title:
-        song_reference.title = title
-    if artist:
-        song_reference.artist = artist
-
-    db.commit()
-
+    view_counter.increment(song_id, title=title, artist=artist)
     return {"message": "View count updated successfully"}
 
 
 @app.get("/api/mostViewed", response_model=schemas.PaginatedResponse)
 def get_most_viewed(
+        request: Request,
+        response: Response,
         page: int = Query(1, ge=1),
         size: int = Query(10, ge=1, le=100),
-        db: Session = Depends(get_db)
+        cursor: Optional[str] = Query(None),
+        db: Session = Depends(get_read_db)
 ):
     """
     Get the most viewed songs based on view count from external song references.
     Includes pagination support.
+    Pass the returned next_cursor as `cursor` to page with a keyset query instead
+    of an OFFSET scan. Totals are estimates.
+    Pages inside the in-memory leaderboard are served without a database query.
+    Supports If-None-Match: unchanged pages return 304.
     """
-    # Calculate total count
-    total = db.query(models.ExternalSongReference).count()
+    if most_viewed_leaderboard.loaded:
+        marker = ("leaderboard", most_viewed_leaderboard.version)
+    else:
+        # Without the leaderboard there is no cheap version to read; pages may
+        # already be max-age stale, so the ETag only changes once per max-age window
+        marker = ("window", int(time.time()) // MOST_VIEWED_MAX_AGE)
+    etag = make_etag("mostViewed", marker, page, size, cursor)
+    not_modified = conditional_response(request, response, etag, MOST_VIEWED_CACHE_CONTROL)
+    if not_modified:
+        return not_modified
+
+    if cursor is not None:
+        try:
+            after_view_count, after_id = decode_cursor(cursor, 2, types=(int, int))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+        cached_page = most_viewed_leaderboard.page_after(after_view_count, after_id, size)
+        if cached_page is not None:
+            return fast_json_response(cached_page, response)
+
+        # Keyset page: rows after the cursor in (view_count DESC, id) order. The
+        # mixed directions rule out a row-value comparison, so the plain
+        # view_count bound is what lets the index scan start at the cursor.
+        song_references = (
+            db.query(models.ExternalSongReference)
+            .filter(models.ExternalSongReference.view_count <= after_view_count)
+            .filter(or_(
+                models.ExternalSongReference.view_count < after_view_count,
+                and_(
+                    models.ExternalSongReference.view_count == after_view_count,
+                    models.ExternalSongReference.id > after_id
+                )
+            ))
+            .order_by(*most_viewed_order())
+            .limit(size)
+            .all()
+        )
+    else:
+        cached_page = most_viewed_leaderboard.page(page, size)
+        if cached_page is not None:
+            return fast_json_response(cached_page, response)
+
+        # Get paginated results
+        song_references = (
+            db.query(models.ExternalSongReference)
+            .order_by(*most_viewed_order())
+            .offset((page - 1) * size)
+            .limit(size)
+            .all()
+        )
 
-    # Get paginated results
-    song_references = (
-        db.query(models.ExternalSongReference)
-        .order_by(models.ExternalSongReference.view_count.desc())
-        .offset((page - 1) * size)
-        .limit(size)
-        .all()
-    )
+    # Estimated total count
+    total = song_count_estimate(db)
 
-    # Convert to Song objects for the response
-    songs = []
-    for ref in song_references:
-        songs.append(schemas.Song(
-            id=ref.external_id,
-            title=ref.title,
-            artist=ref.artist,
-            lyrics="",  # We don't store lyrics locally
-            view_count=ref.view_count,
-            created_at=ref.created_at,
-            updated_at=ref.updated_at
-        ))
+    # schemas.Song fields for the response
+    songs = [song_item(ref) for ref in song_references]
 
-    return {
+    next_cursor = None
+    if len(song_references) == size:
+        last = song_references[-1]
+        next_cursor = encode_cursor(last.view_count or 0, last.id)
+
+    return fast_json_response({
         "items": songs,
         "total": total,
         "page": page,
         "size": size,
-        "pages": (total + size - 1) // size
-    }
+        "pages": (total + size - 1) // size,
+        "next_cursor": next_cursor
+    }, response)
+
+
+@app.get("/api/trending", response_model=List[schemas.TrendingSong])
+def get_trending(
+        window: str = Query("24h"),
+        limit: int = Query(10, ge=1, le=100),
+        db: Session = Depends(get_read_db)
+):
+    """
+    Get the songs trending over a rolling window (24h, 7d or 30d).
+    Recent views count more than older ones; only the view rollups are read.
+    """
+    if window not in TRENDING_WINDOWS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"window must be one of: {', '.join(TRENDING_WINDOWS)}"
+        )
+    return trending_songs(db, window=window, limit=limit)
 
 
 @app.post("/api/comments/{comment_id}/upvote")
-def upvote_comment(
+async def upvote_comment(
     comment_id: int,
-    db: Session = Depends(get_db)
+    request: Request,
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Upvote a comment. Each IP address can only upvote a comment once.
     """
-    comment = db.query(models.Comment).filter(models.Comment.id == comment_id).first()
-    if not comment:
+    voter = voter_key(client_ip(request.scope))
+    try:
+        recorded = await db.run_sync(vote_recorder.record, comment_id, voter)
+    except DuplicateVoteError:
+        await db.rollback()  # Undo the increment made before the vote conflicted
+        raise HTTPException(status_code=400, detail="You have already upvoted this comment")
+    if recorded is None:
+        await db.rollback()
         raise HTTPException(status_code=404, detail="Comment not found")
 
-    # Increment upvote count
-    comment.upvote_count += 1
-    db.commit()
-
-    # If upvote count reaches threshold (e.g., 10), trigger re-analysis
-    if comment.upvote_count >= 10:
-        # Get the latest analysis for this song
-        latest_analysis = db.query(models.Analysis).filter(
-            models.Analysis.external_song_id == comment.external_song_id
-        ).order_by(models.Analysis.version.desc()).first()
+    upvote_count, song_id = recorded
+    await db.run_sync(update_comment_aggregates, song_id, 0, upvote_count, comment_id)
+    await db.commit()
+    vote_recorder.committed(comment_id, voter)
+    top_comments_cache.invalidate(song_id)
+    song_events.publish(song_id, "upvote", {"comment_id": comment_id, "upvote_count": upvote_count})
 
-        if latest_analysis:
-            # Create re-analysis request
-            re_analyze_data = ReAnalyzeRequest(
-                oldAnalysis=json.loads(latest_analysis.analysis_data),
-                newComment=comment.content,
-                artist=comment.song_reference.artist,
-                track=comment.song_reference.title
-            )
-
-            # Call re-analyze endpoint
-            try:
-                updated_analysis = re_analyze_endpoint(re_analyze_data)
-                
-                # Save new analysis
-                new_analysis = models.Analysis(
-                    external_song_id=comment.external_song_id,
-                    analysis_data=json.dumps(updated_analysis),
-                    version=latest_analysis.version + 1
-                )
-                db.add(new_analysis)
-                db.commit()
-            except Exception as e:
-                logging.error(f"Error during re-analysis: {e}")
-                # Continue even if re-analysis fails
+    # Only the upvote that crosses the threshold queues the comment; the
+    # re-analysis itself runs in the background so the response stays fast
+    if crossed_threshold(upvote_count - 1, upvote_count):
+        reanalysis_scheduler.schedule(song_id, comment_id)
 
-    return {"message": "Comment upvoted successfully", "upvote_count": comment.upvote_count}
+    return {"message": "Comment upvoted successfully", "upvote_count": upvote_count}
 
 
 if __name__ == "__main__":
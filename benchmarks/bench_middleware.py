@@ -0,0 +1,102 @@
+"""
+Per-request overhead of the middleware stack: the previous BaseHTTPMiddleware
+rate limiter against the pure ASGI rate limiting and timing middleware, each
+wrapped around the same trivial endpoint and driven directly over ASGI.
+
+Usage: python benchmarks/bench_middleware.py [requests]
+"""
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+os.environ.setdefault("ENV", "test")
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+from starlette.applications import Starlette
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from database.middleware import RequestTimingMiddleware
+from database.rate_limit import SlidingWindowLimiter
+from database.security import RateLimitMiddleware
+
+LIMIT = 10 ** 9  # Never reject; only the bookkeeping is measured
+
+
+class LegacyRateLimitMiddleware(BaseHTTPMiddleware):
+    """The BaseHTTPMiddleware rate limiter the app used before."""
+
+    def __init__(self, app, limiter):
+        super().__init__(app)
+        self.limiter = limiter
+
+    async def dispatch(self, request, call_next):
+        allowed, _ = self.limiter.hit(request.client.host)
+        if not allowed:
+            return JSONResponse({"detail": "Too many requests"}, status_code=429)
+        return await call_next(request)
+
+
+async def endpoint(request):
+    return JSONResponse({"ok": True})
+
+
+def build(middleware):
+    app = Starlette(routes=[Route("/", endpoint)])
+    for middleware_class, options in middleware:
+        app.add_middleware(middleware_class, **options)
+    return app
+
+
+async def drive(app, requests):
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": "/", "raw_path": b"/", "root_path": "", "query_string": b"",
+        "headers": [(b"host", b"bench")], "client": ("10.0.0.1", 1234), "server": ("bench", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    for _ in range(200):  # Warm up
+        await app(dict(scope), receive, send)
+    start = time.perf_counter()
+    for _ in range(requests):
+        await app(dict(scope), receive, send)
+    return (time.perf_counter() - start) / requests
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    stacks = {
+        "no middleware": [],
+        "BaseHTTPMiddleware rate limit": [
+            (LegacyRateLimitMiddleware, {"limiter": SlidingWindowLimiter(LIMIT, 60)}),
+        ],
+        "ASGI rate limit": [
+            (RateLimitMiddleware, {"limiter": SlidingWindowLimiter(LIMIT, 60), "enabled": True}),
+        ],
+        "ASGI rate limit + timing": [
+            (RateLimitMiddleware, {"limiter": SlidingWindowLimiter(LIMIT, 60), "enabled": True}),
+            (RequestTimingMiddleware, {}),
+        ],
+    }
+
+    print(f"{requests:,} requests per stack")
+    baseline = None
+    for label, middleware in stacks.items():
+        per_request = asyncio.run(drive(build(middleware), requests))
+        baseline = per_request if baseline is None else baseline
+        overhead = per_request - baseline
+        print(f"{label:<32} {per_request * 1e6:8.1f} us/request  (+{overhead * 1e6:6.1f} us)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Throughput and memory of the rate limiter with 100k distinct client IPs,
+comparing the previous per-IP timestamp lists behind one global lock with the
+sharded sliding-window counter.
+
+Usage: python benchmarks/bench_rate_limit.py [ips] [requests_per_ip] [threads]
+"""
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+os.environ.setdefault("ENV", "test")
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+from database.rate_limit import SlidingWindowLimiter
+
+LIMIT = 100
+WINDOW = 60
+
+
+class TimestampListLimiter:
+    """The limiter check_rate_limit used before: a timestamp list per IP, rebuilt on every request."""
+
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+        self.request_counts = defaultdict(list)
+        self.lock = threading.Lock()
+
+    def hit(self, key, now=None):
+        current_time = time.time()
+        with self.lock:
+            self.request_counts[key] = [
+                req_time for req_time in self.request_counts[key]
+                if current_time - req_time < self.window
+            ]
+            if len(self.request_counts[key]) >= self.limit:
+                return False, 0.0
+            self.request_counts[key].append(current_time)
+            return True, 0.0
+
+
+def traffic(ips, requests_per_ip):
+    addresses = [f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in range(ips)]
+    keys = addresses * requests_per_ip
+    random.Random(42).shuffle(keys)
+    return keys
+
+
+def run(limiter, keys, threads):
+    chunks = [keys[i::threads] for i in range(threads)]
+
+    def worker(chunk):
+        hit = limiter.hit
+        for key in chunk:
+            hit(key)
+
+    workers = [threading.Thread(target=worker, args=(chunk,)) for chunk in chunks]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def state_memory(limiter, keys):
+    tracemalloc.start()
+    for key in keys:
+        limiter.hit(key)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return memory
+
+
+def main():
+    ips = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    requests_per_ip = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    threads = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+    keys = traffic(ips, requests_per_ip)
+    print(f"{ips:,} IPs x {requests_per_ip} requests, {threads} threads, limit {LIMIT}/{WINDOW}s")
+
+    for label, limiter_class in (
+        ("timestamp lists + global lock", TimestampListLimiter),
+        ("sliding window counter", SlidingWindowLimiter),
+    ):
+        elapsed = run(limiter_class(LIMIT, WINDOW), keys, threads)
+        memory = state_memory(limiter_class(LIMIT, WINDOW), keys)
+        print(f"{label:<30} {len(keys) / elapsed:>12,.0f} checks/s  {memory / 2 ** 20:8.1f} MiB")
+
+    # Idle keys are swept once they have been quiet for two windows
+    limiter = SlidingWindowLimiter(LIMIT, WINDOW, evict_interval=WINDOW)
+    for key in keys[:ips]:
+        limiter.hit(key, now=0.0)
+    for shard in range(1024):
+        limiter.hit(f"late-{shard}", now=3 * WINDOW)
+    print(f"after eviction: {len(limiter):,} keys tracked (was {ips:,})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Count database round trips per request for comment creation and view counting,
+comparing the previous find-or-create flow with the upsert-based one.
+
+Usage: python benchmarks/bench_round_trips.py
+"""
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+os.environ.setdefault("ENV", "test")
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from database import models, schemas
+from database.config import Base
+from database.view_counter import ViewCounterBuffer
+from app import save_comment
+
+
+class RoundTripCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+        event.listen(engine, "commit", self._on_commit)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+    def _on_commit(self, *args):
+        self.count += 1
+
+
+def legacy_create_comment(db, comment, title, artist):
+    """The find-or-create flow the comment endpoints used before the upsert layer."""
+    song_reference = db.query(models.ExternalSongReference).filter(
+        models.ExternalSongReference.external_id == comment.song_id
+    ).first()
+    if not song_reference:
+        song_reference = models.ExternalSongReference(
+            external_id=comment.song_id, title=title or "Unknown", artist=artist or "Unknown"
+        )
+        db.add(song_reference)
+        db.commit()
+        db.refresh(song_reference)
+    elif title and artist:
+        song_reference.title = title
+        song_reference.artist = artist
+        db.commit()
+        db.refresh(song_reference)
+
+    db_comment = models.Comment(content=comment.content, external_song_id=comment.song_id)
+    db.add(db_comment)
+    db.commit()
+    db.refresh(db_comment)
+    return db_comment.id, db_comment.created_at
+
+
+def upsert_create_comment(db, comment, title, artist):
+    db_comment = save_comment(db, comment, title, artist)
+    result = db_comment.id, db_comment.created_at
+    db.commit()
+    return result
+
+
+def legacy_view(db, song_id, title, artist):
+    """The per-view SELECT, increment and commit the view endpoint used to do."""
+    song_reference = db.query(models.ExternalSongReference).filter(
+        models.ExternalSongReference.external_id == song_id
+    ).first()
+    if not song_reference:
+        song_reference = models.ExternalSongReference(
+            external_id=song_id, title=title or "Unknown", artist=artist or "Unknown", view_count=0
+        )
+        db.add(song_reference)
+    song_reference.view_count += 1
+    if title:
+        song_reference.title = title
+    if artist:
+        song_reference.artist = artist
+    db.commit()
+
+
+def measure(flow, requests):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    counter = RoundTripCounter(engine)
+    flow(session_factory, requests)
+    engine.dispose()
+    return counter.count / len(requests)
+
+
+def run_comment_flow(create):
+    def flow(session_factory, requests):
+        for song_id, title, artist in requests:
+            db = session_factory()
+            create(db, schemas.CommentCreate(content="Great song", song_id=song_id), title, artist)
+            db.close()
+    return flow
+
+
+def legacy_view_flow(session_factory, requests):
+    for song_id, title, artist in requests:
+        db = session_factory()
+        legacy_view(db, song_id, title, artist)
+        db.close()
+
+
+def buffered_view_flow(session_factory, requests):
+    buffer = ViewCounterBuffer(session_factory, flush_interval=3600)
+    for index, (song_id, title, artist) in enumerate(requests, start=1):
+        buffer.increment(song_id, title=title, artist=artist)
+        if index % 100 == 0:
+            buffer.flush()
+    buffer.flush()
+
+
+def main():
+    # Half first-time songs, half repeat songs with updated details
+    requests = [(song_id % 50, f"Title {song_id}", "Artist") for song_id in range(1000)]
+
+    print(f"{'flow':<28}{'before':>10}{'after':>10}  (round trips per request)")
+    rows = [
+        ("comment creation", run_comment_flow(legacy_create_comment), run_comment_flow(upsert_create_comment)),
+        ("view counting", legacy_view_flow, buffered_view_flow),
+    ]
+    for name, before, after in rows:
+        print(f"{name:<28}{measure(before, requests):>10.2f}{measure(after, requests):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
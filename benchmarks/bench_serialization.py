@@ -0,0 +1,103 @@
+"""
+Rows per second for a 10k-comment response: ORM entities turned into
+CommentResponse models, validated again by the response_model and encoded with
+the stdlib json (the previous path), against column rows encoded directly by
+the fast JSON path.
+
+Usage: python benchmarks/bench_serialization.py [rows]
+"""
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+os.environ.setdefault("ENV", "test")
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from database import models, schemas
+from database.config import Base
+from database.fast_json import dumps, orjson
+from app import COMMENT_RESPONSE_COLUMNS
+
+REPEATS = 5
+
+
+def seed(db, rows):
+    db.add(models.ExternalSongReference(external_id=1, title="Song", artist="Artist"))
+    db.add(models.User(username="listener", email="listener@example.com", hashed_password="x"))
+    db.flush()
+    db.execute(models.Comment.__table__.insert(), [
+        {"external_song_id": 1, "user_id": 1 if i % 2 else None, "content": f"Comment number {i} " * 4, "upvote_count": i % 50}
+        for i in range(rows)
+    ])
+    db.commit()
+
+
+def previous_path(db):
+    comments = db.query(models.Comment, models.User.username) \
+        .outerjoin(models.User, models.Comment.user_id == models.User.id) \
+        .filter(models.Comment.external_song_id == 1) \
+        .all()
+    result = [
+        schemas.CommentResponse(
+            id=comment.id,
+            content=comment.content,
+            song_id=comment.external_song_id,
+            created_at=comment.created_at,
+            updated_at=comment.updated_at,
+            username=username if username else "Anonymous",
+            upvote_count=comment.upvote_count
+        )
+        for comment, username in comments
+    ]
+    # What FastAPI does with the returned models: validate against response_model, then json.dumps
+    adapter = TypeAdapter(List[schemas.CommentResponse])
+    content = adapter.dump_python(adapter.validate_python(result, from_attributes=True), mode="json")
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def fast_path(db):
+    rows = db.query(*COMMENT_RESPONSE_COLUMNS) \
+        .outerjoin(models.User, models.Comment.user_id == models.User.id) \
+        .filter(models.Comment.external_song_id == 1) \
+        .all()
+    return dumps([row._asdict() for row in rows])
+
+
+def measure(label, path, session_factory, rows):
+    best = float("inf")
+    for _ in range(REPEATS):
+        db = session_factory()
+        start = time.perf_counter()
+        body = path(db)
+        best = min(best, time.perf_counter() - start)
+        db.close()
+    print(f"{label:<32} {best * 1000:8.1f} ms  {rows / best:>10,.0f} rows/s  {len(body) / 1024:,.0f} KiB")
+    return body
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(bind=engine)
+    db = session_factory()
+    seed(db, rows)
+    db.close()
+
+    print(f"{rows:,} comments, best of {REPEATS}, encoder: {'orjson' if orjson else 'json'}")
+    previous = measure("models + response_model + json", previous_path, session_factory, rows)
+    fast = measure("SQL rows + fast JSON", fast_path, session_factory, rows)
+    assert json.loads(previous) == json.loads(fast)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+from logging.config import fileConfig
+
+from alembic import context
+
+from database.config import Base, engine
+from database import models  # noqa: F401 - registers the tables on Base.metadata
+
+config = context.config
+if config.config_file_name is not None:  # Run from the alembic CLI
+    fileConfig(config.config_file_name)
+target_metadata = Base.metadata
+
+
+def run_migrations_offline():
+    """Emit the migration SQL for config's sqlalchemy.url without connecting (alembic upgrade --sql)."""
+    url = config.get_main_option("sqlalchemy.url") or str(engine.url)
+    context.configure(
+        url=url,
+        target_metadata=target_metadata,
+        literal_binds=True,
+        render_as_batch=url.startswith("sqlite"),
+        transaction_per_migration=True,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    """Migrate through the connection run_migrations passes in, or the shared engine."""
+    connection = config.attributes.get("connection")
+    if connection is None:
+        with engine.connect() as connection:
+            _run_with(connection)
+    else:
+        _run_with(connection)
+
+
+def _run_with(connection):
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        # SQLite cannot ALTER most things in place; batch mode copies the table instead
+        render_as_batch=connection.dialect.name == "sqlite",
+        # One transaction per revision, so online index builds can step outside it
+        transaction_per_migration=True,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
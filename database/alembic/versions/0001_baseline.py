@@ -0,0 +1,210 @@
+"""Baseline: the schema run_migrations built before versioned migrations
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+
+Frozen copy of that schema. Each table and index is created only when it is
+missing, so databases built by the old create_all migrations are brought up
+to date and stamped, and empty databases are built from scratch. Indexes
+missing from existing tables are built online (see create_index_online). Later
+changes belong in later revisions, never here.
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from database.migrations import create_index_online
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# JSONB on PostgreSQL, JSON (stored as text) elsewhere
+JSONDocument = sa.JSON(none_as_null=True).with_variant(postgresql.JSONB(none_as_null=True), "postgresql")
+
+
+def _id_column():
+    return sa.Column("id", sa.Integer(), primary_key=True)
+
+
+# (table, columns and constraints, [(index name, columns, unique)])
+TABLES = [
+    ("users", lambda: [
+        _id_column(),
+        sa.Column("username", sa.String()),
+        sa.Column("email", sa.String()),
+        sa.Column("hashed_password", sa.String()),
+        sa.Column("is_active", sa.Boolean()),
+        sa.Column("created_at", sa.DateTime()),
+    ], [
+        ("ix_users_id", ["id"], False),
+        ("ix_users_username", ["username"], True),
+        ("ix_users_email", ["email"], True),
+    ]),
+    ("external_song_references", lambda: [
+        _id_column(),
+        sa.Column("external_id", sa.Integer()),
+        sa.Column("title", sa.String()),
+        sa.Column("artist", sa.String()),
+        sa.Column("view_count", sa.Integer()),
+        sa.Column("comment_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("top_comment_ids", JSONDocument),
+        sa.Column("created_at", sa.DateTime()),
+        sa.Column("updated_at", sa.DateTime()),
+    ], [
+        ("ix_external_song_references_id", ["id"], False),
+        ("ix_external_song_references_external_id", ["external_id"], True),
+        ("ix_external_song_references_view_count_id", [sa.text("view_count DESC"), "id"], False),
+    ]),
+    ("analyses", lambda: [
+        _id_column(),
+        sa.Column("external_song_id", sa.Integer(), sa.ForeignKey("external_song_references.external_id")),
+        sa.Column("analysis_data", JSONDocument),
+        sa.Column("patch", JSONDocument),
+        sa.Column("version", sa.Integer()),
+        sa.Column("created_at", sa.DateTime()),
+        sa.Column("updated_at", sa.DateTime()),
+    ], [
+        ("ix_analyses_id", ["id"], False),
+    ]),
+    ("comments", lambda: [
+        _id_column(),
+        sa.Column("external_song_id", sa.Integer(), sa.ForeignKey("external_song_references.external_id")),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=True),
+        sa.Column("content", sa.Text()),
+        sa.Column("upvote_count", sa.Integer()),
+        sa.Column("created_at", sa.DateTime()),
+        sa.Column("updated_at", sa.DateTime()),
+    ], [
+        ("ix_comments_id", ["id"], False),
+        ("ix_comments_song_created_at", ["external_song_id", "created_at", "id"], False),
+        ("ix_comments_song_upvote_count", ["external_song_id", "upvote_count", "id"], False),
+    ]),
+    ("comment_votes", lambda: [
+        _id_column(),
+        sa.Column("comment_id", sa.Integer(), sa.ForeignKey("comments.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("voter_key", sa.String(), nullable=False),
+        sa.Column("created_at", sa.DateTime()),
+        sa.UniqueConstraint("comment_id", "voter_key", name="uq_comment_votes_comment_voter"),
+    ], [
+        ("ix_comment_votes_id", ["id"], False),
+    ]),
+    ("revoked_tokens", lambda: [
+        sa.Column("jti", sa.String(), primary_key=True),
+        sa.Column("expires_at", sa.DateTime(), nullable=False),
+    ], [
+        ("ix_revoked_tokens_expires_at", ["expires_at"], False),
+    ]),
+    ("rate_limit_counters", lambda: [
+        _id_column(),
+        sa.Column("key", sa.String(), nullable=False),
+        sa.Column("window_index", sa.BigInteger(), nullable=False),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.UniqueConstraint("key", "window_index", name="uq_rate_limit_counters_key_window"),
+    ], []),
+    ("precompute_runs", lambda: [
+        _id_column(),
+        sa.Column("started_at", sa.DateTime()),
+        sa.Column("finished_at", sa.DateTime(), nullable=True),
+        sa.Column("candidates", sa.Integer()),
+        sa.Column("generated", sa.Integer()),
+        sa.Column("failed", sa.Integer()),
+        sa.Column("tokens_used", sa.Integer()),
+        sa.Column("view_snapshot", JSONDocument),
+        sa.Column("precomputed_views", JSONDocument),
+        sa.Column("total_views_at_start", sa.Integer()),
+        sa.Column("coverage", sa.Float(), nullable=True),
+        sa.Column("coverage_measured_at", sa.DateTime(), nullable=True),
+    ], [
+        ("ix_precompute_runs_id", ["id"], False),
+        ("ix_precompute_runs_started_at", ["started_at"], False),
+    ]),
+    ("song_views_hourly", lambda: [
+        _id_column(),
+        sa.Column("external_song_id", sa.Integer(), nullable=False),
+        sa.Column("bucket_start", sa.DateTime(), nullable=False),
+        sa.Column("views", sa.Integer(), nullable=False),
+        sa.UniqueConstraint("external_song_id", "bucket_start", name="uq_song_views_hourly_song_bucket"),
+    ], [
+        ("ix_song_views_hourly_id", ["id"], False),
+        ("ix_song_views_hourly_bucket_start", ["bucket_start"], False),
+    ]),
+    ("song_views_daily", lambda: [
+        _id_column(),
+        sa.Column("external_song_id", sa.Integer(), nullable=False),
+        sa.Column("bucket_start", sa.DateTime(), nullable=False),
+        sa.Column("views", sa.Integer(), nullable=False),
+        sa.UniqueConstraint("external_song_id", "bucket_start", name="uq_song_views_daily_song_bucket"),
+    ], [
+        ("ix_song_views_daily_id", ["id"], False),
+        ("ix_song_views_daily_bucket_start", ["bucket_start"], False),
+    ]),
+]
+
+
+def upgrade():
+    if op.get_context().as_sql:  # Offline SQL is written for an empty database
+        existing = set()
+    else:
+        conn = op.get_bind()
+        existing = set(sa.inspect(conn).get_table_names())
+    legacy_tables = existing & {name for name, _, _ in TABLES}
+
+    for name, columns, indexes in TABLES:
+        if name in existing:
+            continue
+        op.create_table(name, *columns())
+        for index_name, index_columns, unique in indexes:
+            op.create_index(index_name, name, index_columns, unique=unique)
+
+    if "analyses" in legacy_tables:
+        _upgrade_legacy_analyses(conn)
+    if "external_song_references" in legacy_tables:
+        _upgrade_legacy_song_references(conn)
+
+    # Live tables keep taking writes while their missing indexes are built
+    for name, _, indexes in TABLES:
+        if name in legacy_tables:
+            for index_name, index_columns, unique in indexes:
+                create_index_online(index_name, name, index_columns, unique=unique)
+
+
+def _upgrade_legacy_analyses(conn):
+    """analysis_data was TEXT and patch did not exist before JSON storage."""
+    if conn.dialect.name == "postgresql":
+        data_type = conn.execute(sa.text("""
+            SELECT data_type
+            FROM information_schema.columns
+            WHERE table_name = 'analyses' AND column_name = 'analysis_data'
+        """)).scalar()
+        if data_type == "text":
+            op.execute("ALTER TABLE analyses ALTER COLUMN analysis_data TYPE JSONB USING analysis_data::jsonb")
+    # SQLite stores JSON as text, so existing rows are already readable
+    if "patch" not in {column["name"] for column in sa.inspect(conn).get_columns("analyses")}:
+        op.add_column("analyses", sa.Column("patch", JSONDocument))
+
+
+def _upgrade_legacy_song_references(conn):
+    """Add and backfill the denormalized comment columns; top_comment_ids is computed on first read."""
+    columns = {column["name"] for column in sa.inspect(conn).get_columns("external_song_references")}
+    if "top_comment_ids" not in columns:
+        op.add_column("external_song_references", sa.Column("top_comment_ids", JSONDocument))
+    if "comment_count" not in columns:
+        op.add_column(
+            "external_song_references",
+            sa.Column("comment_count", sa.Integer(), nullable=False, server_default="0")
+        )
+        op.execute("""
+            UPDATE external_song_references SET comment_count = (
+                SELECT COUNT(*) FROM comments
+                WHERE comments.external_song_id = external_song_references.external_id
+            )
+        """)
+
+
+def downgrade():
+    """Drop every baseline table, and with them all data; only meant for scratch databases."""
+    for name, _, _ in reversed(TABLES):
+        op.drop_table(name)
@@ -0,0 +1,25 @@
+"""Index analyses by song and version
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19
+
+Latest-version and version-history reads filter analyses by
+external_song_id and order by version; without this index they scan the
+table. comments.external_song_id is already the leading column of
+ix_comments_song_created_at and ix_comments_song_upvote_count.
+"""
+from database.migrations import create_index_online, drop_index_online
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    create_index_online("ix_analyses_song_version", "analyses", ["external_song_id", "version"])
+
+
+def downgrade():
+    drop_index_online("ix_analyses_song_version", "analyses")
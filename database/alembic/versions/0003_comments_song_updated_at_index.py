@@ -0,0 +1,24 @@
+"""Index comments by song and updated_at
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19
+
+The comments ETag reads MAX(updated_at) of a song's comments, which picks
+up upvotes that leave the song row untouched. With this index that is a
+single index probe instead of a scan of the song's comments.
+"""
+from database.migrations import create_index_online, drop_index_online
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    create_index_online("ix_comments_song_updated_at", "comments", ["external_song_id", "updated_at"])
+
+
+def downgrade():
+    drop_index_online("ix_comments_song_updated_at", "comments")
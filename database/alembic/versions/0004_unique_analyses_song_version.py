@@ -0,0 +1,39 @@
+"""Make analyses unique per song and version
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19
+
+save_analysis_version picks latest version + 1, so two concurrent saves for
+a song could both write the same version. The unique index makes the loser
+fail and retry. Duplicates already written are resolved first by keeping the
+newest row (highest id) of each song and version. The unique index is built
+before the plain one is dropped, so reads stay indexed throughout.
+"""
+from alembic import op
+
+from database.migrations import create_index_online, drop_index_online
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        DELETE FROM analyses
+        WHERE EXISTS (
+            SELECT 1 FROM analyses AS newer
+            WHERE newer.external_song_id = analyses.external_song_id
+              AND newer.version = analyses.version
+              AND newer.id > analyses.id
+        )
+    """)
+    create_index_online("uq_analyses_song_version", "analyses", ["external_song_id", "version"], unique=True)
+    drop_index_online("ix_analyses_song_version", "analyses")
+
+
+def downgrade():
+    create_index_online("ix_analyses_song_version", "analyses", ["external_song_id", "version"])
+    drop_index_online("uq_analyses_song_version", "analyses")
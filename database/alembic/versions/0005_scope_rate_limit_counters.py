@@ -0,0 +1,45 @@
+"""Scope rate limit counters to their limiter
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19
+
+The request limiter and the hourly LLM token budgets share
+rate_limit_counters but count in windows of different lengths, so the
+request limiter's prune of old window indexes deleted every budget row.
+Rows now carry the limiter's scope, which is part of the unique key and
+of every prune. Counters only matter for two windows, so the table is
+recreated rather than migrated: limits restart from zero once, at deploy.
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.drop_table("rate_limit_counters")
+    op.create_table(
+        "rate_limit_counters",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("scope", sa.String(), nullable=False),
+        sa.Column("key", sa.String(), nullable=False),
+        sa.Column("window_index", sa.BigInteger(), nullable=False),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.UniqueConstraint("scope", "key", "window_index", name="uq_rate_limit_counters_scope_key_window"),
+    )
+
+
+def downgrade():
+    op.drop_table("rate_limit_counters")
+    op.create_table(
+        "rate_limit_counters",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("key", sa.String(), nullable=False),
+        sa.Column("window_index", sa.BigInteger(), nullable=False),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.UniqueConstraint("key", "window_index", name="uq_rate_limit_counters_key_window"),
+    )
@@ -0,0 +1,292 @@
+import copy
+import os
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import and_, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import models
+
+# Every Nth version keeps a full copy; the versions in between store a JSON
+# patch against their predecessor. The latest version is always stored in full.
+ANALYSIS_SNAPSHOT_INTERVAL = int(os.getenv("ANALYSIS_SNAPSHOT_INTERVAL", "10"))
+
+# Top-level analysis fields that can be read without loading the whole document
+PROJECTABLE_ANALYSIS_FIELDS = ("overallHeadline", "songTitle", "artist", "introduction", "conclusion")
+
+# Times a save that lost a version race re-reads the latest version and tries again
+ANALYSIS_SAVE_RETRIES = int(os.getenv("ANALYSIS_SAVE_RETRIES", "3"))
+
+
+def is_snapshot_version(version: int, interval: int = ANALYSIS_SNAPSHOT_INTERVAL) -> bool:
+    return (version - 1) % interval == 0
+
+
+def _escape(token: str) -> str:
+    return str(token).replace("~", "~0").replace("/", "~1")
+
+
+def _unescape(token: str) -> str:
+    return token.replace("~1", "/").replace("~0", "~")
+
+
+def make_patch(old: Any, new: Any, path: str = "") -> List[Dict[str, Any]]:
+    """Build an RFC 6902 patch (add/remove/replace ops) that turns old into new."""
+    if isinstance(old, dict) and isinstance(new, dict):
+        ops = []
+        for key in old:
+            if key not in new:
+                ops.append({"op": "remove", "path": f"{path}/{_escape(key)}"})
+        for key, value in new.items():
+            child = f"{path}/{_escape(key)}"
+            if key not in old:
+                ops.append({"op": "add", "path": child, "value": copy.deepcopy(value)})
+            else:
+                ops.extend(make_patch(old[key], value, child))
+        return ops
+
+    if isinstance(old, list) and isinstance(new, list):
+        ops = []
+        for index in range(min(len(old), len(new))):
+            ops.extend(make_patch(old[index], new[index], f"{path}/{index}"))
+        # Remove from the end so earlier indexes stay valid
+        for index in range(len(old) - 1, len(new) - 1, -1):
+            ops.append({"op": "remove", "path": f"{path}/{index}"})
+        for index in range(len(old), len(new)):
+            ops.append({"op": "add", "path": f"{path}/{index}", "value": copy.deepcopy(new[index])})
+        return ops
+
+    if type(old) is not type(new) or old != new:
+        return [{"op": "replace", "path": path, "value": copy.deepcopy(new)}]
+    return []
+
+
+def apply_patch(document: Any, patch: List[Dict[str, Any]]) -> Any:
+    """Apply a patch produced by make_patch, returning a new document."""
+    document = copy.deepcopy(document)
+    for operation in patch:
+        tokens = [_unescape(token) for token in operation["path"].split("/")[1:]]
+        if not tokens:
+            document = copy.deepcopy(operation["value"])
+            continue
+
+        parent = document
+        for token in tokens[:-1]:
+            parent = parent[int(token)] if isinstance(parent, list) else parent[token]
+        last = tokens[-1]
+
+        if isinstance(parent, list):
+            index = len(parent) if last == "-" else int(last)
+            if operation["op"] == "add":
+                parent.insert(index, copy.deepcopy(operation["value"]))
+            elif operation["op"] == "remove":
+                del parent[index]
+            else:
+                parent[index] = copy.deepcopy(operation["value"])
+        else:
+            if operation["op"] == "remove":
+                del parent[last]
+            else:
+                parent[last] = copy.deepcopy(operation["value"])
+    return document
+
+
+def get_latest_analysis(db: Session, song_id: int) -> Optional[models.Analysis]:
+    return db.query(models.Analysis).filter(
+        models.Analysis.external_song_id == song_id
+    ).order_by(models.Analysis.version.desc()).first()
+
+
+def latest_analysis_version(db: Session, song_id: int) -> Optional[int]:
+    """Latest version number of a song's analysis, without loading the document."""
+    return db.query(func.max(models.Analysis.version)).filter(
+        models.Analysis.external_song_id == song_id
+    ).scalar()
+
+
+def _add_next_version(db: Session, song_id: int, analysis: dict) -> models.Analysis:
+    latest = get_latest_analysis(db, song_id)
+    if latest is None:
+        new_analysis = models.Analysis(
+            external_song_id=song_id,
+            analysis_data=analysis,
+            version=1
+        )
+        db.add(new_analysis)
+        return new_analysis
+
+    previous = latest.analysis_data
+    new_analysis = models.Analysis(
+        external_song_id=song_id,
+        analysis_data=analysis,
+        patch=make_patch(previous, analysis),
+        version=latest.version + 1
+    )
+    # Legacy rows without a patch are left in full; compaction rewrites them
+    if latest.patch is not None and not is_snapshot_version(latest.version):
+        latest.analysis_data = None
+    db.add(new_analysis)
+    return new_analysis
+
+
+def save_analysis_version(db: Session, song_id: int, analysis: dict,
+                          retries: int = ANALYSIS_SAVE_RETRIES) -> models.Analysis:
+    """
+    Add the next version of a song's analysis. The caller commits.
+
+    The new row holds the full document plus a patch from its predecessor; the
+    predecessor drops its full copy unless it is a snapshot version.
+    Concurrent saves race on the unique (song, version) index; the loser's
+    savepoint is rolled back and it retries on top of the winner's version.
+    """
+    for attempt in range(retries + 1):
+        try:
+            with db.begin_nested():
+                return _add_next_version(db, song_id, analysis)
+        except IntegrityError:
+            if attempt == retries:
+                raise
+
+
+def save_first_analysis(db: Session, song_id: int, analysis: dict) -> Optional[models.Analysis]:
+    """
+    Save version 1 of a song's analysis unless it already has one. The caller
+    commits. Returns None when the song was already analyzed, including by a
+    concurrent save that won the unique (song, version) index.
+    """
+    if latest_analysis_version(db, song_id) is not None:
+        return None
+    try:
+        with db.begin_nested():
+            new_analysis = models.Analysis(external_song_id=song_id, analysis_data=analysis, version=1)
+            db.add(new_analysis)
+        return new_analysis
+    except IntegrityError:
+        return None
+
+
+def load_analysis_version(db: Session, song_id: int, version: Optional[int] = None) -> Optional[dict]:
+    """Reconstruct a version (the latest by default) from its nearest full copy."""
+    if version is None:
+        latest = get_latest_analysis(db, song_id)
+        return latest.analysis_data if latest else None
+
+    base = db.query(models.Analysis).filter(
+        models.Analysis.external_song_id == song_id,
+        models.Analysis.version <= version,
+        models.Analysis.analysis_data.isnot(None)
+    ).order_by(models.Analysis.version.desc()).first()
+    if base is None:
+        return None
+
+    rows = db.query(models.Analysis.version, models.Analysis.patch).filter(
+        models.Analysis.external_song_id == song_id,
+        models.Analysis.version > base.version,
+        models.Analysis.version <= version
+    ).order_by(models.Analysis.version).all()
+    if base.version != version and (not rows or rows[-1].version != version):
+        return None
+
+    document = base.analysis_data
+    for row in rows:
+        document = apply_patch(document, row.patch)
+    return document
+
+
+def get_projected_analysis_fields(db: Session, song_ids: Iterable[int],
+                                  fields: Iterable[str] = ("overallHeadline",)) -> List[Dict[str, Any]]:
+    """
+    Read selected fields of each song's latest analysis in a single query.
+
+    The fields are extracted by the database (->> on JSONB, json_extract on
+    SQLite), so full analyses are never transferred or deserialized.
+    """
+    fields = list(fields)
+    latest = db.query(
+        models.Analysis.external_song_id,
+        func.max(models.Analysis.version).label("version")
+    ).filter(
+        models.Analysis.external_song_id.in_(list(song_ids))
+    ).group_by(models.Analysis.external_song_id).subquery()
+
+    rows = db.query(
+        models.Analysis.external_song_id,
+        models.Analysis.version,
+        *[models.Analysis.analysis_data[field].as_string().label(field) for field in fields]
+    ).join(latest, and_(
+        models.Analysis.external_song_id == latest.c.external_song_id,
+        models.Analysis.version == latest.c.version
+    )).all()
+
+    return [
+        {
+            "song_id": row.external_song_id,
+            "version": row.version,
+            **{field: row._mapping[field] for field in fields}
+        }
+        for row in rows
+    ]
+
+
+def compact_analysis_history(db: Session, song_id: Optional[int] = None,
+                             keep_versions: Optional[int] = None) -> int:
+    """
+    Rewrite stored versions as snapshots plus deltas and commit.
+
+    Re-derives every delta from the reconstructed documents, drops full copies
+    outside the snapshot schedule (including legacy rows written before deltas
+    existed) and, with keep_versions, collapses everything older than the last
+    keep_versions versions into a single snapshot. Returns the number of rows
+    rewritten or deleted.
+    """
+    query = db.query(models.Analysis.external_song_id).distinct()
+    if song_id is not None:
+        query = query.filter(models.Analysis.external_song_id == song_id)
+    song_ids = [row.external_song_id for row in query.all()]
+
+    changed = 0
+    for current_song_id in song_ids:
+        rows = db.query(models.Analysis).filter(
+            models.Analysis.external_song_id == current_song_id
+        ).order_by(models.Analysis.version).all()
+
+        documents = []
+        for row in rows:
+            if row.analysis_data is not None:
+                documents.append(row.analysis_data)
+            else:
+                documents.append(apply_patch(documents[-1], row.patch))
+
+        first_kept = 0
+        if keep_versions is not None and len(rows) > keep_versions:
+            first_kept = len(rows) - keep_versions
+            for row in rows[:first_kept]:
+                db.delete(row)
+                changed += 1
+
+        for index in range(first_kept, len(rows)):
+            row = rows[index]
+            is_base = index == first_kept
+            is_latest = index == len(rows) - 1
+            patch = None if is_base else make_patch(documents[index - 1], documents[index])
+            keep_full = is_base or is_latest or is_snapshot_version(row.version)
+            analysis_data = documents[index] if keep_full else None
+            if row.patch != patch or row.analysis_data != analysis_data:
+                row.patch = patch
+                row.analysis_data = analysis_data
+                changed += 1
+
+    db.commit()
+    return changed
+
+
+if __name__ == "__main__":
+    from .config import SessionLocal
+
+    print("Compacting analysis history...")
+    db = SessionLocal()
+    try:
+        print(f"Compacted {compact_analysis_history(db)} analysis row(s)")
+    finally:
+        db.close()
@@ -0,0 +1,37 @@
+from typing import AsyncIterator
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from .config import SQLALCHEMY_DATABASE_URL
+from .db_pool import PoolMetrics, pool_options
+
+# asyncio drivers for the sync URLs in database.config
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+
+def async_database_url(url: str) -> str:
+    """The same database as `url`, reached through its asyncio driver."""
+    parsed = make_url(url)
+    return parsed.set(drivername=ASYNC_DRIVERS[parsed.get_backend_name()]).render_as_string(hide_password=False)
+
+
+# Checkout metrics for the async engine's pool, reported next to the sync pool's
+async_pool_metrics = PoolMetrics("async")
+
+async_engine = create_async_engine(
+    async_database_url(SQLALCHEMY_DATABASE_URL), **pool_options(async_pool_metrics, asyncio=True)
+)
+
+# Objects stay readable after commit, as responses are built from them once the transaction ends
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    """
+    Async counterpart of get_db: the request waits on the database without
+    holding a threadpool thread. Sync helpers run on it through
+    `await db.run_sync(helper, ...)`.
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,183 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+from sqlalchemy import case, func, literal_column, select, tuple_, update
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.orm import Session
+
+from . import models, schemas
+
+# Number of comment ids kept in external_song_references.top_comment_ids
+TOP_COMMENTS_SIZE = int(os.getenv("TOP_COMMENTS_SIZE", "10"))
+# Seconds a cached top-comments payload is served before it is rebuilt
+TOP_COMMENTS_CACHE_SECONDS = float(os.getenv("TOP_COMMENTS_CACHE_SECONDS", "30"))
+# Songs kept in the top-comments cache
+TOP_COMMENTS_CACHE_SIZE = int(os.getenv("TOP_COMMENTS_CACHE_SIZE", "1000"))
+
+
+def top_comments_order():
+    """Ranking shared by top_comment_ids and the `top` comment listing."""
+    return (models.Comment.upvote_count.desc(), models.Comment.id.desc())
+
+
+def _top_ids_json(db: Session, song_id: int, size: int):
+    """Scalar subquery building a song's top comment ids as a JSON array, best first."""
+    ranked = select(models.Comment.id, models.Comment.upvote_count) \
+        .where(models.Comment.external_song_id == song_id) \
+        .order_by(*top_comments_order()) \
+        .limit(size) \
+        .subquery()
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        ids = func.jsonb_agg(aggregate_order_by(ranked.c.id, ranked.c.upvote_count.desc(), ranked.c.id.desc()))
+    elif dialect == "sqlite":
+        ids = func.json_group_array(ranked.c.id)  # Aggregates in the subquery's order
+    else:
+        raise NotImplementedError(f"Top comment aggregation is not supported on {dialect}")
+    return select(func.coalesce(ids, literal_column("'[]'"))).scalar_subquery()
+
+
+def _ranks_in_top(song_id: int, upvote_count: int, comment_id: int, size: int):
+    """
+    True when fewer than size comments outrank (upvote_count, comment_id), i.e.
+    that comment is or was in the song's top N. Reads at most size index entries.
+    """
+    above = select(models.Comment.id) \
+        .where(models.Comment.external_song_id == song_id) \
+        .where(tuple_(models.Comment.upvote_count, models.Comment.id) > tuple_(upvote_count, comment_id)) \
+        .limit(size) \
+        .subquery()
+    return select(func.count()).select_from(above).scalar_subquery() < size
+
+
+def update_comment_aggregates(db: Session, song_id: int, delta: int, upvote_count: int, comment_id: int,
+                              size: int = TOP_COMMENTS_SIZE) -> None:
+    """
+    Apply a comment write to the song's denormalized fields in one UPDATE. The
+    caller commits.
+
+    delta is added to comment_count. top_comment_ids is recomputed only when the
+    created, deleted or upvoted comment (ranked by upvote_count and comment_id)
+    is in the top N; otherwise it cannot have changed. Upvotes (delta 0) that
+    stay outside the top N leave the song row untouched, so they don't take its
+    row lock.
+    """
+    table = models.ExternalSongReference.__table__
+    in_top = _ranks_in_top(song_id, upvote_count, comment_id, size)
+    top_ids = _top_ids_json(db, song_id, size)
+    stmt = update(table).where(table.c.external_id == song_id)
+    if delta:
+        stmt = stmt.values(
+            comment_count=func.coalesce(table.c.comment_count, 0) + delta,
+            top_comment_ids=case((in_top, top_ids), else_=table.c.top_comment_ids)
+        )
+    else:
+        stmt = stmt.where(in_top).values(top_comment_ids=top_ids)
+    db.execute(stmt)
+
+
+def refresh_top_comment_ids(db: Session, song_id: int, size: int = TOP_COMMENTS_SIZE) -> List[int]:
+    """
+    Recompute a song's top_comment_ids from the (external_song_id, upvote_count)
+    index and store them. The caller commits.
+    """
+    top_ids = [
+        comment_id for (comment_id,) in db.query(models.Comment.id)
+        .filter(models.Comment.external_song_id == song_id)
+        .order_by(*top_comments_order())
+        .limit(size)
+    ]
+    table = models.ExternalSongReference.__table__
+    db.execute(update(table).where(table.c.external_id == song_id).values(top_comment_ids=top_ids))
+    return top_ids
+
+
+def recount_comment_aggregates(db: Session) -> None:
+    """Rebuild comment_count and top_comment_ids for every song and commit."""
+    counts = dict(
+        db.query(models.Comment.external_song_id, func.count(models.Comment.id))
+        .group_by(models.Comment.external_song_id)
+    )
+    table = models.ExternalSongReference.__table__
+    for (song_id,) in db.query(models.ExternalSongReference.external_id).all():
+        db.execute(update(table).where(table.c.external_id == song_id).values(comment_count=counts.get(song_id, 0)))
+        refresh_top_comment_ids(db, song_id)
+    db.commit()
+
+
+def load_top_comments(db: Session, song_id: int) -> dict:
+    """A schemas.TopComments payload read from the denormalized fields."""
+    reference = db.query(
+        models.ExternalSongReference.comment_count,
+        models.ExternalSongReference.top_comment_ids
+    ).filter(models.ExternalSongReference.external_id == song_id).first()
+    if reference is None:
+        return {"song_id": song_id, "comment_count": 0, "comments": []}
+
+    top_ids = reference.top_comment_ids
+    if top_ids is None:  # Not computed yet for this song
+        top_ids = refresh_top_comment_ids(db, song_id)
+        db.commit()
+
+    rows = db.query(models.Comment, models.User.username) \
+        .outerjoin(models.User, models.Comment.user_id == models.User.id) \
+        .filter(models.Comment.id.in_(top_ids)) \
+        .all() if top_ids else []
+    by_id = {comment.id: (comment, username) for comment, username in rows}
+
+    comments = []
+    for comment_id in top_ids:
+        if comment_id not in by_id:
+            continue  # Deleted since the ids were stored
+        comment, username = by_id[comment_id]
+        comments.append(schemas.CommentResponse(
+            id=comment.id,
+            content=comment.content,
+            song_id=comment.external_song_id,
+            created_at=comment.created_at,
+            updated_at=comment.updated_at,
+            username=username if username else "Anonymous",
+            upvote_count=comment.upvote_count
+        ))
+    return {"song_id": song_id, "comment_count": reference.comment_count or 0, "comments": comments}
+
+
+class TopCommentsCache:
+    """
+    Small per-song LRU cache of top-comments payloads.
+
+    Comment writes invalidate their song's entry; the TTL bounds staleness
+    from writes made by other processes.
+    """
+
+    def __init__(self, ttl: float = TOP_COMMENTS_CACHE_SECONDS, max_songs: int = TOP_COMMENTS_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_songs = max_songs
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, db: Session, song_id: int) -> dict:
+        with self._lock:
+            entry = self._entries.get(song_id)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl:
+                self._entries.move_to_end(song_id)
+                return entry[1]
+
+        payload = load_top_comments(db, song_id)
+        with self._lock:
+            self._entries[song_id] = (time.monotonic(), payload)
+            self._entries.move_to_end(song_id)
+            while len(self._entries) > self.max_songs:
+                self._entries.popitem(last=False)
+        return payload
+
+    def invalidate(self, song_id: Optional[int] = None) -> None:
+        """Drop one song's entry, or every entry when song_id is None."""
+        with self._lock:
+            if song_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(song_id, None)
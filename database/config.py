@@ -3,18 +3,22 @@ from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
 from dotenv import load_dotenv
+from .db_pool import PoolMetrics, pool_options
 
 load_dotenv()
 
 # Get environment
 ENV = os.getenv("ENV", "development")
 
+# Checkout metrics for the shared engine's connection pool
+pool_metrics = PoolMetrics()
+
 # Database URL configuration
 if ENV == "test":
     # Use SQLite for testing
     SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
     engine = create_engine(
-        SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+        SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}, **pool_options(pool_metrics)
     )
 else:
     # Use PostgreSQL for production
@@ -25,9 +29,9 @@ else:
     POSTGRES_DB = os.getenv("POSTGRES_DB", "lyrics_db")
     
     SQLALCHEMY_DATABASE_URL = f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
-    engine = create_engine(SQLALCHEMY_DATABASE_URL)
+    engine = create_engine(SQLALCHEMY_DATABASE_URL, **pool_options(pool_metrics))
 
-# Create SessionLocal class
+# Create SessionLocal class; every module shares this engine and its pool
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 # Create Base class
@@ -0,0 +1,108 @@
+import logging
+import os
+import threading
+import time
+from typing import Type
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+# Connections kept open, extra connections allowed under load, and seconds to wait for one
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Test connections before use, and replace them after this many seconds (-1 never)
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Checkouts that wait longer than this are logged
+DB_POOL_SLOW_WAIT_MS = float(os.getenv("DB_POOL_SLOW_WAIT_MS", "100"))
+
+
+class PoolMetrics:
+    """Wait times and timeouts for connection checkouts from one pool."""
+
+    def __init__(self, name: str = "primary", slow_wait_ms: float = DB_POOL_SLOW_WAIT_MS):
+        self.name = name
+        self.slow_wait_ms = slow_wait_ms
+        self.pool = None  # The live pool, set whenever it is (re)created
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.slow_checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record_wait(self, seconds: float, timed_out: bool) -> None:
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+                self.total_wait += seconds
+                self.max_wait = max(self.max_wait, seconds)
+            slow = seconds * 1000 >= self.slow_wait_ms
+            if slow:
+                self.slow_checkouts += 1
+        if timed_out:
+            logging.error(f"Timed out after {seconds:.3f}s waiting for a {self.name} database connection "
+                          f"({self.status()})")
+        elif slow:
+            logging.warning(f"Waited {seconds * 1000:.0f}ms for a {self.name} database connection "
+                            f"({self.status()})")
+
+    def status(self) -> str:
+        pool = self.pool
+        return pool.status() if pool is not None else "no pool"
+
+    def snapshot(self) -> dict:
+        pool = self.pool
+        with self._lock:
+            checkouts = self.checkouts or 1
+            metrics = {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "slow_checkouts": self.slow_checkouts,
+                "avg_wait_ms": round(self.total_wait / checkouts * 1000, 3),
+                "max_wait_ms": round(self.max_wait * 1000, 3),
+            }
+        if isinstance(pool, QueuePool):
+            metrics.update({
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                "overflow": max(0, pool.overflow()),
+            })
+        return metrics
+
+
+def instrumented_pool_class(metrics: PoolMetrics, base: Type[QueuePool] = QueuePool) -> Type[QueuePool]:
+    """A subclass of `base` that times every checkout into `metrics`; survives engine.dispose()."""
+
+    class InstrumentedQueuePool(base):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            metrics.pool = self
+
+        def _do_get(self):
+            started_at = time.perf_counter()
+            try:
+                connection = super()._do_get()
+            except exc.TimeoutError:
+                metrics.record_wait(time.perf_counter() - started_at, timed_out=True)
+                raise
+            metrics.record_wait(time.perf_counter() - started_at, timed_out=False)
+            return connection
+
+    return InstrumentedQueuePool
+
+
+def pool_options(metrics: PoolMetrics, asyncio: bool = False) -> dict:
+    """create_engine (or create_async_engine, with asyncio=True) arguments for a configured, instrumented pool."""
+    return {
+        "poolclass": instrumented_pool_class(metrics, AsyncAdaptedQueuePool if asyncio else QueuePool),
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "pool_recycle": DB_POOL_RECYCLE,
+    }
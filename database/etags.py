@@ -0,0 +1,41 @@
+import hashlib
+from typing import Optional
+
+from fastapi import Request, Response
+
+# Cache-Control policy per route
+COMMENTS_CACHE_CONTROL = "no-cache"  # Always revalidate; the ETag makes that cheap
+MOST_VIEWED_MAX_AGE = 30
+MOST_VIEWED_CACHE_CONTROL = f"public, max-age={MOST_VIEWED_MAX_AGE}"
+LATEST_ANALYSIS_CACHE_CONTROL = "public, max-age=60"
+ANALYSIS_VERSION_CACHE_CONTROL = "public, max-age=31536000, immutable"  # Stored versions never change
+
+
+def make_etag(*markers) -> str:
+    """Strong ETag for a response identified by cheap version markers."""
+    digest = hashlib.sha1(repr(markers).encode()).hexdigest()[:20]
+    return f'"{digest}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match check, using the weak comparison RFC 9110 specifies for it."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = {candidate.strip().removeprefix("W/") for candidate in header.split(",")}
+    return etag in candidates
+
+
+def conditional_response(request: Request, response: Response, etag: str,
+                         cache_control: str) -> Optional[Response]:
+    """
+    Set ETag and Cache-Control on the response; when the client already holds
+    this representation, return the 304 to send instead.
+    """
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
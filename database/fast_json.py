@@ -0,0 +1,43 @@
+import json
+from typing import Any, Optional
+
+from fastapi import Response
+
+try:
+    import orjson
+except ImportError:  # Fall back to the stdlib encoder
+    orjson = None
+
+
+def dumps(content: Any) -> bytes:
+    """
+    Encode plain rows (dicts, lists, datetimes) to JSON bytes.
+
+    Naive datetimes come out in the same ISO 8601 form pydantic produces, so
+    responses are byte-compatible with the response_model path.
+    """
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        content, separators=(",", ":"), ensure_ascii=False,
+        default=lambda value: value.isoformat()
+    ).encode("utf-8")
+
+
+class FastJSONResponse(Response):
+    """
+    JSON response for content already shaped like the route's response_model.
+
+    Returning it skips FastAPI's response_model validation and serialization;
+    the model still documents the route.
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def fast_json_response(content: Any, response: Optional[Response] = None) -> FastJSONResponse:
+    """FastJSONResponse carrying any headers already set on the endpoint's Response parameter."""
+    headers = dict(response.headers) if response is not None else None
+    return FastJSONResponse(content, headers=headers)
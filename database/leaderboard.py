@@ -0,0 +1,171 @@
+import bisect
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from .config import SessionLocal
+from . import models
+from .pagination import encode_cursor
+
+# Number of most viewed songs kept in memory
+LEADERBOARD_SIZE = int(os.getenv("LEADERBOARD_SIZE", "1000"))
+# Seconds between full reloads from the database
+LEADERBOARD_REFRESH_INTERVAL = float(os.getenv("LEADERBOARD_REFRESH_INTERVAL", "60"))
+# Minimum seconds between reloads triggered by songs outside the board gaining views
+LEADERBOARD_MIN_REFRESH_GAP = float(os.getenv("LEADERBOARD_MIN_REFRESH_GAP", "5"))
+
+
+def most_viewed_order():
+    """Leaderboard ordering shared by the in-memory board and database queries."""
+    return (models.ExternalSongReference.view_count.desc(), models.ExternalSongReference.id)
+
+
+def song_item(ref: models.ExternalSongReference) -> dict:
+    """schemas.Song fields for an external song reference."""
+    return {
+        "id": ref.external_id,
+        "title": ref.title,
+        "artist": ref.artist,
+        "lyrics": "",  # We don't store lyrics locally
+        "view_count": ref.view_count or 0,
+        "created_at": ref.created_at,
+        "updated_at": ref.updated_at,
+    }
+
+
+class Leaderboard:
+    """
+    Materialized top-K of the most viewed songs.
+
+    The board is reloaded from the database on an interval and bumped in place
+    as view-count flushes land, so pages inside the top K are served without a
+    query. Songs outside the board that gain views mark it stale and bring the
+    next reload forward.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        size: int = LEADERBOARD_SIZE,
+        refresh_interval: float = LEADERBOARD_REFRESH_INTERVAL,
+        min_refresh_gap: float = LEADERBOARD_MIN_REFRESH_GAP,
+    ):
+        self.session_factory = session_factory
+        self.size = size
+        self.refresh_interval = refresh_interval
+        self.min_refresh_gap = min_refresh_gap
+        self._entries: List[dict] = []
+        self._keys: Dict[int, int] = {}  # external_id -> primary key, for tie-breaking
+        self._total = 0
+        self._loaded = False
+        self._stale = False
+        self._refreshed_at = 0.0
+        self.version = 0  # Bumped whenever the board changes; feeds response ETags
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def refresh(self) -> None:
+        """Reload the top K and the total song count from the database."""
+        db = self.session_factory()
+        try:
+            refs = db.query(models.ExternalSongReference).order_by(
+                *most_viewed_order()
+            ).limit(self.size).all()
+            total = db.query(models.ExternalSongReference).count()
+            entries = [song_item(ref) for ref in refs]
+            keys = {ref.external_id: ref.id for ref in refs}
+        finally:
+            db.close()
+
+        with self._lock:
+            self._entries = entries
+            self._keys = keys
+            self._total = total
+            self._loaded = True
+            self._stale = False
+            self._refreshed_at = time.monotonic()
+            self.version += 1
+
+    def apply_views(self, counts: Dict[int, int]) -> None:
+        """Fold flushed view increments ({song_id: views}) into the board."""
+        with self._lock:
+            if not self._loaded:
+                return
+            by_song = {entry["id"]: entry for entry in self._entries}
+            for song_id, views in counts.items():
+                entry = by_song.get(song_id)
+                if entry is None:
+                    self._stale = True  # May have entered the top K or be a new song
+                else:
+                    entry["view_count"] += views
+            self._entries.sort(key=self._sort_key)
+            self.version += 1
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def page(self, page: int, size: int) -> Optional[dict]:
+        """A schemas.PaginatedResponse page, or None when it is not inside the board."""
+        with self._lock:
+            if not self._loaded:
+                return None
+            return self._slice((page - 1) * size, size, page)
+
+    def page_after(self, view_count: int, song_key: int, size: int) -> Optional[dict]:
+        """The page following a keyset cursor, or None when it is not inside the board."""
+        with self._lock:
+            if not self._loaded:
+                return None
+            sort_keys = [self._sort_key(entry) for entry in self._entries]
+            start = bisect.bisect_right(sort_keys, (-view_count, song_key))
+            return self._slice(start, size, start // size + 1)
+
+    def _sort_key(self, entry: dict) -> Tuple[int, int]:
+        return -entry["view_count"], self._keys[entry["id"]]
+
+    def _slice(self, start: int, size: int, page: int) -> Optional[dict]:
+        complete = self._total <= len(self._entries) and not self._stale
+        if start + size > len(self._entries) and not complete:
+            return None
+        entries = self._entries[start:start + size]
+        next_cursor = None
+        if len(entries) == size and (start + size < len(self._entries) or not complete):
+            view_count, song_key = self._sort_key(entries[-1])
+            next_cursor = encode_cursor(-view_count, song_key)
+        total = max(self._total, len(self._entries))
+        return {
+            "items": [dict(entry) for entry in entries],
+            "total": total,
+            "page": page,
+            "size": size,
+            "pages": (total + size - 1) // size,
+            "next_cursor": next_cursor,
+        }
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="leaderboard", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread = None
+
+    def _loop(self) -> None:
+        wait = 0.0
+        while not self._stop.wait(wait):
+            wait = 1.0
+            since_refresh = time.monotonic() - self._refreshed_at
+            due = not self._loaded or since_refresh >= self.refresh_interval
+            if due or (self._stale and since_refresh >= self.min_refresh_gap):
+                try:
+                    self.refresh()
+                except Exception as e:
+                    logging.error(f"Error refreshing most viewed leaderboard: {e}")
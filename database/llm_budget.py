@@ -0,0 +1,100 @@
+import contextvars
+import math
+import os
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+
+from fastapi import HTTPException, status
+
+from .rate_limit import SlidingWindowLimiter, build_rate_limiter
+
+# Seconds over which LLM token budgets are measured
+LLM_BUDGET_WINDOW = float(os.getenv("LLM_BUDGET_WINDOW", "3600"))
+# Tokens per window for a signed-in user, and for an anonymous client IP
+LLM_USER_TOKEN_BUDGET = int(os.getenv("LLM_USER_TOKEN_BUDGET", "50000"))
+LLM_IP_TOKEN_BUDGET = int(os.getenv("LLM_IP_TOKEN_BUDGET", "15000"))
+
+# Tokens reported by LLM calls made under the current reservation
+_llm_usage: contextvars.ContextVar[Optional[List[int]]] = contextvars.ContextVar("llm_usage", default=None)
+
+
+def record_llm_usage(response) -> None:
+    """Report an OpenAI response's token usage to the active reservation, if any."""
+    usage = _llm_usage.get()
+    if usage is not None:
+        usage.append(int((response.get("usage") or {}).get("total_tokens", 0)))
+
+
+class LLMBudget:
+    """
+    Token budgets for LLM-backed endpoints, separate from the request rate limit.
+
+    Signed-in users draw on a per-user budget and anonymous clients on a
+    per-IP one. A request reserves its estimated tokens before calling the
+    model and is settled against the usage the model reports afterwards;
+    requests answered from stored analyses never reserve anything.
+    """
+
+    def __init__(
+        self,
+        window: float = LLM_BUDGET_WINDOW,
+        user_budget: int = LLM_USER_TOKEN_BUDGET,
+        ip_budget: int = LLM_IP_TOKEN_BUDGET,
+        user_limiter: Optional[SlidingWindowLimiter] = None,
+        ip_limiter: Optional[SlidingWindowLimiter] = None,
+    ):
+        self.window = window
+        # Own scopes, so a shared backend never mixes these counts with the request limiter's
+        if user_limiter is None:
+            user_limiter = build_rate_limiter(user_budget, window, "llm_user")
+        if ip_limiter is None:
+            ip_limiter = build_rate_limiter(ip_budget, window, "llm_ip")
+        self.user_limiter = user_limiter
+        self.ip_limiter = ip_limiter
+
+    def _limiter_and_key(self, user_id: Optional[int], client_ip: str):
+        if user_id is not None:
+            return self.user_limiter, f"user:{user_id}"
+        return self.ip_limiter, f"ip:{client_ip}"
+
+    @contextmanager
+    def reserve(self, estimated_tokens: int, user_id: Optional[int], client_ip: str) -> Iterator[None]:
+        """
+        Hold estimated_tokens of the caller's budget around an LLM call.
+
+        Raises a 429 with Retry-After when the budget cannot cover the
+        estimate. On exit the reservation is replaced by the reported usage,
+        or by the estimate when the calls reported none; a failed call that
+        reported nothing is refunded.
+        """
+        limiter, key = self._limiter_and_key(user_id, client_ip)
+        allowed, retry_after = limiter.hit(key, cost=estimated_tokens)
+        if not allowed:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="LLM token budget exhausted",
+                headers={"Retry-After": str(max(1, math.ceil(min(retry_after, self.window))))}
+            )
+
+        usage: List[int] = []
+        token = _llm_usage.set(usage)
+        failed = False
+        try:
+            yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            _llm_usage.reset(token)
+            if usage:
+                limiter.adjust(key, sum(usage) - estimated_tokens)
+            elif failed:
+                limiter.adjust(key, -estimated_tokens)
+
+    def start(self) -> None:
+        self.user_limiter.start()
+        self.ip_limiter.start()
+
+    def stop(self) -> None:
+        self.user_limiter.stop()
+        self.ip_limiter.stop()
@@ -0,0 +1,78 @@
+import logging
+import math
+import os
+import time
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .replicas import READ_YOUR_WRITES_COOKIE, READ_YOUR_WRITES_SECONDS
+
+# Requests slower than this many seconds are logged
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "1.0"))
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class RequestTimingMiddleware:
+    """
+    Pure ASGI request timing.
+
+    Adds a Server-Timing header with the time to the first response byte and
+    logs requests slower than SLOW_REQUEST_SECONDS. Bodies are passed through
+    untouched, so streaming responses are not buffered.
+    """
+
+    def __init__(self, app: ASGIApp, slow_request_seconds: float = SLOW_REQUEST_SECONDS):
+        self.app = app
+        self.slow_request_seconds = slow_request_seconds
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+
+        async def send_with_timing(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                elapsed = time.perf_counter() - start
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"server-timing", f"app;dur={elapsed * 1000:.1f}".encode())
+                ]
+                if elapsed >= self.slow_request_seconds:
+                    logging.warning(
+                        f"Slow request: {scope['method']} {scope['path']} took {elapsed:.2f}s "
+                        f"(status {message['status']})"
+                    )
+            await send(message)
+
+        await self.app(scope, receive, send_with_timing)
+
+
+class ReadYourWritesMiddleware:
+    """
+    Pure ASGI marking of clients that just wrote.
+
+    Successful unsafe requests (POST, PUT, PATCH, DELETE) set a short-lived
+    cookie; while it is valid, get_read_db and get_async_read_db send that
+    client's reads to the primary instead of a replica that may lag behind.
+    """
+
+    def __init__(self, app: ASGIApp, window_seconds: float = READ_YOUR_WRITES_SECONDS):
+        self.app = app
+        self.window_seconds = window_seconds
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] in SAFE_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_cookie(message: Message) -> None:
+            if message["type"] == "http.response.start" and 200 <= message["status"] < 400:
+                until = time.time() + self.window_seconds
+                cookie = (f"{READ_YOUR_WRITES_COOKIE}={until:.3f}; Max-Age={math.ceil(self.window_seconds)}; "
+                          f"Path=/; HttpOnly; SameSite=Lax")
+                message["headers"] = list(message.get("headers", [])) + [(b"set-cookie", cookie.encode())]
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
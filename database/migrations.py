@@ -1,11 +1,59 @@
-from sqlalchemy import create_engine, text
-from .config import SQLALCHEMY_DATABASE_URL, Base
-from . import models
-
-def run_migrations():
-    """Run database migrations (create tables if not exist)."""
-    engine = create_engine(SQLALCHEMY_DATABASE_URL)
-    Base.metadata.create_all(bind=engine, checkfirst=True)
+from pathlib import Path
+
+from alembic import command, op
+from alembic.config import Config
+from sqlalchemy import text
+from .config import engine as shared_engine
+
+ALEMBIC_DIR = Path(__file__).parent / "alembic"
+
+def create_index_online(index_name: str, table_name: str, columns, **kw):
+    """
+    op.create_index for live tables, for use in Alembic revisions.
+
+    On PostgreSQL the index is built with CREATE INDEX CONCURRENTLY outside the
+    revision's transaction, so writes continue during the build; an invalid
+    index left by an interrupted build is dropped and rebuilt. SQLite has no
+    online builds and creates it in the revision's transaction.
+    """
+    context = op.get_context()
+    if context.dialect.name != "postgresql":
+        op.create_index(index_name, table_name, columns, if_not_exists=True, **kw)
+        return
+
+    with context.autocommit_block():
+        if not context.as_sql:
+            invalid = op.get_bind().execute(text("""
+                SELECT 1 FROM pg_index JOIN pg_class ON pg_class.oid = pg_index.indexrelid
+                WHERE pg_class.relname = :name AND NOT pg_index.indisvalid
+            """), {"name": index_name}).scalar()
+            if invalid:
+                op.drop_index(index_name, table_name=table_name, postgresql_concurrently=True)
+        op.create_index(index_name, table_name, columns, postgresql_concurrently=True, if_not_exists=True, **kw)
+
+def drop_index_online(index_name: str, table_name: str):
+    """op.drop_index counterpart of create_index_online."""
+    context = op.get_context()
+    if context.dialect.name != "postgresql":
+        op.drop_index(index_name, table_name=table_name, if_exists=True)
+        return
+    with context.autocommit_block():
+        op.drop_index(index_name, table_name=table_name, postgresql_concurrently=True, if_exists=True)
+
+def alembic_config(url: str = None) -> Config:
+    """Alembic configuration for database/alembic; `url` is only needed for offline (--sql) runs."""
+    config = Config()
+    config.set_main_option("script_location", str(ALEMBIC_DIR))
+    if url:
+        config.set_main_option("sqlalchemy.url", url)
+    return config
+
+def run_migrations(engine=shared_engine, revision: str = "head"):
+    """Upgrade the database through the versioned Alembic revisions in database/alembic/versions."""
+    with engine.connect() as connection:
+        config = alembic_config()
+        config.attributes["connection"] = connection
+        command.upgrade(config, revision)
 
 # def run_migrations():
 #     """Run database migrations."""
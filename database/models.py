@@ -1,8 +1,12 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, ForeignKey, Boolean, JSON, Float, Index, UniqueConstraint
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from .config import Base
 from datetime import datetime
 
+# JSONB on PostgreSQL, JSON (stored as text) elsewhere; None is stored as SQL NULL
+JSONDocument = JSON(none_as_null=True).with_variant(JSONB(none_as_null=True), "postgresql")
+
 class User(Base):
     __tablename__ = "users"
 
@@ -24,24 +28,38 @@ class ExternalSongReference(Base):
     title = Column(String)
     artist = Column(String)
     view_count = Column(Integer, default=0)
+    comment_count = Column(Integer, default=0, nullable=False, server_default="0")
+    top_comment_ids = Column(JSONDocument)  # Most upvoted comment ids, best first; NULL until first computed
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     comments = relationship("Comment", back_populates="song_reference")
     analyses = relationship("Analysis", back_populates="song_reference")
 
+    __table_args__ = (
+        # Keyset pagination for the most viewed listing
+        Index("ix_external_song_references_view_count_id", view_count.desc(), id),
+    )
+
 class Analysis(Base):
     __tablename__ = "analyses"
 
     id = Column(Integer, primary_key=True, index=True)
     external_song_id = Column(Integer, ForeignKey("external_song_references.external_id"))
-    analysis_data = Column(Text)  # JSON string of the analysis
+    analysis_data = Column(JSONDocument, nullable=True)  # Full analysis; kept for snapshots and the latest version
+    patch = Column(JSONDocument, nullable=True)  # JSON patch from the previous version
     version = Column(Integer, default=1)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     song_reference = relationship("ExternalSongReference", back_populates="analyses")
 
+    __table_args__ = (
+        # Latest version and version history of a song's analysis; unique so
+        # concurrent saves cannot both claim the next version
+        Index("uq_analyses_song_version", external_song_id, version, unique=True),
+    )
+
 class Comment(Base):
     __tablename__ = "comments"
 
@@ -54,4 +72,89 @@ class Comment(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     user = relationship("User", back_populates="comments")
-    song_reference = relationship("ExternalSongReference", back_populates="comments")
\ No newline at end of file
+    song_reference = relationship("ExternalSongReference", back_populates="comments")
+
+    __table_args__ = (
+        # Keyset pagination of a song's comments, newest first or top voted
+        Index("ix_comments_song_created_at", external_song_id, created_at, id),
+        Index("ix_comments_song_upvote_count", external_song_id, upvote_count, id),
+        # Latest change to a song's comments, for the comments ETag
+        Index("ix_comments_song_updated_at", external_song_id, updated_at),
+    )
+
+class CommentVote(Base):
+    """One upvote; the unique constraint allows a single vote per comment and voter"""
+    __tablename__ = "comment_votes"
+
+    id = Column(Integer, primary_key=True, index=True)
+    comment_id = Column(Integer, ForeignKey("comments.id", ondelete="CASCADE"), nullable=False)
+    voter_key = Column(String, nullable=False)  # Hashed client IP
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("comment_id", "voter_key", name="uq_comment_votes_comment_voter"),
+    )
+
+class RevokedToken(Base):
+    """Token ids denied until their tokens expire"""
+    __tablename__ = "revoked_tokens"
+
+    jti = Column(String, primary_key=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+class RateLimitCounter(Base):
+    """Requests per rate-limit key and fixed window, shared across nodes"""
+    __tablename__ = "rate_limit_counters"
+
+    id = Column(Integer, primary_key=True)
+    scope = Column(String, nullable=False)  # The limiter, e.g. "requests" or "llm_user"; each has its own window
+    key = Column(String, nullable=False)
+    window_index = Column(BigInteger, nullable=False)  # Request time // the scope's window length
+    count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("scope", "key", "window_index", name="uq_rate_limit_counters_scope_key_window"),
+    )
+
+class PrecomputeRun(Base):
+    """One off-peak precompute pass and the coverage it achieved"""
+    __tablename__ = "precompute_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    started_at = Column(DateTime, default=datetime.utcnow, index=True)
+    finished_at = Column(DateTime, nullable=True)
+    candidates = Column(Integer, default=0)
+    generated = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    tokens_used = Column(Integer, default=0)
+    view_snapshot = Column(JSONDocument)  # {song_id: view_count} of candidates, for spotting rising songs
+    precomputed_views = Column(JSONDocument)  # {song_id: view_count} of songs analyzed in this run
+    total_views_at_start = Column(Integer, default=0)  # Legacy; coverage now comes from the hourly view rollups
+    coverage = Column(Float, nullable=True)  # Share of the next day's views served from this run
+    coverage_measured_at = Column(DateTime, nullable=True)
+
+class SongViewHourly(Base):
+    """Views per song per UTC hour, for rolling-window trending"""
+    __tablename__ = "song_views_hourly"
+
+    id = Column(Integer, primary_key=True, index=True)
+    external_song_id = Column(Integer, nullable=False)
+    bucket_start = Column(DateTime, nullable=False, index=True)
+    views = Column(Integer, default=0, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("external_song_id", "bucket_start", name="uq_song_views_hourly_song_bucket"),
+    )
+
+class SongViewDaily(Base):
+    """Views per song per UTC day, for longer trending windows"""
+    __tablename__ = "song_views_daily"
+
+    id = Column(Integer, primary_key=True, index=True)
+    external_song_id = Column(Integer, nullable=False)
+    bucket_start = Column(DateTime, nullable=False, index=True)
+    views = Column(Integer, default=0, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("external_song_id", "bucket_start", name="uq_song_views_daily_song_bucket"),
+    )
@@ -0,0 +1,73 @@
+import base64
+import json
+import os
+import threading
+import time
+from typing import List, Optional, Sequence
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+# Seconds an exact row count is reused when the planner has no estimate
+COUNT_CACHE_SECONDS = float(os.getenv("COUNT_CACHE_SECONDS", "60"))
+
+
+def encode_cursor(*values) -> str:
+    """Opaque keyset cursor for the sort key of the last row on a page."""
+    return base64.urlsafe_b64encode(json.dumps(list(values)).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, length: int, types: Optional[Sequence[type]] = None) -> List:
+    """
+    Inverse of encode_cursor; raises ValueError for anything it did not produce,
+    including values that are not of the given types (bools are not ints).
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != length:
+        raise ValueError("Invalid cursor")
+    if types is not None and not all(
+        isinstance(value, expected) and not isinstance(value, bool) for value, expected in zip(values, types)
+    ):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+class RowCountEstimator:
+    """
+    Cheap row count for pagination totals.
+
+    Uses the planner's reltuples statistic on PostgreSQL and otherwise an exact
+    COUNT(*) that is cached for COUNT_CACHE_SECONDS.
+    """
+
+    def __init__(self, model, ttl: float = COUNT_CACHE_SECONDS):
+        self.model = model
+        self.ttl = ttl
+        self._count = None
+        self._counted_at = 0.0
+        self._lock = threading.Lock()
+
+    def __call__(self, db: Session) -> int:
+        if db.get_bind().dialect.name == "postgresql":
+            estimate = db.execute(
+                text("SELECT reltuples::bigint FROM pg_class WHERE relname = :table"),
+                {"table": self.model.__tablename__}
+            ).scalar()
+            if estimate is not None and estimate > 0:  # -1 or 0 until the table is analyzed
+                return int(estimate)
+
+        with self._lock:
+            if self._count is not None and time.monotonic() - self._counted_at < self.ttl:
+                return self._count
+        count = db.query(self.model).count()
+        with self._lock:
+            self._count = count
+            self._counted_at = time.monotonic()
+        return count
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._count = None
@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional, Tuple, TypeVar
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+T = TypeVar("T")
+
+# bcrypt work factor; each hash costs about 2 ** rounds iterations of CPU
+PASSWORD_BCRYPT_ROUNDS = int(os.getenv("PASSWORD_BCRYPT_ROUNDS", "4" if os.getenv("ENV") == "test" else "12"))
+# Threads hashing at once; bcrypt releases the GIL, so these run in parallel
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Calls allowed to wait for a worker before new ones are turned away with a 503
+PASSWORD_HASH_QUEUE_LIMIT = int(os.getenv("PASSWORD_HASH_QUEUE_LIMIT", "32"))
+
+# bcrypt for new hashes; the legacy unsalted SHA-256 hex digests still verify and are flagged for upgrade
+password_context = CryptContext(
+    schemes=["bcrypt", "hex_sha256"],
+    deprecated=["hex_sha256"],
+    bcrypt__rounds=PASSWORD_BCRYPT_ROUNDS,
+)
+
+
+class HashingPoolBusy(Exception):
+    """The password hashing queue is full."""
+
+
+class PasswordHasher:
+    """
+    Bounded thread pool for password hashing and verification.
+
+    At most `workers` hashes run at once and at most `queue_limit` more wait,
+    so a burst of logins costs a fixed slice of CPU instead of starving other
+    endpoints; callers beyond that get HashingPoolBusy straight away. Async
+    callers wait on the event loop, so queued logins hold no request threads.
+    """
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, queue_limit: int = PASSWORD_HASH_QUEUE_LIMIT,
+                 context: CryptContext = password_context):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.context = context
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self._lock = threading.Lock()
+        self._in_flight = 0  # Running plus queued
+        self.max_queue_depth = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.total_duration = 0.0
+
+    def hash(self, password: str) -> str:
+        return self._submit(self.context.hash, password).result()
+
+    def verify(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        """(matches, replacement hash when the stored one uses a deprecated scheme or settings)."""
+        return self._submit(self._verify_and_update, password, hashed).result()
+
+    async def hash_async(self, password: str) -> str:
+        """hash for async endpoints: waits on the event loop instead of parking a threadpool thread."""
+        return await asyncio.wrap_future(self._submit(self.context.hash, password))
+
+    async def verify_async(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        """verify for async endpoints."""
+        return await asyncio.wrap_future(self._submit(self._verify_and_update, password, hashed))
+
+    def _verify_and_update(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        try:
+            return self.context.verify_and_update(password, hashed)
+        except ValueError:  # Not a hash any configured scheme recognizes
+            return False, None
+
+    def _submit(self, fn: Callable[..., T], *args) -> "Future[T]":
+        with self._lock:
+            if self._in_flight >= self.workers + self.queue_limit:
+                self.rejected += 1
+                raise HashingPoolBusy()
+            self._in_flight += 1
+            self.max_queue_depth = max(self.max_queue_depth, self._in_flight - self.workers)
+        submitted_at = time.perf_counter()
+
+        def run():
+            started_at = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self._in_flight -= 1
+                    self.completed += 1
+                    self.total_wait += started_at - submitted_at
+                    self.total_duration += time.perf_counter() - started_at
+
+        return self._executor.submit(run)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            completed = self.completed or 1
+            return {
+                "workers": self.workers,
+                "queue_limit": self.queue_limit,
+                "in_flight": self._in_flight,
+                "queue_depth": max(0, self._in_flight - self.workers),
+                "max_queue_depth": self.max_queue_depth,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "avg_wait_ms": round(self.total_wait / completed * 1000, 3),
+                "avg_hash_ms": round(self.total_duration / completed * 1000, 3),
+            }
+
+
+def hashing_unavailable() -> HTTPException:
+    logging.warning("Password hashing queue is full; rejecting request")
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many sign-in attempts in progress, please retry",
+        headers={"Retry-After": "1"}
+    )
@@ -0,0 +1,302 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, time as dt_time, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import case, exists, func
+from sqlalchemy.orm import Session
+
+from .config import SessionLocal
+from . import models
+from .analysis_store import save_first_analysis
+from .trending import hour_bucket
+
+# Comma separated HH:MM-HH:MM windows in server local time; windows may wrap midnight
+PRECOMPUTE_WINDOWS = os.getenv("PRECOMPUTE_WINDOWS", "02:00-06:00")
+PRECOMPUTE_CONCURRENCY = int(os.getenv("PRECOMPUTE_CONCURRENCY", "4"))
+PRECOMPUTE_TOKEN_BUDGET = int(os.getenv("PRECOMPUTE_TOKEN_BUDGET", "100000"))
+PRECOMPUTE_MAX_SONGS = int(os.getenv("PRECOMPUTE_MAX_SONGS", "50"))
+PRECOMPUTE_CHECK_INTERVAL = int(os.getenv("PRECOMPUTE_CHECK_INTERVAL", "300"))  # seconds
+
+# Songs without an analysis that are tracked between runs to spot rising view counts
+CANDIDATE_POOL_SIZE = 500
+
+# Token cost of one analysis: prompt overhead plus the completion cap
+ANALYSIS_PROMPT_TOKENS = 200
+ANALYSIS_MAX_TOKENS = 800
+
+# How long after a run its coverage is measured
+COVERAGE_WINDOW = timedelta(days=1)
+
+# generate(song_id, title, artist) -> (analysis, tokens used)
+Generator = Callable[[int, str, str], Tuple[dict, int]]
+
+
+def estimate_analysis_tokens(lyrics: str = "") -> int:
+    """Rough token count for one analysis (about four characters per token)."""
+    return ANALYSIS_PROMPT_TOKENS + len(lyrics) // 4 + ANALYSIS_MAX_TOKENS
+
+
+# Budget reserved per song before its lyrics are known
+DEFAULT_SONG_TOKEN_ESTIMATE = estimate_analysis_tokens("x" * 4000)
+
+
+def parse_windows(spec: str) -> List[Tuple[dt_time, dt_time]]:
+    windows = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        start, end = part.split("-")
+        windows.append((dt_time.fromisoformat(start.strip()), dt_time.fromisoformat(end.strip())))
+    return windows
+
+
+def current_window_start(now: datetime, windows: List[Tuple[dt_time, dt_time]]) -> Optional[datetime]:
+    """Start of the off-peak window containing now, or None outside every window."""
+    current = now.time()
+    for start, end in windows:
+        if start <= end:
+            if start <= current < end:
+                return datetime.combine(now.date(), start)
+        elif current >= start:
+            return datetime.combine(now.date(), start)
+        elif current < end:
+            return datetime.combine(now.date() - timedelta(days=1), start)
+    return None
+
+
+def in_off_peak_window(now: datetime, windows: List[Tuple[dt_time, dt_time]]) -> bool:
+    return current_window_start(now, windows) is not None
+
+
+def select_rising_songs(db: Session, previous_snapshot: Dict[str, int], limit: int
+                        ) -> Tuple[List[models.ExternalSongReference], Dict[str, int]]:
+    """
+    Pick songs without a stored analysis whose view count grew since the last run.
+
+    Returns the songs ordered by growth and the view snapshot to store for the
+    next run.
+    """
+    has_analysis = exists().where(
+        models.Analysis.external_song_id == models.ExternalSongReference.external_id
+    )
+    pool = db.query(models.ExternalSongReference).filter(~has_analysis).order_by(
+        models.ExternalSongReference.view_count.desc()
+    ).limit(CANDIDATE_POOL_SIZE).all()
+
+    snapshot = {str(song.external_id): song.view_count or 0 for song in pool}
+    growth = {
+        song.external_id: (song.view_count or 0) - previous_snapshot.get(str(song.external_id), 0)
+        for song in pool
+    }
+    rising = [song for song in pool if growth[song.external_id] > 0]
+    rising.sort(key=lambda song: (growth[song.external_id], song.view_count or 0), reverse=True)
+    return rising[:limit], snapshot
+
+
+def measure_coverage(db: Session, now: Optional[datetime] = None) -> List[models.PrecomputeRun]:
+    """
+    Fill in coverage for runs whose next day has passed.
+
+    Coverage is the share of views in the day after the run started that went
+    to songs the run precomputed, i.e. views answered from a stored analysis
+    instead of a cold LLM call. Views come from the hourly rollups, so the day
+    is counted to the hour.
+    """
+    now = now or datetime.utcnow()
+    runs = db.query(models.PrecomputeRun).filter(
+        models.PrecomputeRun.coverage.is_(None),
+        models.PrecomputeRun.finished_at.isnot(None),
+        models.PrecomputeRun.started_at <= now - COVERAGE_WINDOW
+    ).all()
+    if not runs:
+        return []
+
+    hourly = models.SongViewHourly
+    for run in runs:
+        window_start = hour_bucket(run.started_at)
+        precomputed = [int(song_id) for song_id in run.precomputed_views or {}]
+        all_views, precomputed_views = db.query(
+            func.coalesce(func.sum(hourly.views), 0),
+            func.coalesce(func.sum(case((hourly.external_song_id.in_(precomputed), hourly.views), else_=0)), 0)
+        ).filter(
+            hourly.bucket_start >= window_start,
+            hourly.bucket_start < window_start + COVERAGE_WINDOW
+        ).one()
+        run.coverage = precomputed_views / all_views if all_views > 0 else 0.0
+        run.coverage_measured_at = now
+    db.commit()
+    return runs
+
+
+class PrecomputeJob:
+    """
+    Precomputes analyses for trending songs during off-peak windows.
+
+    Each run analyzes the fastest-rising songs that have no stored analysis,
+    with at most `concurrency` LLM calls in flight, and stops scheduling new
+    songs once the token budget would be exceeded.
+    """
+
+    def __init__(
+        self,
+        generate: Generator,
+        session_factory: Callable[[], Session] = SessionLocal,
+        windows: str = PRECOMPUTE_WINDOWS,
+        concurrency: int = PRECOMPUTE_CONCURRENCY,
+        token_budget: int = PRECOMPUTE_TOKEN_BUDGET,
+        max_songs: int = PRECOMPUTE_MAX_SONGS,
+        check_interval: int = PRECOMPUTE_CHECK_INTERVAL,
+    ):
+        self.generate = generate
+        self.session_factory = session_factory
+        self.windows = parse_windows(windows)
+        self.concurrency = concurrency
+        self.token_budget = token_budget
+        self.max_songs = max_songs
+        self.check_interval = check_interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_window_start: Optional[datetime] = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="precompute", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.check_interval):
+            self.tick()
+
+    def tick(self) -> None:
+        """One check: measure runs whose next day has passed, then run if a new window opened."""
+        db = self.session_factory()
+        try:
+            measure_coverage(db)
+        except Exception as e:
+            logging.error(f"Error measuring precompute coverage: {e}")
+        finally:
+            db.close()
+
+        window_start = current_window_start(datetime.now(), self.windows)
+        # One run per off-peak window
+        if window_start is None or window_start == self._last_window_start:
+            return
+        self._last_window_start = window_start
+        try:
+            self.run()
+        except Exception as e:
+            logging.error(f"Error during analysis precompute: {e}")
+
+    def run(self) -> dict:
+        """Run one precompute pass now and return its report."""
+        db = self.session_factory()
+        try:
+            coverage = [
+                {"run_id": measured_run.id, "coverage": measured_run.coverage}
+                for measured_run in measure_coverage(db)
+            ]
+
+            previous = db.query(models.PrecomputeRun).order_by(
+                models.PrecomputeRun.started_at.desc(), models.PrecomputeRun.id.desc()
+            ).first()
+            songs, snapshot = select_rising_songs(
+                db, (previous.view_snapshot if previous else None) or {}, self.max_songs
+            )
+            run = models.PrecomputeRun(candidates=len(songs), view_snapshot=snapshot)
+            db.add(run)
+            db.commit()
+            run_id = run.id
+            targets = [(song.external_id, song.title or "Unknown", song.artist or "Unknown") for song in songs]
+        finally:
+            db.close()
+
+        generated, failed, tokens_used = self._generate_all(targets)
+
+        db = self.session_factory()
+        try:
+            run = db.query(models.PrecomputeRun).filter(models.PrecomputeRun.id == run_id).first()
+            views = dict(db.query(
+                models.ExternalSongReference.external_id,
+                models.ExternalSongReference.view_count
+            ).filter(models.ExternalSongReference.external_id.in_(generated)).all()) if generated else {}
+            run.generated = len(generated)
+            run.failed = failed
+            run.tokens_used = tokens_used
+            run.precomputed_views = {str(song_id): views.get(song_id) or 0 for song_id in generated}
+            run.finished_at = datetime.utcnow()
+            db.commit()
+
+            report = {
+                "run_id": run.id,
+                "candidates": run.candidates,
+                "generated": run.generated,
+                "failed": run.failed,
+                "tokens_used": run.tokens_used,
+                "token_budget": self.token_budget,
+                "coverage": coverage,
+            }
+        finally:
+            db.close()
+
+        logging.info(f"Analysis precompute finished: {report}")
+        return report
+
+    def _generate_all(self, targets: List[Tuple[int, str, str]]) -> Tuple[List[int], int, int]:
+        generated: List[int] = []
+        failed = 0
+        tokens_used = 0
+        reserved = 0
+        lock = threading.Lock()
+        pending = list(targets)
+
+        def reserve() -> bool:
+            nonlocal reserved
+            with lock:
+                if tokens_used + reserved + DEFAULT_SONG_TOKEN_ESTIMATE > self.token_budget:
+                    return False
+                reserved += DEFAULT_SONG_TOKEN_ESTIMATE
+                return True
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = {}
+
+            def submit_next() -> None:
+                while pending and len(futures) < self.concurrency and reserve():
+                    target = pending.pop(0)
+                    futures[executor.submit(self._precompute_song, *target)] = target[0]
+
+            submit_next()
+            while futures:
+                future = next(as_completed(futures))
+                song_id = futures.pop(future)
+                with lock:
+                    reserved -= DEFAULT_SONG_TOKEN_ESTIMATE
+                try:
+                    tokens = future.result()
+                    with lock:
+                        tokens_used += tokens
+                    generated.append(song_id)
+                except Exception as e:
+                    failed += 1
+                    logging.error(f"Error precomputing analysis for song {song_id}: {e}")
+                submit_next()
+
+        return generated, failed, tokens_used
+
+    def _precompute_song(self, song_id: int, title: str, artist: str) -> int:
+        analysis, tokens = self.generate(song_id, title, artist)
+        db = self.session_factory()
+        try:
+            # A viewer may have triggered an analysis while this one was generating
+            save_first_analysis(db, song_id, analysis)
+            db.commit()
+        finally:
+            db.close()
+        return tokens
@@ -0,0 +1,436 @@
+import fcntl
+import hashlib
+import logging
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from .config import SessionLocal
+from . import models
+from .upserts import dialect_insert
+
+# Lock shards; keys are spread across them so requests from different clients rarely contend
+RATE_LIMIT_SHARDS = int(os.getenv("RATE_LIMIT_SHARDS", "64"))
+# Seconds between idle-key sweeps of a shard
+RATE_LIMIT_EVICT_INTERVAL = float(os.getenv("RATE_LIMIT_EVICT_INTERVAL", "60"))
+# Shared memory file of the shm backend; each limiter scope gets its own "<path>-<scope>" file
+RATE_LIMIT_SHM_PATH = os.getenv("RATE_LIMIT_SHM_PATH", "/dev/shm/lyrics-rate-limit")
+
+
+class _Shard:
+    __slots__ = ("lock", "counters", "swept_at", "pending", "touched")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # key -> [window index, requests in that window, requests in the window before]
+        self.counters: Dict[str, List[int]] = {}
+        self.swept_at = 0.0
+        # Not yet pushed to a shared backend: (key, window index) -> requests, and keys seen
+        self.pending: Dict[Tuple[str, int], int] = {}
+        self.touched: Set[str] = set()
+
+
+class SlidingWindowLimiter:
+    """
+    Sliding-window-counter rate limiter.
+
+    Each key keeps two integers: its request count in the current fixed window
+    and in the previous one. The sliding count is the previous count weighted
+    by how much of it still overlaps the window plus the current count, so a
+    check is O(1) and a key costs a few dozen bytes. Keys live in hash-sharded
+    dicts with one lock per shard. A shard drops keys idle for two windows,
+    which no longer carry any count, when it is next touched after
+    RATE_LIMIT_EVICT_INTERVAL seconds.
+    """
+
+    def __init__(
+        self,
+        limit: int,
+        window: float,
+        shards: int = RATE_LIMIT_SHARDS,
+        evict_interval: float = RATE_LIMIT_EVICT_INTERVAL,
+    ):
+        self.limit = limit
+        self.window = window
+        self.evict_interval = evict_interval
+        self._shards = [_Shard() for _ in range(shards)]
+
+    def _shard(self, key: str) -> _Shard:
+        return self._shards[hash(key) % len(self._shards)]
+
+    def hit(self, key: str, cost: int = 1, now: Optional[float] = None) -> Tuple[bool, float]:
+        """
+        Count a request of `cost` units for key if it fits within the limit.
+
+        Returns (allowed, retry_after): retry_after is 0 when allowed, else the
+        seconds until a request of the same cost would fit. Rejected requests
+        are not counted.
+        """
+        now = time.time() if now is None else now
+        index = int(now // self.window)
+        elapsed = now - index * self.window
+        shard = self._shard(key)
+
+        with shard.lock:
+            if now - shard.swept_at >= self.evict_interval:
+                self._sweep(shard, index)
+                shard.swept_at = now
+
+            current, previous = self._counts(shard, key, index)
+            estimate = previous * (1 - elapsed / self.window) + current
+            allowed = estimate + cost <= self.limit
+            self._record(shard, key, index, cost if allowed else 0)
+            if allowed:
+                shard.counters[key] = [index, current + cost, previous]
+                return True, 0.0
+            return False, self._retry_after(current, previous, elapsed, cost)
+
+    def adjust(self, key: str, delta: int, now: Optional[float] = None) -> None:
+        """
+        Add delta (negative to refund) to key's count in the current window
+        without checking the limit, e.g. to settle a cost once it is known.
+        """
+        now = time.time() if now is None else now
+        index = int(now // self.window)
+        shard = self._shard(key)
+        with shard.lock:
+            current, previous = self._counts(shard, key, index)
+            delta = max(delta, -current)
+            self._record(shard, key, index, delta)
+            shard.counters[key] = [index, current + delta, previous]
+
+    @staticmethod
+    def _counts(shard: _Shard, key: str, index: int) -> Tuple[int, int]:
+        """Key's (current, previous) counts as of window `index`."""
+        counter = shard.counters.get(key)
+        if counter is None or counter[0] < index - 1:
+            return 0, 0
+        if counter[0] == index - 1:
+            return 0, counter[1]
+        return counter[1], counter[2]
+
+    def _record(self, shard: _Shard, key: str, index: int, counted: int) -> None:
+        """Called under the shard lock for every check or adjustment; counted is 0 when rejected."""
+
+    def _retry_after(self, current: int, previous: int, elapsed: float, cost: int) -> float:
+        if cost > self.limit:
+            return math.inf
+        if current + cost <= self.limit:
+            # Waiting for enough of the previous window to slide out
+            return max(0.0, self.window * (1 - (self.limit - current - cost) / previous) - elapsed)
+        # The current window is full: wait for it to become the previous one and decay
+        into_next = self.window * (1 - (self.limit - cost) / current) if current else 0.0
+        return self.window - elapsed + max(0.0, into_next)
+
+    def _sweep(self, shard: _Shard, index: int) -> None:
+        idle = [key for key, counter in shard.counters.items() if counter[0] < index - 1]
+        for key in idle:
+            del shard.counters[key]
+
+    def reset(self, key: Optional[str] = None) -> None:
+        """Forget one key, or every key when key is None."""
+        for shard in self._shards if key is None else [self._shard(key)]:
+            with shard.lock:
+                if key is None:
+                    shard.counters.clear()
+                else:
+                    shard.counters.pop(key, None)
+
+    def __len__(self) -> int:
+        return sum(len(shard.counters) for shard in self._shards)
+
+    def start(self) -> None:
+        """Purely in-process; nothing runs in the background."""
+
+    def stop(self) -> None:
+        pass
+
+
+class RateLimitBackend:
+    """
+    Store of request counts shared by every process enforcing a limit.
+
+    Counts are keyed by window index, which only compares between windows of
+    the same length; pruning and eviction rely on that. A backend is bound to
+    the window length of the first limiter using it and rejects any other.
+    """
+
+    window: Optional[float] = None
+
+    def bind(self, window: float) -> None:
+        """Serve limiters of `window` seconds; raises ValueError once bound to another length."""
+        if self.window is not None and self.window != window:
+            raise ValueError(
+                f"Rate limit backend holds {self.window:g}s windows; a {window:g}s limiter needs its own backend"
+            )
+        self.window = window
+
+    def sync(self, increments: Dict[Tuple[str, int], int], keys: Iterable[str],
+             index: int) -> Dict[str, Tuple[int, int]]:
+        """
+        Add increments ({(key, window index): requests}) and return the shared
+        (current, previous) counts of every key in keys for window `index`.
+        """
+        raise NotImplementedError
+
+
+class SharedRateLimiter(SlidingWindowLimiter):
+    """
+    Sliding-window limiter whose counts are shared through a RateLimitBackend.
+
+    Checks stay in process against the last shared counts plus this process's
+    own requests since, so no request waits on the backend. A background
+    thread pushes the accumulated increments every `sync_interval` seconds in
+    one batch and pulls back the shared counts of the keys it saw. Processes
+    can jointly overshoot a limit by at most what they admit between syncs.
+    """
+
+    def __init__(
+        self,
+        limit: int,
+        window: float,
+        backend: RateLimitBackend,
+        sync_interval: float = float(os.getenv("RATE_LIMIT_SYNC_INTERVAL", "0.5")),
+        **kwargs,
+    ):
+        super().__init__(limit, window, **kwargs)
+        backend.bind(window)
+        self.backend = backend
+        self.sync_interval = sync_interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _record(self, shard: _Shard, key: str, index: int, counted: int) -> None:
+        shard.touched.add(key)
+        if counted:
+            shard.pending[(key, index)] = shard.pending.get((key, index), 0) + counted
+
+    def sync(self, now: Optional[float] = None) -> None:
+        """Push pending increments to the backend and refresh the shared counts of touched keys."""
+        now = time.time() if now is None else now
+        index = int(now // self.window)
+        increments: Dict[Tuple[str, int], int] = {}
+        keys: Set[str] = set()
+        for shard in self._shards:
+            with shard.lock:
+                increments.update(shard.pending)
+                keys |= shard.touched
+                shard.pending, shard.touched = {}, set()
+        if not keys:
+            return
+
+        try:
+            totals = self.backend.sync(increments, keys, index)
+        except Exception:
+            # Keep the increments for the next sync rather than losing them
+            for (key, window_index), count in increments.items():
+                shard = self._shard(key)
+                with shard.lock:
+                    shard.pending[(key, window_index)] = shard.pending.get((key, window_index), 0) + count
+                    shard.touched.add(key)
+            raise
+
+        for key, (current, previous) in totals.items():
+            shard = self._shard(key)
+            with shard.lock:
+                # Requests admitted here while the sync was in flight are not in the totals yet
+                current += shard.pending.get((key, index), 0)
+                shard.counters[key] = [index, current, previous]
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="rate-limit-sync", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread = None
+        try:
+            self.sync()
+        except Exception as e:
+            logging.error(f"Error syncing rate limit counts on shutdown: {e}")
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.sync_interval):
+            try:
+                self.sync()
+            except Exception as e:
+                logging.error(f"Error syncing rate limit counts: {e}")
+
+
+def _advance(state: Tuple[int, int, int], index: int) -> Tuple[int, int, int]:
+    """Move a (window index, current, previous) state forward to window `index`."""
+    window_index, current, previous = state
+    if window_index >= index:
+        return state
+    if window_index == index - 1:
+        return index, 0, current
+    return index, 0, 0
+
+
+def _add(state: Tuple[int, int, int], index: int, count: int) -> Tuple[int, int, int]:
+    window_index, current, previous = _advance(state, index)
+    if index == window_index:
+        return window_index, max(0, current + count), previous
+    if index == window_index - 1:
+        return window_index, current, max(0, previous + count)
+    return window_index, current, previous  # Too old to matter
+
+
+class SharedMemoryBackend(RateLimitBackend):
+    """
+    Counts in a memory-mapped file shared by the workers on one host.
+
+    Each limiter scope has its own file, so eviction only ever compares
+    windows of one length; a scope must keep one window length across
+    processes and restarts. The file is an open-addressing table of fixed-size slots keyed by a 64-bit
+    hash of the key; a batch holds an exclusive flock while it runs. When a
+    probe sequence is full, the slot with the oldest window is reused.
+    """
+
+    SLOT = struct.Struct("<QqII")  # key hash, window index, current, previous
+    PROBES = 8
+
+    def __init__(
+        self,
+        scope: str,
+        path: Optional[str] = None,
+        slots: int = int(os.getenv("RATE_LIMIT_SHM_SLOTS", "262144")),
+    ):
+        path = f"{RATE_LIMIT_SHM_PATH}-{scope}" if path is None else path
+        self.slots = slots
+        size = slots * self.SLOT.size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size < size:
+            os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little") | 1
+
+    def _find(self, key_hash: int, create: bool) -> Optional[int]:
+        oldest, oldest_window = None, None
+        for probe in range(self.PROBES):
+            slot = (key_hash + probe) % self.slots
+            stored_hash, window_index, _, _ = self.SLOT.unpack_from(self._map, slot * self.SLOT.size)
+            if stored_hash == key_hash:
+                return slot
+            if stored_hash == 0:
+                return slot if create else None
+            if oldest is None or window_index < oldest_window:
+                oldest, oldest_window = slot, window_index
+        if create:
+            self.SLOT.pack_into(self._map, oldest * self.SLOT.size, 0, 0, 0, 0)
+        return oldest if create else None
+
+    def sync(self, increments, keys, index):
+        by_key: Dict[str, List[Tuple[int, int]]] = {}
+        for (key, window_index), count in increments.items():
+            by_key.setdefault(key, []).append((window_index, count))
+
+        totals = {}
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            for key in set(keys) | set(by_key):
+                key_hash = self._hash(key)
+                slot = self._find(key_hash, create=key in by_key)
+                if slot is None:
+                    totals[key] = (0, 0)
+                    continue
+                offset = slot * self.SLOT.size
+                stored_hash, *state = self.SLOT.unpack_from(self._map, offset)
+                state = tuple(state) if stored_hash else (index, 0, 0)
+                for window_index, count in sorted(by_key.get(key, ())):
+                    state = _add(state, window_index, count)
+                state = _advance(state, index)
+                self.SLOT.pack_into(self._map, offset, key_hash, *state)
+                totals[key] = (state[1], state[2]) if state[0] == index else (0, 0)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return totals
+
+
+class DatabaseBackend(RateLimitBackend):
+    """
+    Counts in the rate_limit_counters table, shared by every node.
+
+    Rows are scoped to one limiter, so limiters with different windows can
+    share the table; a scope must keep one window length across nodes. A batch is one INSERT ... ON CONFLICT that adds to the
+    counters, one SELECT of the current and previous windows for the touched
+    keys, and an occasional DELETE of the scope's windows that no longer matter.
+    """
+
+    PRUNE_EVERY = 100  # Syncs between deletes of expired windows
+    KEY_CHUNK = 500  # Keys per SELECT ... IN
+
+    def __init__(self, scope: str, session_factory: Callable[[], Session] = SessionLocal):
+        self.scope = scope
+        self.session_factory = session_factory
+        self._syncs = 0
+
+    def sync(self, increments, keys, index):
+        table = models.RateLimitCounter.__table__
+        db = self.session_factory()
+        try:
+            if increments:
+                stmt = dialect_insert(db, table)
+                db.execute(
+                    stmt.on_conflict_do_update(
+                        index_elements=[table.c.scope, table.c.key, table.c.window_index],
+                        set_={"count": table.c.count + stmt.excluded.count}
+                    ),
+                    [
+                        {"scope": self.scope, "key": key, "window_index": window_index, "count": count}
+                        for (key, window_index), count in increments.items()
+                    ]
+                )
+
+            totals = {key: (0, 0) for key in keys}
+            keys = list(keys)
+            for start in range(0, len(keys), self.KEY_CHUNK):
+                rows = db.execute(
+                    select(table.c.key, table.c.window_index, table.c.count).where(
+                        table.c.scope == self.scope,
+                        table.c.key.in_(keys[start:start + self.KEY_CHUNK]),
+                        table.c.window_index.in_([index - 1, index])
+                    )
+                )
+                for key, window_index, count in rows:
+                    current, previous = totals[key]
+                    totals[key] = (count, previous) if window_index == index else (current, count)
+
+            self._syncs += 1
+            if self._syncs % self.PRUNE_EVERY == 0:
+                db.execute(delete(table).where(table.c.scope == self.scope, table.c.window_index < index - 1))
+            db.commit()
+            return totals
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+
+def build_rate_limiter(limit: int, window: float, scope: str,
+                       backend: str = os.getenv("RATE_LIMIT_BACKEND", "memory")) -> SlidingWindowLimiter:
+    """
+    Limiter for RATE_LIMIT_BACKEND: memory (per process), shm (per host) or
+    database (all nodes). scope names the limiter; limiters never share counts
+    across scopes, even when their keys coincide.
+    """
+    if backend == "memory":
+        return SlidingWindowLimiter(limit, window)
+    if backend == "shm":
+        return SharedRateLimiter(limit, window, SharedMemoryBackend(scope))
+    if backend == "database":
+        return SharedRateLimiter(limit, window, DatabaseBackend(scope))
+    raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {backend}")
@@ -0,0 +1,137 @@
+import logging
+import os
+import threading
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from .config import SessionLocal
+from . import models
+from .analysis_store import get_latest_analysis, save_analysis_version
+
+# Upvote count at which a comment is folded back into the song's analysis
+UPVOTE_REANALYSIS_THRESHOLD = 10
+
+# Seconds to collect newly qualifying comments before re-analyzing a song
+REANALYSIS_DEBOUNCE_SECONDS = float(os.getenv("REANALYSIS_DEBOUNCE_SECONDS", "30"))
+
+# reanalyze(old_analysis, comments, artist, track) -> updated analysis
+Reanalyzer = Callable[[dict, List[str], str, str], dict]
+
+
+def crossed_threshold(previous_count: int, new_count: int,
+                      threshold: int = UPVOTE_REANALYSIS_THRESHOLD) -> bool:
+    """True only for the upvote that takes a comment across the threshold."""
+    return (previous_count or 0) < threshold <= (new_count or 0)
+
+
+class ReanalysisScheduler:
+    """
+    Coalesces re-analysis work off the request path.
+
+    The first qualifying comment for a song opens a debounce window; every
+    comment that qualifies before the window closes joins the same batch, and
+    the batch is folded into the latest analysis with a single LLM call on a
+    background thread.
+    """
+
+    def __init__(
+        self,
+        reanalyze: Reanalyzer,
+        session_factory: Callable[[], Session] = SessionLocal,
+        debounce_seconds: float = REANALYSIS_DEBOUNCE_SECONDS,
+    ):
+        self.reanalyze = reanalyze
+        self.session_factory = session_factory
+        self.debounce_seconds = debounce_seconds
+        self._pending: Dict[int, List[int]] = {}
+        self._timers: Dict[int, threading.Timer] = {}
+        self._song_locks: Dict[int, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def schedule(self, song_id: int, comment_id: int) -> None:
+        """Queue a comment for the next re-analysis of its song."""
+        with self._lock:
+            pending = self._pending.setdefault(song_id, [])
+            if comment_id not in pending:
+                pending.append(comment_id)
+            if song_id in self._timers:
+                return  # A window is already open for this song
+
+            timer = threading.Timer(self.debounce_seconds, self._run, args=(song_id,))
+            timer.daemon = True
+            self._timers[song_id] = timer
+            timer.start()
+
+    def pending(self, song_id: int) -> List[int]:
+        """Comment ids waiting for the song's next re-analysis."""
+        with self._lock:
+            return list(self._pending.get(song_id, []))
+
+    def flush(self) -> None:
+        """Close every open window now and run its batch on the calling thread."""
+        with self._lock:
+            song_ids = list(self._timers)
+            for timer in self._timers.values():
+                timer.cancel()
+        for song_id in song_ids:
+            self._run(song_id)
+
+    def shutdown(self) -> None:
+        """Cancel open windows; batches that have not started are dropped."""
+        with self._lock:
+            for timer in self._timers.values():
+                timer.cancel()
+            dropped = sum(len(ids) for ids in self._pending.values())
+            self._timers.clear()
+            self._pending.clear()
+        if dropped:
+            logging.warning(f"Dropped {dropped} pending re-analysis comment(s) on shutdown")
+
+    def _song_lock(self, song_id: int) -> threading.Lock:
+        with self._lock:
+            return self._song_locks.setdefault(song_id, threading.Lock())
+
+    def _run(self, song_id: int) -> None:
+        with self._lock:
+            self._timers.pop(song_id, None)
+            comment_ids = self._pending.pop(song_id, [])
+        if not comment_ids:
+            return
+
+        # Batches for the same song must not race on the next version number
+        with self._song_lock(song_id):
+            db = self.session_factory()
+            try:
+                self._reanalyze_song(db, song_id, comment_ids)
+            except Exception as e:
+                db.rollback()
+                logging.error(f"Error during re-analysis of song {song_id}: {e}")
+            finally:
+                db.close()
+
+    def _reanalyze_song(self, db: Session, song_id: int, comment_ids: List[int]) -> Optional[models.Analysis]:
+        latest_analysis = get_latest_analysis(db, song_id)
+        if not latest_analysis:
+            return None
+
+        comments = db.query(models.Comment).filter(
+            models.Comment.id.in_(comment_ids)
+        ).order_by(models.Comment.upvote_count.desc()).all()
+        if not comments:
+            return None
+
+        song_reference = db.query(models.ExternalSongReference).filter(
+            models.ExternalSongReference.external_id == song_id
+        ).first()
+
+        updated_analysis = self.reanalyze(
+            latest_analysis.analysis_data,
+            [comment.content for comment in comments],
+            song_reference.artist if song_reference else "Unknown",
+            song_reference.title if song_reference else "Unknown",
+        )
+
+        new_analysis = save_analysis_version(db, song_id, updated_analysis)
+        db.commit()
+        return new_analysis
@@ -0,0 +1,216 @@
+import itertools
+import logging
+import os
+import threading
+import time
+from typing import AsyncIterator, Iterator, List, Optional
+
+from fastapi import Request
+from sqlalchemy import create_engine, exc, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from .async_db import AsyncSessionLocal, async_database_url
+from .config import SessionLocal
+from .db_pool import PoolMetrics, pool_options
+
+# Read replicas as comma-separated database URLs; empty means every read goes to the primary
+DATABASE_REPLICA_URLS = os.getenv("DATABASE_REPLICA_URLS", "")
+# Seconds between replica health checks
+REPLICA_HEALTH_INTERVAL = float(os.getenv("REPLICA_HEALTH_INTERVAL", "5"))
+# Seconds after a write during which the same client reads from the primary
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+# Cookie carrying the time until which a client reads from the primary
+READ_YOUR_WRITES_COOKIE = "read_primary_until"
+
+
+class ReplicaSession(Session):
+    """
+    Read-only session bound to a replica. A statement that fails with an
+    OperationalError takes the replica out of rotation and is retried once on
+    the primary (info["primary_bind"]), so a replica failing mid-request
+    costs a retry instead of a 500. Failures outside execute/scalar/scalars,
+    such as a failed commit, still raise.
+    """
+
+    def execute(self, *args, **kw):
+        return self._on_primary_after_failure(super().execute, *args, **kw)
+
+    def scalar(self, *args, **kw):
+        return self._on_primary_after_failure(super().scalar, *args, **kw)
+
+    def scalars(self, *args, **kw):
+        return self._on_primary_after_failure(super().scalars, *args, **kw)
+
+    def _on_primary_after_failure(self, method, *args, **kw):
+        try:
+            return method(*args, **kw)
+        except exc.OperationalError as e:
+            primary = self.info.get("primary_bind")
+            if primary is None or self.bind is primary:
+                raise
+            self.info["replica"].mark(False, str(e))
+            self.rollback()
+            self.bind = primary
+            return method(*args, **kw)
+
+
+class Replica:
+    """One read replica with its own sync and async engines and health state."""
+
+    def __init__(self, name: str, url: str, primary_bind=None, primary_async_bind=None):
+        self.name = name
+        self.url = url
+        self.pool_metrics = PoolMetrics(name)
+        self.async_pool_metrics = PoolMetrics(f"{name} async")
+        self.engine = create_engine(url, **pool_options(self.pool_metrics))
+        self.async_engine = create_async_engine(
+            async_database_url(url), **pool_options(self.async_pool_metrics, asyncio=True)
+        )
+        self.session_factory = sessionmaker(
+            class_=ReplicaSession, autocommit=False, autoflush=False, bind=self.engine,
+            info={"replica": self, "primary_bind": primary_bind}
+        )
+        self.async_session_factory = async_sessionmaker(
+            self.async_engine, sync_session_class=ReplicaSession, autoflush=False, expire_on_commit=False,
+            info={"replica": self, "primary_bind": primary_async_bind.sync_engine if primary_async_bind else None}
+        )
+        self.healthy = True
+        self.last_error: Optional[str] = None
+
+    def mark(self, healthy: bool, error: Optional[str] = None) -> None:
+        if healthy != self.healthy:
+            if healthy:
+                logging.info(f"Read replica {self.name} is back; routing reads to it")
+            else:
+                logging.warning(f"Read replica {self.name} is down ({error}); reading from the primary")
+        self.healthy = healthy
+        self.last_error = error
+
+    def check(self) -> None:
+        try:
+            with self.engine.connect() as connection:
+                connection.execute(text("SELECT 1"))
+            self.mark(True)
+        except Exception as e:
+            self.mark(False, str(e))
+
+    def metrics(self) -> dict:
+        return {
+            "healthy": self.healthy,
+            "last_error": self.last_error,
+            "pool": self.pool_metrics.snapshot(),
+            "async_pool": self.async_pool_metrics.snapshot(),
+        }
+
+
+class ReplicaRouter:
+    """
+    Routes read-only sessions to healthy replicas, round robin.
+
+    Reads fall back to the primary when no replica is healthy and for
+    clients that wrote within READ_YOUR_WRITES_SECONDS (see
+    ReadYourWritesMiddleware). Replicas are checked every
+    REPLICA_HEALTH_INTERVAL seconds, and one that fails a query is taken out
+    of rotation until its next successful check; the failed query is retried
+    on the primary (see ReplicaSession).
+    """
+
+    def __init__(
+        self,
+        urls: Optional[List[str]] = None,
+        primary_session_factory=SessionLocal,
+        primary_async_session_factory=AsyncSessionLocal,
+        health_interval: float = REPLICA_HEALTH_INTERVAL,
+    ):
+        if urls is None:
+            urls = [url.strip() for url in DATABASE_REPLICA_URLS.split(",") if url.strip()]
+        self.replicas = [
+            Replica(
+                f"replica{index}", url,
+                primary_session_factory.kw.get("bind"), primary_async_session_factory.kw.get("bind")
+            )
+            for index, url in enumerate(urls)
+        ]
+        self.primary_session_factory = primary_session_factory
+        self.primary_async_session_factory = primary_async_session_factory
+        self.health_interval = health_interval
+        self._next = itertools.count()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def choose(self, request: Optional[Request] = None) -> Optional[Replica]:
+        """The replica to read from, or None for the primary."""
+        if request is not None and wrote_recently(request):
+            return None
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return None
+        return healthy[next(self._next) % len(healthy)]
+
+    def check_health(self) -> None:
+        for replica in self.replicas:
+            replica.check()
+
+    def metrics(self) -> dict:
+        return {replica.name: replica.metrics() for replica in self.replicas}
+
+    def read_session(self, request: Optional[Request] = None) -> Iterator[Session]:
+        replica = self.choose(request)
+        db = (replica.session_factory if replica else self.primary_session_factory)()
+        try:
+            yield db
+        except exc.OperationalError as e:
+            if replica is not None:
+                replica.mark(False, str(e))
+            raise
+        finally:
+            db.close()
+
+    async def async_read_session(self, request: Optional[Request] = None) -> AsyncIterator[AsyncSession]:
+        replica = self.choose(request)
+        async with (replica.async_session_factory if replica else self.primary_async_session_factory)() as db:
+            try:
+                yield db
+            except exc.OperationalError as e:
+                if replica is not None:
+                    replica.mark(False, str(e))
+                raise
+
+    def start(self) -> None:
+        if self.replicas and self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="replica-health", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread = None
+
+    def _loop(self) -> None:
+        wait = 0.0
+        while not self._stop.wait(wait):
+            wait = self.health_interval
+            self.check_health()
+
+
+def wrote_recently(request: Request) -> bool:
+    try:
+        return float(request.cookies.get(READ_YOUR_WRITES_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+# Shared router; configured from DATABASE_REPLICA_URLS
+replica_router = ReplicaRouter()
+
+
+def get_read_db(request: Request) -> Iterator[Session]:
+    """get_db for read-only endpoints: a replica session when one is usable, else the primary."""
+    yield from replica_router.read_session(request)
+
+
+async def get_async_read_db(request: Request) -> AsyncIterator[AsyncSession]:
+    """get_async_db for read-only endpoints, routed like get_read_db."""
+    async for db in replica_router.async_read_session(request):
+        yield db
@@ -18,8 +18,12 @@ class Song(SongBase):
 
     model_config = ConfigDict(from_attributes=True)
 
+class TrendingSong(Song):
+    trending_score: float
+    window_views: int
+
 class AnalysisBase(BaseModel):
-    analysis_data: str
+    analysis_data: Optional[dict] = None
 
 class AnalysisCreate(AnalysisBase):
     song_id: int
@@ -33,12 +37,18 @@ class Analysis(AnalysisBase):
 
     model_config = ConfigDict(from_attributes=True)
 
+class AnalysisHeadline(BaseModel):
+    song_id: int
+    version: int
+    overallHeadline: Optional[str] = None
+
 class PaginatedResponse(BaseModel):
     items: List[Song]
     total: int
     page: int
     size: int
     pages: int
+    next_cursor: Optional[str] = None  # Pass back as `cursor` for keyset paging
 
 class UserBase(BaseModel):
     username: str
@@ -69,3 +79,8 @@ class CommentResponse(CommentBase):
     upvote_count: int = 0  # Add upvote count field
 
     model_config = ConfigDict(from_attributes=True)
+
+class TopComments(BaseModel):
+    song_id: int
+    comment_count: int
+    comments: List[CommentResponse]
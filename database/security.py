@@ -1,20 +1,20 @@
 from datetime import datetime, timedelta
-from typing import Optional, Callable
-from fastapi import HTTPException, Depends, Request, status
+from typing import Optional, Tuple
+from fastapi import HTTPException, Depends, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials, OAuth2PasswordBearer
 from sqlalchemy.orm import Session
-from .config import get_db
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+from .async_db import get_async_db
 from . import models
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.types import ASGIApp
+from .rate_limit import SlidingWindowLimiter, build_rate_limiter
+from starlette.types import ASGIApp, Receive, Scope, Send
+from .passwords import HashingPoolBusy, PasswordHasher, hashing_unavailable
+from .tokens import TOKEN_CACHE_SECONDS, TTLCache, TokenDenyList, TokenSigner
 import os
-import hashlib
-import hmac
-import json
-import base64
+import math
+import secrets
 import time
-from collections import defaultdict
-import threading
 
 # Rate limiting
 ENV = os.getenv("ENV", "development")
@@ -25,97 +25,173 @@ else:
     RATE_LIMIT_WINDOW = 60  # 1 minute for production
     RATE_LIMIT_MAX_REQUESTS = 100  # 100 requests per minute for production
 
-# In-memory rate limiting storage
-request_counts = defaultdict(list)
-rate_limit_lock = threading.Lock()
+# Rate limit units per request by path; unlisted paths cost 1.
+# RATE_LIMIT_ROUTE_COSTS overrides them, e.g. "/re_analyze=10,/analyze_lyrics=5"
+RATE_LIMIT_ROUTE_COSTS = {"/analyze_lyrics": 5, "/re_analyze": 10}
+for _route_cost in filter(None, os.getenv("RATE_LIMIT_ROUTE_COSTS", "").split(",")):
+    _path, _cost = _route_cost.rsplit("=", 1)
+    RATE_LIMIT_ROUTE_COSTS[_path.strip()] = int(_cost)
+
+# Rate limiting storage: in-process unless RATE_LIMIT_BACKEND shares it across workers or nodes
+rate_limiter = build_rate_limiter(RATE_LIMIT_MAX_REQUESTS, RATE_LIMIT_WINDOW, "requests")
+
+password_hasher = PasswordHasher()
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash."""
-    return hmac.compare_digest(
-        hashed_password.encode(),
-        hashlib.sha256(plain_password.encode()).hexdigest().encode()
-    )
+    return password_hasher.verify(plain_password, hashed_password)[0]
 
 def get_password_hash(password: str) -> str:
-    """Generate a password hash."""
-    return hashlib.sha256(password.encode()).hexdigest()
-
-def check_rate_limit(request: Request) -> bool:
-    """Check if the request is within rate limits"""
-    if ENV == "test":
-        return True  # Skip rate limiting in test environment
-    
-    client_ip = request.client.host
-    current_time = time.time()
-    
-    with rate_limit_lock:
-        # Clean old requests
-        request_counts[client_ip] = [
-            req_time for req_time in request_counts[client_ip]
-            if current_time - req_time < RATE_LIMIT_WINDOW
-        ]
-        
-        # Check if limit is exceeded
-        if len(request_counts[client_ip]) >= RATE_LIMIT_MAX_REQUESTS:
-            return False
-        
-        # Add new request
-        request_counts[client_ip].append(current_time)
-        return True
-
-class RateLimitMiddleware(BaseHTTPMiddleware):
-    def __init__(self, app: ASGIApp):
-        super().__init__(app)
-
-    async def dispatch(self, request: Request, call_next: Callable):
-        if not check_rate_limit(request):
-            raise HTTPException(
-                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                detail="Too many requests"
-            )
-        return await call_next(request)
+    """Generate a bcrypt password hash."""
+    return password_hasher.hash(password)
+
+def check_rate_limit(client_ip: str, cost: int = 1) -> Tuple[bool, float]:
+    """Count a request from client_ip; returns (allowed, seconds until it would be allowed)."""
+    return rate_limiter.hit(client_ip, cost=cost)
+
+def client_ip(scope: Scope) -> str:
+    """Client address of an ASGI scope (request.scope); "unknown" when the server reports none."""
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+class RateLimitMiddleware:
+    """
+    Pure ASGI rate limiting by client IP.
+
+    Each request costs its path's RATE_LIMIT_ROUTE_COSTS weight. Rejected requests get a 429 with Retry-After before reaching the app;
+    allowed ones are passed through untouched, so streaming responses work.
+    """
+
+    def __init__(self, app: ASGIApp, limiter: Optional[SlidingWindowLimiter] = None,
+                 enabled: Optional[bool] = None, route_costs: Optional[dict] = None):
+        self.app = app
+        self.limiter = limiter
+        self.route_costs = RATE_LIMIT_ROUTE_COSTS if route_costs is None else route_costs
+        self.enabled = ENV != "test" if enabled is None else enabled  # Skip rate limiting in test environment
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        ip = client_ip(scope)
+        cost = self.route_costs.get(scope["path"], 1)
+        if self.limiter is None:
+            allowed, retry_after = check_rate_limit(ip, cost)
+        else:
+            allowed, retry_after = self.limiter.hit(ip, cost=cost)
+        if allowed:
+            await self.app(scope, receive, send)
+            return
+
+        body = b'{"detail":"Too many requests"}'
+        await send({
+            "type": "http.response.start",
+            "status": status.HTTP_429_TOO_MANY_REQUESTS,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(min(retry_after, RATE_LIMIT_WINDOW)))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
 
 # Database-based authentication
 class DBAuth:
     def create_user(self, username: str, password: str, db: Session, email: Optional[str] = None) -> models.User:
         """Create a new user."""
-        # Check if username already exists
-        if db.query(models.User).filter(models.User.username == username).first():
-            raise HTTPException(status_code=400, detail="Username already registered")
-        
-        # Check if email already exists
-        if email and db.query(models.User).filter(models.User.email == email).first():
-            raise HTTPException(status_code=400, detail="Email already registered")
-        
+        self._check_available(db, username, email)
+
         # Create new user
-        hashed_password = get_password_hash(password)
+        try:
+            hashed_password = get_password_hash(password)
+        except HashingPoolBusy:
+            raise hashing_unavailable()
         db_user = models.User(
             username=username,
             hashed_password=hashed_password,
             email=email
         )
-        db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
+        self._save(db, db_user)
         return db_user
 
     def authenticate_user(self, username: str, password: str, db: Session) -> Optional[models.User]:
         """Authenticate a user."""
         user = db.query(models.User).filter(models.User.username == username).first()
-        if not user or not verify_password(password, user.hashed_password):
+        if not user:
+            return None
+        try:
+            verified, new_hash = password_hasher.verify(password, user.hashed_password)
+        except HashingPoolBusy:
+            raise hashing_unavailable()
+        if not verified:
             return None
+        if new_hash:
+            # Upgrade legacy SHA-256 hashes (or outdated bcrypt rounds) now that we have the password
+            user.hashed_password = new_hash
+            db.commit()
         return user
 
+    async def create_user_async(self, username: str, password: str, db: Session,
+                                email: Optional[str] = None) -> models.User:
+        """
+        create_user for async endpoints. Only the short database steps take a
+        threadpool thread; the hash is awaited on the event loop.
+        """
+        await run_in_threadpool(self._check_available, db, username, email)
+        try:
+            hashed_password = await password_hasher.hash_async(password)
+        except HashingPoolBusy:
+            raise hashing_unavailable()
+        db_user = models.User(username=username, hashed_password=hashed_password, email=email)
+        await run_in_threadpool(self._save, db, db_user)
+        return db_user
+
+    async def authenticate_user_async(self, username: str, password: str, db: Session) -> Optional[models.User]:
+        """authenticate_user for async endpoints."""
+        user = await run_in_threadpool(
+            lambda: db.query(models.User).filter(models.User.username == username).first()
+        )
+        if not user:
+            return None
+        try:
+            verified, new_hash = await password_hasher.verify_async(password, user.hashed_password)
+        except HashingPoolBusy:
+            raise hashing_unavailable()
+        if not verified:
+            return None
+        if new_hash:
+            user.hashed_password = new_hash
+            await run_in_threadpool(self._save, db, user)
+        return user
+
+    def _check_available(self, db: Session, username: str, email: Optional[str]) -> None:
+        if db.query(models.User).filter(models.User.username == username).first():
+            raise HTTPException(status_code=400, detail="Username already registered")
+        if email and db.query(models.User).filter(models.User.email == email).first():
+            raise HTTPException(status_code=400, detail="Email already registered")
+
+    def _save(self, db: Session, user: models.User) -> None:
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+
 # Create a global auth instance
 auth = DBAuth()
 
+# Token signing, verified-claim and user caches, and revocation
+token_signer = TokenSigner()
+token_deny_list = TokenDenyList()
+verified_claims = TTLCache()
+user_cache = TTLCache()
+
 # Dependency for getting current user
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(HTTPBearer()),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> models.User:
     """Get the current user from the token."""
-    user = verify_token(credentials.credentials, db)
+    user = await verify_token_async(credentials.credentials, db)
     if not user:
         raise HTTPException(
             status_code=401,
@@ -124,71 +200,81 @@ async def get_current_user(
         )
     return user
 
+async def get_optional_user(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(HTTPBearer(auto_error=False)),
+    db: AsyncSession = Depends(get_async_db)
+) -> Optional[models.User]:
+    """Get the current user from the token, or None for anonymous requests."""
+    if credentials is None:
+        return None
+    return await verify_token_async(credentials.credentials, db)
+
 def generate_token(user: models.User) -> str:
-    """Generate a JWT-like token without a secret key."""
-    # Create header
-    header = {
-        "alg": "HS256",
-        "typ": "JWT"
-    }
-    
-    # Create payload
-    payload = {
+    """Generate a JWT-like token signed with the active server key."""
+    now = datetime.utcnow()
+    return token_signer.sign({
         "sub": str(user.id),
         "username": user.username,
-        "exp": (datetime.utcnow() + timedelta(days=1)).timestamp(),
-        "iat": datetime.utcnow().timestamp()
-    }
-    
-    # Encode header and payload
-    encoded_header = base64.urlsafe_b64encode(json.dumps(header).encode()).decode().rstrip('=')
-    encoded_payload = base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
-    
-    # Create signature using user's password hash
-    signature_input = f"{encoded_header}.{encoded_payload}"
-    signature = hmac.new(
-        user.hashed_password.encode(),
-        signature_input.encode(),
-        hashlib.sha256
-    ).hexdigest()
-    
-    # Combine all parts
-    return f"{encoded_header}.{encoded_payload}.{signature}"
+        "exp": (now + timedelta(days=1)).timestamp(),
+        "iat": now.timestamp(),
+        "jti": secrets.token_urlsafe(16)
+    })
 
-def verify_token(token: str, db: Session) -> Optional[models.User]:
-    """Verify a JWT-like token."""
-    try:
-        # Split token
-        header_b64, payload_b64, signature = token.split('.')
-        
-        # Add padding back
-        header_b64 += '=' * (4 - len(header_b64) % 4)
-        payload_b64 += '=' * (4 - len(payload_b64) % 4)
-        
-        # Decode header and payload
-        header = json.loads(base64.urlsafe_b64decode(header_b64))
-        payload = json.loads(base64.urlsafe_b64decode(payload_b64))
-        
-        # Check expiration
-        if datetime.utcnow().timestamp() > payload['exp']:
-            return None
-        
-        # Get user
-        user = db.query(models.User).filter(models.User.id == int(payload['sub'])).first()
-        if not user:
-            return None
-        
-        # Verify signature
-        signature_input = f"{header_b64.rstrip('=')}.{payload_b64.rstrip('=')}"
-        expected_signature = hmac.new(
-            user.hashed_password.encode(),
-            signature_input.encode(),
-            hashlib.sha256
-        ).hexdigest()
-        
-        if not hmac.compare_digest(signature, expected_signature):
+def verify_token_claims(token: str) -> Optional[dict]:
+    """
+    Claims of a valid, unrevoked token, without touching the database.
+
+    Verified claims are cached for TOKEN_CACHE_SECONDS (never past the token's
+    expiry); the deny-list is checked on every call so revocation is immediate.
+    """
+    claims = verified_claims.get(token)
+    if claims is None:
+        claims = token_signer.verify(token)
+        if claims is None:
             return None
-        
-        return user
-    except:
-        return None 
\ No newline at end of file
+        ttl = min(TOKEN_CACHE_SECONDS, claims["exp"] - time.time())
+        if ttl > 0:
+            verified_claims.put(token, claims, ttl)
+    if claims.get("jti") in token_deny_list:
+        return None
+    return claims
+
+def _cached_user(claims: dict) -> Optional[models.User]:
+    user = user_cache.get(int(claims["sub"]))
+    if user is None or user.username != claims["username"]:  # Ids can be reused after a delete
+        return None
+    return user
+
+def _load_user(db: Session, claims: dict) -> Optional[models.User]:
+    user_id = int(claims["sub"])
+    user = db.query(models.User).filter(models.User.id == user_id).first()
+    if not user or not user.is_active:
+        return None
+    # Detach it so later commits in this session don't expire the cached copy
+    db.expunge(user)
+    user_cache.put(user_id, user, TOKEN_CACHE_SECONDS)
+    return user
+
+def verify_token(token: str, db: Session) -> Optional[models.User]:
+    """Verify a token and return its user, served from a short-lived cache when possible."""
+    claims = verify_token_claims(token)
+    if claims is None:
+        return None
+    return _cached_user(claims) or _load_user(db, claims)
+
+async def verify_token_async(token: str, db: AsyncSession) -> Optional[models.User]:
+    """verify_token for async sessions; cache hits never touch the database."""
+    claims = verify_token_claims(token)
+    if claims is None:
+        return None
+    return _cached_user(claims) or await db.run_sync(_load_user, claims)
+
+def revoke_token(token: str, db: Session) -> bool:
+    """Deny a valid token for the rest of its lifetime and commit; False if it was not valid."""
+    claims = verify_token_claims(token)
+    if claims is None or "jti" not in claims:
+        return False
+    token_deny_list.revoke(db, claims["jti"], claims["exp"])
+    db.commit()
+    verified_claims.pop(token)
+    return True
@@ -0,0 +1,188 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import weakref
+from collections import defaultdict
+from typing import AsyncIterator, Dict, Optional, Set
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from . import models
+
+# Events buffered per subscriber before it is cut off as too slow
+SUBSCRIBER_QUEUE_SIZE = int(os.getenv("SUBSCRIBER_QUEUE_SIZE", "100"))
+# Open subscriptions allowed per worker
+MAX_SUBSCRIBERS = int(os.getenv("MAX_SUBSCRIBERS", "10000"))
+# Seconds between keep-alive comments on an idle stream
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "25"))
+
+
+class TooManySubscribers(Exception):
+    """The worker already holds MAX_SUBSCRIBERS subscriptions."""
+
+
+class Subscription:
+    """One client's queue of pre-encoded events for a song."""
+
+    __slots__ = ("song_id", "queue", "overflowed")
+
+    def __init__(self, song_id: int, queue_size: int):
+        self.song_id = song_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.overflowed = False
+
+
+class SongEventHub:
+    """
+    In-process fan-out of per-song events to Server-Sent Event streams.
+
+    An idle subscriber is a small queue and a suspended generator, so a worker
+    can hold thousands of them. Publishing is safe from any thread: the event
+    is encoded once and handed to the event loop in a single callback that
+    fills every queue for the song. A subscriber whose queue fills up is
+    dropped with a `resync` event instead of slowing the publisher.
+    """
+
+    def __init__(self, queue_size: int = SUBSCRIBER_QUEUE_SIZE, max_subscribers: int = MAX_SUBSCRIBERS):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self._subscribers: Dict[int, Set[Subscription]] = defaultdict(set)
+        self._count = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    def subscribe(self, song_id: int) -> Subscription:
+        """Open a subscription; must be called on the event loop."""
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                raise TooManySubscribers()
+            self._loop = asyncio.get_running_loop()
+            subscription = Subscription(song_id, self.queue_size)
+            self._subscribers[song_id].add(subscription)
+            self._count += 1
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.song_id)
+            if subscribers and subscription in subscribers:
+                subscribers.discard(subscription)
+                self._count -= 1
+                if not subscribers:
+                    del self._subscribers[subscription.song_id]
+
+    def subscriber_count(self, song_id: Optional[int] = None) -> int:
+        with self._lock:
+            if song_id is None:
+                return self._count
+            return len(self._subscribers.get(song_id, ()))
+
+    def publish(self, song_id: int, event_type: str, data: dict) -> None:
+        """Send an event to every subscriber of the song. Cheap when there are none."""
+        with self._lock:
+            if not self._subscribers.get(song_id) or self._loop is None:
+                return
+            loop = self._loop
+        message = f"event: {event_type}\ndata: {json.dumps(data, default=str)}\n\n"
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._deliver(song_id, message)
+        else:
+            try:
+                loop.call_soon_threadsafe(self._deliver, song_id, message)
+            except RuntimeError:
+                pass  # The loop has shut down
+
+    def _deliver(self, song_id: int, message: str) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers.get(song_id, ()))
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                subscription.overflowed = True
+                self.unsubscribe(subscription)
+
+    async def stream(self, subscription: Subscription,
+                     heartbeat: float = SSE_HEARTBEAT_SECONDS) -> AsyncIterator[str]:
+        """SSE body for a subscription; unsubscribes when the client goes away."""
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscription.queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    if subscription.overflowed:
+                        break
+                    yield ": keep-alive\n\n"
+                    continue
+                yield message
+                if subscription.overflowed and subscription.queue.empty():
+                    break
+            # Dropped for falling behind: the client should refetch and resubscribe
+            yield "event: resync\ndata: {}\n\n"
+        finally:
+            self.unsubscribe(subscription)
+
+    def track_analysis_commits(self) -> None:
+        """
+        Publish an `analysis` event whenever a session commits a new Analysis
+        version, whichever code path (request, re-analysis, precompute) wrote it.
+        """
+        with _analysis_hubs_lock:
+            if not _analysis_hubs:
+                event.listen(Session, "after_flush", _collect_new_analyses)
+                event.listen(Session, "after_commit", _publish_new_analyses)
+                event.listen(Session, "after_rollback", _discard_new_analyses)
+            _analysis_hubs.add(self)
+
+
+_analysis_hubs: "weakref.WeakSet[SongEventHub]" = weakref.WeakSet()
+_analysis_hubs_lock = threading.Lock()
+
+
+def _collect_new_analyses(session: Session, flush_context) -> None:
+    # Tagged with the savepoint they were flushed in, if any, so rolling it back drops only them
+    savepoint = session.get_nested_transaction()
+    for instance in session.new:
+        if isinstance(instance, models.Analysis):
+            analysis = instance.analysis_data if isinstance(instance.analysis_data, dict) else {}
+            session.info.setdefault("new_analyses", []).append(
+                (savepoint, instance.external_song_id, instance.version, analysis.get("overallHeadline"))
+            )
+
+
+def _publish_new_analyses(session: Session) -> None:
+    savepoint = session.get_nested_transaction()
+    if savepoint is not None:
+        # Released savepoint: its analyses now belong to the enclosing transaction
+        parent = savepoint.parent if savepoint.parent.nested else None
+        session.info["new_analyses"] = [
+            (parent if tagged is savepoint else tagged, *rest)
+            for tagged, *rest in session.info.get("new_analyses", [])
+        ]
+        return
+
+    new_analyses = session.info.pop("new_analyses", [])
+    for hub in list(_analysis_hubs):
+        for _, song_id, version, headline in new_analyses:
+            try:
+                hub.publish(song_id, "analysis", {"song_id": song_id, "version": version, "overallHeadline": headline})
+            except Exception as e:
+                logging.error(f"Error publishing analysis event for song {song_id}: {e}")
+
+
+def _discard_new_analyses(session: Session) -> None:
+    savepoint = session.get_nested_transaction()
+    if savepoint is None:
+        session.info.pop("new_analyses", None)
+        return
+    session.info["new_analyses"] = [
+        entry for entry in session.info.get("new_analyses", []) if entry[0] is not savepoint
+    ]
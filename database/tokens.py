@@ -0,0 +1,200 @@
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from .config import SessionLocal
+from . import models
+from .upserts import dialect_insert
+
+ENV = os.getenv("ENV", "development")
+
+# Signing keys as "kid:secret" pairs separated by commas; new tokens use TOKEN_ACTIVE_KID
+# (default: the first). Keep a retired key listed until the tokens it signed have expired.
+TOKEN_SIGNING_KEYS = os.getenv("TOKEN_SIGNING_KEYS", "")
+TOKEN_ACTIVE_KID = os.getenv("TOKEN_ACTIVE_KID", "")
+# Seconds verified claims and user rows are reused before being checked again
+TOKEN_CACHE_SECONDS = float(os.getenv("TOKEN_CACHE_SECONDS", "60"))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+# Seconds between reloads of tokens revoked by other processes
+TOKEN_DENYLIST_REFRESH = float(os.getenv("TOKEN_DENYLIST_REFRESH", "30"))
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def parse_signing_keys(spec: str) -> Dict[str, bytes]:
+    keys = {}
+    for pair in filter(None, (part.strip() for part in spec.split(","))):
+        kid, secret = pair.split(":", 1)
+        keys[kid.strip()] = secret.strip().encode()
+    return keys
+
+
+class TokenSigner:
+    """
+    HMAC-SHA256 tokens signed with server keys identified by a `kid` header.
+
+    Rotation: add the new key, make it active, and drop the old one once the
+    tokens it signed have expired. Verification needs no database access.
+    """
+
+    def __init__(self, keys: Optional[Dict[str, bytes]] = None, active_kid: Optional[str] = None):
+        keys = parse_signing_keys(TOKEN_SIGNING_KEYS) if keys is None else keys
+        if not keys:
+            if ENV != "test":
+                # A per-process random key would reject tokens issued by other workers or before a restart
+                raise RuntimeError("TOKEN_SIGNING_KEYS must be set outside the test environment")
+            logging.warning("TOKEN_SIGNING_KEYS is not set; using a random key, so tokens end with this process")
+            keys = {"ephemeral": secrets.token_bytes(32)}
+        self.keys = keys
+        self.active_kid = active_kid or TOKEN_ACTIVE_KID or next(iter(keys))
+        if self.active_kid not in keys:
+            raise ValueError(f"Unknown TOKEN_ACTIVE_KID: {self.active_kid}")
+
+    def sign(self, claims: dict) -> str:
+        header = _b64encode(json.dumps({"alg": "HS256", "typ": "JWT", "kid": self.active_kid}).encode())
+        payload = _b64encode(json.dumps(claims).encode())
+        signature = hmac.new(self.keys[self.active_kid], f"{header}.{payload}".encode(), hashlib.sha256).hexdigest()
+        return f"{header}.{payload}.{signature}"
+
+    def verify(self, token: str) -> Optional[dict]:
+        """Claims of a well-signed, unexpired token; None otherwise (including tokens without a kid)."""
+        try:
+            header_b64, payload_b64, signature = token.split(".")
+            header = json.loads(_b64decode(header_b64))
+            key = self.keys.get(header.get("kid"))
+            if key is None:
+                return None
+            expected = hmac.new(key, f"{header_b64}.{payload_b64}".encode(), hashlib.sha256).hexdigest()
+            if not hmac.compare_digest(signature, expected):
+                return None
+            claims = json.loads(_b64decode(payload_b64))
+            if time.time() > claims["exp"]:
+                return None
+            return claims
+        except Exception:
+            return None
+
+
+class TokenDenyList:
+    """
+    Revoked token ids (jti) until their tokens expire.
+
+    Revocations are written to the revoked_tokens table and kept in memory;
+    a background thread reloads the table so revocations made by other
+    processes apply within TOKEN_DENYLIST_REFRESH seconds. Expired entries
+    are dropped, which keeps the list as small as the set of live revoked tokens.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal,
+                 refresh_interval: float = TOKEN_DENYLIST_REFRESH):
+        self.session_factory = session_factory
+        self.refresh_interval = refresh_interval
+        self._revoked: Dict[str, float] = {}  # jti -> expiry timestamp
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __contains__(self, jti: str) -> bool:
+        return jti in self._revoked
+
+    def revoke(self, db: Session, jti: str, expires_at: float) -> None:
+        """Deny a token id until expires_at. The caller commits."""
+        table = models.RevokedToken.__table__
+        db.execute(
+            dialect_insert(db, table)
+            .values(jti=jti, expires_at=datetime.utcfromtimestamp(expires_at))
+            .on_conflict_do_nothing(index_elements=[table.c.jti])
+        )
+        with self._lock:
+            self._revoked[jti] = expires_at
+
+    def refresh(self) -> None:
+        now = datetime.utcnow()
+        db = self.session_factory()
+        try:
+            rows = db.query(models.RevokedToken.jti, models.RevokedToken.expires_at).filter(
+                models.RevokedToken.expires_at > now
+            ).all()
+            db.query(models.RevokedToken).filter(
+                models.RevokedToken.expires_at <= now
+            ).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+        revoked = {jti: (expires_at - datetime(1970, 1, 1)).total_seconds() for jti, expires_at in rows}
+        with self._lock:
+            # Keep local revocations that have not reached the table's snapshot yet
+            current = time.time()
+            revoked.update({jti: exp for jti, exp in self._revoked.items() if exp > current})
+            self._revoked = revoked
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="token-denylist", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread = None
+
+    def _loop(self) -> None:
+        wait = 0.0
+        while not self._stop.wait(wait):
+            wait = self.refresh_interval
+            try:
+                self.refresh()
+            except Exception as e:
+                logging.error(f"Error refreshing token deny-list: {e}")
+
+
+class TTLCache:
+    """Small thread-safe LRU mapping whose entries expire at a per-entry time."""
+
+    def __init__(self, max_size: int = TOKEN_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries: "OrderedDict[object, Tuple[float, object]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() >= entry[0]:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, value, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def pop(self, key) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
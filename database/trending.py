@@ -0,0 +1,153 @@
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+
+from .config import SessionLocal
+from . import models
+from .leaderboard import song_item
+from .upserts import dialect_insert
+
+# How long rollup buckets are kept
+HOURLY_VIEW_RETENTION = timedelta(days=int(os.getenv("HOURLY_VIEW_RETENTION_DAYS", "7")))
+DAILY_VIEW_RETENTION = timedelta(days=int(os.getenv("DAILY_VIEW_RETENTION_DAYS", "90")))
+# Seconds between retention passes
+ROLLUP_RETENTION_INTERVAL = float(os.getenv("ROLLUP_RETENTION_INTERVAL", "3600"))
+
+
+def hour_bucket(at: datetime) -> datetime:
+    return at.replace(minute=0, second=0, microsecond=0)
+
+
+def day_bucket(at: datetime) -> datetime:
+    return at.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+# window -> (rollup table, bucket function, bucket length, buckets in window, half-life in buckets)
+TRENDING_WINDOWS = {
+    "24h": (models.SongViewHourly, hour_bucket, timedelta(hours=1), 24, 6.0),
+    "7d": (models.SongViewDaily, day_bucket, timedelta(days=1), 7, 2.0),
+    "30d": (models.SongViewDaily, day_bucket, timedelta(days=1), 30, 7.0),
+}
+
+
+def record_view_rollups(db: Session, counts: Dict[int, int], at: Optional[datetime] = None) -> None:
+    """
+    Add views ({song_id: views}) to the hourly and daily buckets containing `at`.
+
+    Each table gets one batched INSERT ... ON CONFLICT that adds to the
+    bucket, so rollups stay append-friendly. The caller commits.
+    """
+    if not counts:
+        return
+    at = at or datetime.utcnow()
+    for model, bucket in ((models.SongViewHourly, hour_bucket(at)), (models.SongViewDaily, day_bucket(at))):
+        table = model.__table__
+        stmt = dialect_insert(db, table)
+        db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[table.c.external_song_id, table.c.bucket_start],
+                set_={"views": table.c.views + stmt.excluded.views}
+            ),
+            [
+                {"external_song_id": song_id, "bucket_start": bucket, "views": views}
+                for song_id, views in counts.items()
+            ]
+        )
+
+
+def trending_songs(db: Session, window: str = "24h", limit: int = 10,
+                   now: Optional[datetime] = None) -> List[dict]:
+    """
+    Songs ranked by exponentially decayed views over a rolling window.
+
+    Reads only the rollup table for the window: each bucket's views are
+    weighted by 0.5 ** (age in buckets / half-life) and summed per song.
+    """
+    model, bucket_of, step, buckets, half_life = TRENDING_WINDOWS[window]
+    current = bucket_of(now or datetime.utcnow())
+    starts = [current - step * age for age in range(buckets)]
+    weight = case(
+        {start: 0.5 ** (age / half_life) for age, start in enumerate(starts)},
+        value=model.bucket_start,
+        else_=0.0
+    )
+    score = func.sum(model.views * weight).label("score")
+
+    rows = db.query(
+        model.external_song_id,
+        score,
+        func.sum(model.views).label("views")
+    ).filter(
+        model.bucket_start >= starts[-1]
+    ).group_by(model.external_song_id).order_by(
+        score.desc(), model.external_song_id
+    ).limit(limit).all()
+
+    refs = {
+        ref.external_id: ref for ref in db.query(models.ExternalSongReference).filter(
+            models.ExternalSongReference.external_id.in_([row.external_song_id for row in rows])
+        )
+    }
+    return [
+        {
+            **song_item(refs[row.external_song_id]),
+            "trending_score": round(row.score, 3),
+            "window_views": row.views,
+        }
+        for row in rows if row.external_song_id in refs
+    ]
+
+
+def prune_view_rollups(db: Session, now: Optional[datetime] = None) -> Tuple[int, int]:
+    """Delete buckets past their retention and commit; returns (hourly, daily) rows deleted."""
+    now = now or datetime.utcnow()
+    hourly = db.query(models.SongViewHourly).filter(
+        models.SongViewHourly.bucket_start < hour_bucket(now - HOURLY_VIEW_RETENTION)
+    ).delete(synchronize_session=False)
+    daily = db.query(models.SongViewDaily).filter(
+        models.SongViewDaily.bucket_start < day_bucket(now - DAILY_VIEW_RETENTION)
+    ).delete(synchronize_session=False)
+    db.commit()
+    return hourly, daily
+
+
+class RollupRetentionJob:
+    """Prunes expired rollup buckets every ROLLUP_RETENTION_INTERVAL seconds."""
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        interval: float = ROLLUP_RETENTION_INTERVAL,
+    ):
+        self.session_factory = session_factory
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="rollup-retention", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread = None
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            db = self.session_factory()
+            try:
+                hourly, daily = prune_view_rollups(db)
+                if hourly or daily:
+                    logging.info(f"Pruned {hourly} hourly and {daily} daily view rollup(s)")
+            except Exception as e:
+                db.rollback()
+                logging.error(f"Error pruning view rollups: {e}")
+            finally:
+                db.close()
@@ -0,0 +1,82 @@
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from . import models
+
+
+def dialect_insert(db: Session, table):
+    """Dialect-specific INSERT that supports ON CONFLICT (PostgreSQL and SQLite)."""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(table)
+    if dialect == "sqlite":
+        return sqlite.insert(table)
+    raise NotImplementedError(f"Upserts are not supported on {dialect}")
+
+
+def _song_reference_row(external_id: int, title: Optional[str], artist: Optional[str], views: int) -> dict:
+    return {
+        "external_id": external_id,
+        "title": title or "Unknown",
+        "artist": artist or "Unknown",
+        "view_count": views,
+    }
+
+
+def ensure_song_reference(db: Session, external_id: int, title: Optional[str] = None,
+                          artist: Optional[str] = None) -> None:
+    """Create the reference if it is missing, leaving an existing one untouched. One round trip."""
+    table = models.ExternalSongReference.__table__
+    stmt = dialect_insert(db, table).values(**_song_reference_row(external_id, title, artist, 0))
+    db.execute(stmt.on_conflict_do_nothing(index_elements=[table.c.external_id]))
+
+
+def upsert_song_reference(db: Session, external_id: int, title: Optional[str] = None,
+                          artist: Optional[str] = None, views: int = 0) -> None:
+    """
+    Create or update a song reference in a single INSERT ... ON CONFLICT.
+
+    Title and artist overwrite the stored values only when given; views are
+    added atomically to the stored count. The caller commits.
+    """
+    upsert_song_references(db, [
+        {"external_id": external_id, "title": title, "artist": artist, "views": views}
+    ])
+
+
+def upsert_song_references(db: Session, references: Iterable[Dict]) -> None:
+    """
+    Batched form of upsert_song_reference.
+
+    Each item has external_id and optional title, artist and views. Items are
+    grouped by which details they carry so every group is one executemany.
+    """
+    table = models.ExternalSongReference.__table__
+    groups: Dict[tuple, List[dict]] = {}
+    for reference in references:
+        key = (bool(reference.get("title")), bool(reference.get("artist")))
+        groups.setdefault(key, []).append(_song_reference_row(
+            reference["external_id"],
+            reference.get("title"),
+            reference.get("artist"),
+            reference.get("views", 0)
+        ))
+
+    for (has_title, has_artist), rows in groups.items():
+        stmt = dialect_insert(db, table)
+        update_values = {
+            "view_count": func.coalesce(table.c.view_count, 0) + stmt.excluded.view_count,
+            "updated_at": datetime.utcnow(),
+        }
+        if has_title:
+            update_values["title"] = stmt.excluded.title
+        if has_artist:
+            update_values["artist"] = stmt.excluded.artist
+        db.execute(
+            stmt.on_conflict_do_update(index_elements=[table.c.external_id], set_=update_values),
+            rows
+        )
@@ -0,0 +1,157 @@
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from .config import SessionLocal
+from .upserts import upsert_song_references
+from .trending import record_view_rollups
+
+# Seconds between flushes of buffered view increments
+VIEW_FLUSH_INTERVAL = float(os.getenv("VIEW_FLUSH_INTERVAL", "5"))
+
+
+class ViewCounterBuffer:
+    """
+    Write-behind buffer for song view counts.
+
+    Views are aggregated per song in memory and flushed periodically as one
+    batched upsert that adds to `view_count` atomically, so a page view costs
+    no database round trip and concurrent views cannot overwrite each other.
+    The same transaction adds the views to the hourly and daily rollups.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        flush_interval: float = VIEW_FLUSH_INTERVAL,
+    ):
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval
+        self._counts: Dict[int, int] = {}
+        self._details: Dict[int, Tuple[Optional[str], Optional[str]]] = {}
+        self._oldest_pending_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.listeners: List[Callable[[Dict[int, int]], None]] = []  # Called with {song_id: views} after each flush
+        self.flushed_views = 0
+        self.flush_errors = 0
+        self.last_flush_at: Optional[float] = None
+        self.last_flush_lag = 0.0
+        self.last_flush_duration = 0.0
+
+    def increment(self, song_id: int, title: Optional[str] = None,
+                  artist: Optional[str] = None, views: int = 1) -> None:
+        """Record views for a song; title and artist, when given, update its reference."""
+        with self._lock:
+            self._counts[song_id] = self._counts.get(song_id, 0) + views
+            if title or artist:
+                old_title, old_artist = self._details.get(song_id, (None, None))
+                self._details[song_id] = (title or old_title, artist or old_artist)
+            if self._oldest_pending_at is None:
+                self._oldest_pending_at = time.monotonic()
+
+    def pending(self, song_id: int) -> int:
+        """Views recorded for a song that have not been flushed yet."""
+        with self._lock:
+            return self._counts.get(song_id, 0)
+
+    def flush(self) -> int:
+        """Write all buffered views to the database; returns the number of views written."""
+        with self._flush_lock:
+            with self._lock:
+                counts, self._counts = self._counts, {}
+                details, self._details = self._details, {}
+                oldest_pending_at, self._oldest_pending_at = self._oldest_pending_at, None
+            if not counts:
+                return 0
+
+            started = time.monotonic()
+            db = self.session_factory()
+            try:
+                self._write(db, counts, details)
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                self.flush_errors += 1
+                logging.error(f"Error flushing view counts: {e}")
+                self._requeue(counts, details, oldest_pending_at)
+                return 0
+            finally:
+                db.close()
+
+            finished = time.monotonic()
+            self.last_flush_at = time.time()
+            self.last_flush_lag = finished - oldest_pending_at
+            self.last_flush_duration = finished - started
+            views = sum(counts.values())
+            self.flushed_views += views
+
+        for listener in self.listeners:
+            try:
+                listener(counts)
+            except Exception as e:
+                logging.error(f"Error in view count listener: {e}")
+        return views
+
+    def _write(self, db: Session, counts: Dict[int, int],
+               details: Dict[int, Tuple[Optional[str], Optional[str]]]) -> None:
+        upsert_song_references(db, [
+            {
+                "external_id": song_id,
+                "title": details.get(song_id, (None, None))[0],
+                "artist": details.get(song_id, (None, None))[1],
+                "views": views,
+            }
+            for song_id, views in counts.items()
+        ])
+        record_view_rollups(db, counts)
+
+    def _requeue(self, counts: Dict[int, int], details: Dict[int, Tuple[Optional[str], Optional[str]]],
+                 oldest_pending_at: float) -> None:
+        with self._lock:
+            for song_id, views in counts.items():
+                self._counts[song_id] = self._counts.get(song_id, 0) + views
+            for song_id, detail in details.items():
+                self._details.setdefault(song_id, detail)
+            if self._oldest_pending_at is None or oldest_pending_at < self._oldest_pending_at:
+                self._oldest_pending_at = oldest_pending_at
+
+    def metrics(self) -> dict:
+        with self._lock:
+            pending_songs = len(self._counts)
+            pending_views = sum(self._counts.values())
+            flush_lag = time.monotonic() - self._oldest_pending_at if self._oldest_pending_at else 0.0
+        return {
+            "pending_songs": pending_songs,
+            "pending_views": pending_views,
+            "flush_lag_seconds": round(flush_lag, 3),
+            "last_flush_lag_seconds": round(self.last_flush_lag, 3),
+            "last_flush_duration_seconds": round(self.last_flush_duration, 3),
+            "last_flush_at": self.last_flush_at,
+            "flushed_views": self.flushed_views,
+            "flush_errors": self.flush_errors,
+        }
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="view-counter", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the flush thread and write out whatever is still buffered."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + 5)
+            self._thread = None
+        self.flush()
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
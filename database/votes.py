@@ -0,0 +1,136 @@
+import hashlib
+import math
+import os
+import threading
+from typing import Optional, Tuple
+
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session
+
+from . import models
+from .upserts import dialect_insert
+
+# Distinct votes the Bloom filter is sized for before it is reset
+VOTE_BLOOM_CAPACITY = int(os.getenv("VOTE_BLOOM_CAPACITY", "1000000"))
+# Target false-positive rate at capacity; a false positive costs one extra lookup
+VOTE_BLOOM_ERROR_RATE = float(os.getenv("VOTE_BLOOM_ERROR_RATE", "0.0001"))
+# Mixed into voter keys so stored keys do not reveal client IPs
+VOTER_KEY_SALT = os.getenv("VOTER_KEY_SALT", "comment-votes")
+
+
+def voter_key(client_ip: str) -> str:
+    """Stable, non-reversible voter identity for a client IP."""
+    return hashlib.sha256(f"{VOTER_KEY_SALT}:{client_ip}".encode()).hexdigest()
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over strings.
+
+    Sized for `capacity` items at `error_rate`; bit positions come from
+    double hashing one BLAKE2b digest.
+    """
+
+    def __init__(self, capacity: int = VOTE_BLOOM_CAPACITY, error_rate: float = VOTE_BLOOM_ERROR_RATE):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+
+    def add(self, item: str) -> None:
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    def clear(self) -> None:
+        self._bits = bytearray(len(self._bits))
+        self.count = 0
+
+
+class DuplicateVoteError(Exception):
+    """The voter has already upvoted the comment."""
+
+
+class VoteRecorder:
+    """
+    Records upvotes at most once per (comment, voter).
+
+    The comment's upvote_count is incremented atomically first, so votes for
+    missing comments never reach comment_votes and its foreign key. The vote
+    row then goes in with INSERT ... ON CONFLICT DO NOTHING; the unique
+    constraint is the authority across restarts and processes, and a
+    conflict means the caller must roll back the increment.
+
+    A Bloom filter of votes seen by this process flags likely repeats. A hit
+    is confirmed with an indexed lookup before anything is written, so false
+    positives never turn away a first vote. The filter is reset once it
+    reaches capacity.
+    """
+
+    def __init__(self, capacity: int = VOTE_BLOOM_CAPACITY, error_rate: float = VOTE_BLOOM_ERROR_RATE):
+        self._seen = BloomFilter(capacity, error_rate)
+        self._lock = threading.Lock()
+
+    def _remember(self, vote: str) -> None:
+        with self._lock:
+            if self._seen.count >= self._seen.capacity:
+                self._seen.clear()
+            self._seen.add(vote)
+
+    def record(self, db: Session, comment_id: int, voter: str) -> Optional[Tuple[int, int]]:
+        """
+        Increment the comment's upvote count and add the vote. The caller commits.
+
+        Returns (upvote_count, external_song_id) after the vote, or None when
+        the comment does not exist. Raises DuplicateVoteError for repeat
+        votes, after which the caller rolls back.
+        """
+        vote = f"{comment_id}:{voter}"
+        with self._lock:
+            likely_repeat = vote in self._seen
+        if likely_repeat and db.query(
+            db.query(models.CommentVote).filter(
+                models.CommentVote.comment_id == comment_id,
+                models.CommentVote.voter_key == voter
+            ).exists()
+        ).scalar():
+            raise DuplicateVoteError()
+
+        comments = models.Comment.__table__
+        row = db.execute(
+            update(comments)
+            .where(comments.c.id == comment_id)
+            .values(upvote_count=func.coalesce(comments.c.upvote_count, 0) + 1)
+            .returning(comments.c.upvote_count, comments.c.external_song_id)
+        ).first()
+        if row is None:
+            return None
+
+        table = models.CommentVote.__table__
+        inserted = db.execute(
+            dialect_insert(db, table)
+            .values(comment_id=comment_id, voter_key=voter)
+            .on_conflict_do_nothing(index_elements=[table.c.comment_id, table.c.voter_key])
+        ).rowcount
+        if not inserted:
+            self._remember(vote)
+            raise DuplicateVoteError()
+        return row.upvote_count, row.external_song_id
+
+    def committed(self, comment_id: int, voter: str) -> None:
+        """Remember a vote once its transaction has committed."""
+        self._remember(f"{comment_id}:{voter}")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._seen.clear()
@@ -13,8 +13,14 @@ import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
 from database.config import Base, SQLALCHEMY_DATABASE_URL, get_db
+from database.async_db import async_database_url, get_async_db
+from database.replicas import get_async_read_db, get_read_db
 from database.init_db import init_db
+from database import security
+import app as app_module
 from app import app
 
 # Create test database
@@ -53,6 +59,56 @@ def client(db_session):
         yield test_client
     app.dependency_overrides.clear()
 
+@pytest.fixture(scope="function")
+def memory_session_factory(tmp_path):
+    """
+    Create an isolated database built from the current models.
+    It lives in a per-test file rather than in memory so the async engine can open it too.
+    """
+    memory_engine = create_engine(
+        f"sqlite:///{tmp_path / 'memory.db'}", connect_args={"check_same_thread": False}
+    )
+    Base.metadata.create_all(bind=memory_engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=memory_engine)
+    memory_engine.dispose()
+
+@pytest.fixture(scope="function")
+def memory_async_session_factory(memory_session_factory):
+    """Async sessions on the same database as memory_session_factory."""
+    url = memory_session_factory.kw["bind"].url
+    # NullPool: connections belong to whichever event loop opened them
+    async_engine = create_async_engine(async_database_url(str(url)), poolclass=NullPool)
+    yield async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+@pytest.fixture(scope="function")
+def memory_client(memory_session_factory, memory_async_session_factory):
+    """Create a test client backed by the per-test database."""
+    def override_get_db():
+        db = memory_session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    async def override_get_async_db():
+        async with memory_async_session_factory() as db:
+            yield db
+
+    # App-level caches would otherwise carry state over from the previous test's database
+    app_module.song_count_estimate.invalidate()
+    app_module.top_comments_cache.invalidate()
+    app_module.vote_recorder.clear()
+    security.verified_claims.clear()
+    security.user_cache.clear()
+
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    app.dependency_overrides[get_read_db] = override_get_db
+    app.dependency_overrides[get_async_read_db] = override_get_async_db
+    with TestClient(app) as test_client:
+        yield test_client
+    app.dependency_overrides.clear()
+
 @pytest.fixture
 def auth_headers(client):
     # Register and get token for a test user
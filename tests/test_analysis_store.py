@@ -0,0 +1,147 @@
+import copy
+
+from database import analysis_store, models
+from database.analysis_store import (
+    apply_patch,
+    compact_analysis_history,
+    get_projected_analysis_fields,
+    load_analysis_version,
+    make_patch,
+    save_analysis_version,
+    save_first_analysis,
+)
+
+
+def _analysis_versions(count):
+    """Build a sequence of analyses that change the way re-analysis does."""
+    analysis = {
+        "overallHeadline": "Headline 1",
+        "songTitle": "Test Song",
+        "artist": "Test Artist",
+        "introduction": "Intro",
+        "sectionAnalyses": [
+            {"sectionName": "Verse 1", "verseSummary": "Opening", "analysis": "First pass"}
+        ],
+        "conclusion": "Conclusion",
+        "version": 1,
+    }
+    versions = [copy.deepcopy(analysis)]
+    for version in range(2, count + 1):
+        analysis["version"] = version
+        analysis["overallHeadline"] = f"Headline {version}"
+        if version % 3 == 0:
+            analysis["sectionAnalyses"].append({
+                "sectionName": f"Verse {version}",
+                "verseSummary": "Added / ~ section",
+                "analysis": f"Fan insight {version}",
+            })
+        if version % 4 == 0:
+            analysis["sectionAnalyses"].pop(0)
+        if version % 5 == 0:
+            analysis["quotedLines"] = f"Quote {version}"
+        elif "quotedLines" in analysis:
+            del analysis["quotedLines"]
+        versions.append(copy.deepcopy(analysis))
+    return versions
+
+
+def test_patch_round_trip():
+    old = {"a": [1, 2, 3], "b": {"c": "x"}, "d/e": 1}
+    new = {"a": [1, 5], "b": {"c": "y", "f": [None]}, "g": True}
+    assert apply_patch(old, make_patch(old, new)) == new
+    assert make_patch(new, new) == []
+
+
+def test_every_version_round_trips(memory_session_factory):
+    db = memory_session_factory()
+    versions = _analysis_versions(25)
+    for analysis in versions:
+        save_analysis_version(db, 777, analysis)
+        db.commit()
+
+    for version, expected in enumerate(versions, start=1):
+        assert load_analysis_version(db, 777, version) == expected
+    assert load_analysis_version(db, 777) == versions[-1]
+    assert load_analysis_version(db, 777, 26) is None
+
+    full_versions = [
+        row.version for row in db.query(models.Analysis).filter(
+            models.Analysis.analysis_data.isnot(None)
+        ).order_by(models.Analysis.version)
+    ]
+    assert full_versions == [1, 11, 21, 25]
+    db.close()
+
+
+def test_concurrent_saves_get_distinct_versions(memory_session_factory, monkeypatch):
+    db = memory_session_factory()
+    save_analysis_version(db, 777, {"overallHeadline": "One"})
+    db.commit()
+
+    # Another process saved version 2 after this save read the latest version
+    stale_reads = [db.query(models.Analysis).filter_by(external_song_id=777, version=1).one()]
+    save_analysis_version(db, 777, {"overallHeadline": "Two"})
+    db.commit()
+    real_latest = analysis_store.get_latest_analysis
+    monkeypatch.setattr(
+        analysis_store, "get_latest_analysis",
+        lambda session, song_id: stale_reads.pop() if stale_reads else real_latest(session, song_id)
+    )
+
+    saved = save_analysis_version(db, 777, {"overallHeadline": "Three"})
+    db.commit()
+    assert saved.version == 3
+    assert load_analysis_version(db, 777, 2) == {"overallHeadline": "Two"}
+    assert load_analysis_version(db, 777) == {"overallHeadline": "Three"}
+
+    # Precompute and first views keep whichever analysis landed first
+    assert save_first_analysis(db, 777, {"overallHeadline": "Late"}) is None
+    assert save_first_analysis(db, 778, {"overallHeadline": "First"}).version == 1
+    db.commit()
+    db.close()
+
+
+def test_compaction_rewrites_legacy_rows(memory_session_factory):
+    db = memory_session_factory()
+    versions = _analysis_versions(15)
+    for version, analysis in enumerate(versions, start=1):
+        db.add(models.Analysis(external_song_id=888, analysis_data=analysis, version=version))
+    db.commit()
+
+    assert compact_analysis_history(db) > 0
+    for version, expected in enumerate(versions, start=1):
+        assert load_analysis_version(db, 888, version) == expected
+    assert db.query(models.Analysis).filter(models.Analysis.analysis_data.isnot(None)).count() == 3
+
+    # Collapsing old history keeps the newest versions exact
+    compact_analysis_history(db, song_id=888, keep_versions=4)
+    assert load_analysis_version(db, 888, 11) is None
+    for version in range(12, 16):
+        assert load_analysis_version(db, 888, version) == versions[version - 1]
+    db.close()
+
+
+def test_projected_fields_read_latest_versions(memory_client, memory_session_factory):
+    db = memory_session_factory()
+    for analysis in _analysis_versions(3):
+        save_analysis_version(db, 101, analysis)
+        db.commit()
+    save_analysis_version(db, 202, {"overallHeadline": "Other song", "conclusion": "Done"})
+    db.commit()
+
+    projected = get_projected_analysis_fields(db, [101, 202, 303], ["overallHeadline", "conclusion"])
+    assert sorted(projected, key=lambda item: item["song_id"]) == [
+        {"song_id": 101, "version": 3, "overallHeadline": "Headline 3", "conclusion": "Conclusion"},
+        {"song_id": 202, "version": 1, "overallHeadline": "Other song", "conclusion": "Done"},
+    ]
+    db.close()
+
+    response = memory_client.get("/api/analyses/headlines?song_ids=101&song_ids=202")
+    assert response.status_code == 200
+    assert sorted(response.json(), key=lambda item: item["song_id"]) == [
+        {"song_id": 101, "version": 3, "overallHeadline": "Headline 3"},
+        {"song_id": 202, "version": 1, "overallHeadline": "Other song"},
+    ]
+
+    response = memory_client.get("/api/analyses/fields?song_ids=101&fields=sectionAnalyses")
+    assert response.status_code == 400
@@ -0,0 +1,36 @@
+from database import models
+from database.async_db import async_database_url
+from database.config import get_db
+from app import app
+
+
+def test_async_url_uses_asyncio_drivers():
+    assert async_database_url("postgresql://user:secret@db:5432/lyrics") == \
+        "postgresql+asyncpg://user:secret@db:5432/lyrics"
+    assert async_database_url("sqlite:///./test.db") == "sqlite+aiosqlite:///./test.db"
+
+
+def test_hot_endpoints_run_without_sync_sessions(memory_client, memory_session_factory):
+    db = memory_session_factory()
+    db.add(models.Analysis(external_song_id=1, analysis_data={"overallHeadline": "Stored"}, version=1))
+    db.commit()
+    db.close()
+
+    def no_sync_session():
+        raise AssertionError("sync session used")
+        yield
+
+    app.dependency_overrides[get_db] = no_sync_session
+
+    created = memory_client.post("/api/comments/anonymous", json={"song_id": 1, "content": "Async"})
+    assert created.status_code == 200
+    comment_id = created.json()["id"]
+
+    upvoted = memory_client.post(f"/api/comments/{comment_id}/upvote")
+    assert upvoted.json()["upvote_count"] == 1
+    assert memory_client.post(f"/api/comments/{comment_id + 1}/upvote").status_code == 404
+
+    comments = memory_client.get("/api/songs/1/comments").json()
+    assert [(comment["content"], comment["upvote_count"]) for comment in comments] == [("Async", 1)]
+    assert memory_client.get("/api/songs/1/analysis").json()["analysis"] == {"overallHeadline": "Stored"}
+    assert memory_client.get("/analyze_lyrics?record_id=1").status_code == 200
@@ -0,0 +1,110 @@
+from sqlalchemy import event
+
+from database import models
+from database.comment_aggregates import TOP_COMMENTS_SIZE, TopCommentsCache, recount_comment_aggregates
+
+
+def _post_comment(client, content, song_id=5):
+    response = client.post(
+        "/api/comments/anonymous?title=Song&artist=Artist",
+        json={"content": content, "song_id": song_id}
+    )
+    assert response.status_code == 200
+    return response.json()["id"]
+
+
+def test_aggregates_follow_create_upvote_and_delete(memory_client, memory_session_factory):
+    first = _post_comment(memory_client, "First")
+    second = _post_comment(memory_client, "Second")
+    third = _post_comment(memory_client, "Third")
+
+    top = memory_client.get("/api/songs/5/comments/top").json()
+    assert top["comment_count"] == 3
+    assert [comment["id"] for comment in top["comments"]] == [third, second, first]
+
+    # Writes invalidate the cached payload
+    memory_client.post(f"/api/comments/{first}/upvote")
+    top = memory_client.get("/api/songs/5/comments/top").json()
+    assert [comment["id"] for comment in top["comments"]] == [first, third, second]
+    assert top["comments"][0]["upvote_count"] == 1
+
+    memory_client.delete(f"/api/comments/{third}")
+    top = memory_client.get("/api/songs/5/comments/top").json()
+    assert top["comment_count"] == 2
+    assert [comment["id"] for comment in top["comments"]] == [first, second]
+
+    db = memory_session_factory()
+    reference = db.query(models.ExternalSongReference).filter_by(external_id=5).one()
+    assert reference.comment_count == 2
+    assert reference.top_comment_ids == [first, second]
+    db.close()
+
+
+def test_unknown_song_has_no_top_comments(memory_client):
+    assert memory_client.get("/api/songs/404/comments/top").json() == {
+        "song_id": 404, "comment_count": 0, "comments": []
+    }
+
+
+def test_cache_serves_until_invalidated(memory_session_factory):
+    db = memory_session_factory()
+    db.add(models.ExternalSongReference(external_id=1, title="Song", artist="Artist"))
+    db.add(models.Comment(external_song_id=1, content="Only", upvote_count=0))
+    db.commit()
+    recount_comment_aggregates(db)
+
+    cache = TopCommentsCache(ttl=60)
+    assert cache.get(db, 1)["comment_count"] == 1
+
+    db.add(models.Comment(external_song_id=1, content="Unseen", upvote_count=0))
+    db.commit()
+    recount_comment_aggregates(db)
+    assert cache.get(db, 1)["comment_count"] == 1
+
+    cache.invalidate(1)
+    assert cache.get(db, 1)["comment_count"] == 2
+    db.close()
+
+
+def test_upvotes_outside_the_top_comments_leave_the_song_row_alone(memory_client, memory_session_factory,
+                                                                    memory_async_session_factory):
+    ids = [_post_comment(memory_client, f"Comment {n}") for n in range(TOP_COMMENTS_SIZE + 1)]
+    for comment_id in ids[1:]:
+        memory_client.post(f"/api/comments/{comment_id}/upvote")
+    etag = memory_client.get("/api/songs/5/comments").headers["ETag"]
+
+    db = memory_session_factory()
+    song_updated = db.query(models.ExternalSongReference.updated_at).filter_by(external_id=5).scalar()
+    db.close()
+
+    # ids[0] ties on one upvote with the whole top N but loses on id, so it stays out
+    # and the conditional UPDATE matches no row
+    updated_rows = []
+    bind = memory_async_session_factory.kw["bind"].sync_engine
+    listener = lambda conn, cursor, statement, parameters, context, executemany: updated_rows.append(
+        cursor.rowcount) if statement.startswith("UPDATE external_song_references") else None
+    event.listen(bind, "after_cursor_execute", listener)
+    try:
+        assert memory_client.post(f"/api/comments/{ids[0]}/upvote").status_code == 200
+    finally:
+        event.remove(bind, "after_cursor_execute", listener)
+    assert updated_rows == [0]
+
+    db = memory_session_factory()
+    reference = db.query(models.ExternalSongReference).filter_by(external_id=5).one()
+    assert reference.top_comment_ids == ids[:0:-1]
+    assert reference.updated_at == song_updated
+    db.close()
+
+    # The comments ETag still sees the upvote
+    assert memory_client.get("/api/songs/5/comments", headers={"If-None-Match": etag}).status_code == 200
+
+    # A new comment without upvotes can't enter either; deleting a top comment recomputes
+    newest = _post_comment(memory_client, "Newest")
+    memory_client.delete(f"/api/comments/{ids[-1]}")
+    db = memory_session_factory()
+    reference = db.query(models.ExternalSongReference).filter_by(external_id=5).one()
+    assert reference.comment_count == TOP_COMMENTS_SIZE + 1
+    assert reference.top_comment_ids == ids[-2:0:-1] + [ids[0]]
+    assert newest not in reference.top_comment_ids
+    db.close()
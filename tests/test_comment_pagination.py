@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+
+from database import models
+from database.pagination import encode_cursor
+
+
+def _seed_comments(session_factory, count):
+    db = session_factory()
+    db.add(models.ExternalSongReference(external_id=1, title="Song", artist="Artist"))
+    start = datetime(2026, 1, 1)
+    for i in range(count):
+        db.add(models.Comment(
+            external_song_id=1,
+            content=f"Comment {i}",
+            upvote_count=i % 3,
+            created_at=start + timedelta(minutes=i)
+        ))
+    db.commit()
+    db.close()
+
+
+def _walk(client, url):
+    contents = []
+    cursor = None
+    while True:
+        response = client.get(f"{url}&cursor={cursor}" if cursor else url)
+        assert response.status_code == 200
+        contents.extend(comment["content"] for comment in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            return contents
+
+
+def test_newest_pages_cover_every_comment_once(memory_client, memory_session_factory):
+    _seed_comments(memory_session_factory, 7)
+
+    first = memory_client.get("/api/songs/1/comments?limit=3")
+    assert [comment["content"] for comment in first.json()] == ["Comment 6", "Comment 5", "Comment 4"]
+
+    contents = _walk(memory_client, "/api/songs/1/comments?limit=3")
+    assert contents == [f"Comment {i}" for i in reversed(range(7))]
+
+
+def test_top_order_breaks_ties_by_newest(memory_client, memory_session_factory):
+    _seed_comments(memory_session_factory, 7)
+
+    contents = _walk(memory_client, "/api/songs/1/comments?order=top&limit=2")
+    assert contents == [
+        "Comment 5", "Comment 2",               # 2 upvotes
+        "Comment 4", "Comment 1",               # 1 upvote
+        "Comment 6", "Comment 3", "Comment 0",  # none
+    ]
+
+
+def test_rejects_unknown_order_and_bad_cursor(memory_client, memory_session_factory):
+    _seed_comments(memory_session_factory, 1)
+
+    assert memory_client.get("/api/songs/1/comments?order=oldest").status_code == 400
+    assert memory_client.get("/api/songs/1/comments?cursor=garbage").status_code == 400
+    for order, bad_values in (("newest", ("2026-01-01T00:00:00", "1")), ("newest", (5, 1)),
+                              ("top", ("5", 1)), ("top", (5, None))):
+        cursor = encode_cursor(*bad_values)
+        assert memory_client.get(f"/api/songs/1/comments?order={order}&cursor={cursor}").status_code == 400
+    assert memory_client.get("/api/songs/1/comments?limit=1000").status_code == 422
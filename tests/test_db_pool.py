@@ -0,0 +1,64 @@
+import logging
+
+import pytest
+from sqlalchemy import create_engine, exc, text
+
+from database.db_pool import PoolMetrics, instrumented_pool_class
+
+
+@pytest.fixture
+def pool_engine(tmp_path):
+    metrics = PoolMetrics(slow_wait_ms=50)
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        poolclass=instrumented_pool_class(metrics),
+        pool_size=1,
+        max_overflow=1,
+        pool_timeout=0.1,
+    )
+    yield engine, metrics
+    engine.dispose()
+
+
+def test_reports_checked_out_and_overflow_connections(pool_engine):
+    engine, metrics = pool_engine
+    first = engine.connect()
+    second = engine.connect()
+
+    snapshot = metrics.snapshot()
+    assert snapshot["checked_out"] == 2
+    assert snapshot["overflow"] == 1
+    assert snapshot["checkouts"] == 2
+
+    first.close()
+    second.close()
+    assert metrics.snapshot()["checked_out"] == 0
+
+
+def test_counts_and_logs_checkout_timeouts(pool_engine, caplog):
+    engine, metrics = pool_engine
+    held = [engine.connect(), engine.connect()]
+
+    with caplog.at_level(logging.ERROR), pytest.raises(exc.TimeoutError):
+        engine.connect()
+    assert metrics.snapshot()["timeouts"] == 1
+    assert metrics.snapshot()["slow_checkouts"] == 1
+    assert "Timed out" in caplog.text
+
+    for connection in held:
+        connection.close()
+
+
+def test_metrics_follow_the_pool_across_dispose(pool_engine):
+    engine, metrics = pool_engine
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+    engine.dispose()
+    with engine.connect() as connection:
+        assert metrics.snapshot()["checked_out"] == 1
+    assert metrics.snapshot()["checkouts"] == 2
+
+
+def test_metrics_endpoint_reports_the_shared_pool(memory_client):
+    pool = memory_client.get("/api/metrics").json()["db_pool"]
+    assert {"checked_out", "overflow", "timeouts", "avg_wait_ms"} <= set(pool)
@@ -0,0 +1,97 @@
+from sqlalchemy import event
+
+from database import models
+from database.analysis_store import save_analysis_version
+
+
+def _seed(session_factory):
+    db = session_factory()
+    db.add(models.ExternalSongReference(external_id=1, title="Song", artist="Artist", view_count=5))
+    db.add(models.Comment(external_song_id=1, content="First", upvote_count=0))
+    save_analysis_version(db, 1, {"overallHeadline": "One"})
+    db.commit()
+    db.close()
+
+
+def _revalidate(client, url):
+    first = client.get(url)
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    second = client.get(url, headers={"If-None-Match": etag})
+    return first, second
+
+
+def test_comments_revalidate_until_a_write(memory_client, memory_session_factory,
+                                          memory_async_session_factory):
+    _seed(memory_session_factory)
+    first = memory_client.get("/api/songs/1/comments")
+    assert first.status_code == 200
+
+    statements = []
+    bind = memory_async_session_factory.kw["bind"].sync_engine
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(bind, "before_cursor_execute", listener)
+    try:
+        second = memory_client.get("/api/songs/1/comments", headers={"If-None-Match": first.headers["ETag"]})
+    finally:
+        event.remove(bind, "before_cursor_execute", listener)
+    # One statement: the song row plus an index probe for the latest comment update
+    assert len(statements) == 1 and "FROM external_song_references" in statements[0]
+    assert "count(" not in statements[0]
+    assert first.headers["Cache-Control"] == "no-cache"
+    assert second.status_code == 304
+    assert second.content == b""
+    assert second.headers["ETag"] == first.headers["ETag"]
+
+    comment_id = first.json()[0]["id"]
+    memory_client.post(f"/api/comments/{comment_id}/upvote")
+    changed = memory_client.get("/api/songs/1/comments", headers={"If-None-Match": first.headers["ETag"]})
+    assert changed.status_code == 200
+    assert changed.json()[0]["upvote_count"] == 1
+
+    # Different query parameters are different representations
+    other = memory_client.get("/api/songs/1/comments?order=top", headers={"If-None-Match": first.headers["ETag"]})
+    assert other.status_code == 200
+
+
+def test_analysis_not_modified_skips_loading_the_document(memory_client, memory_session_factory,
+                                                         memory_async_session_factory):
+    _seed(memory_session_factory)
+    first = memory_client.get("/api/songs/1/analysis")
+    assert first.headers["Cache-Control"] == "public, max-age=60"
+
+    statements = []
+    bind = memory_async_session_factory.kw["bind"].sync_engine
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(bind, "before_cursor_execute", listener)
+    try:
+        second = memory_client.get("/api/songs/1/analysis", headers={"If-None-Match": first.headers["ETag"]})
+    finally:
+        event.remove(bind, "before_cursor_execute", listener)
+    assert second.status_code == 304
+    assert len(statements) == 1 and "max(" in statements[0]  # Only the version marker is read
+
+    pinned = memory_client.get("/api/songs/1/analysis?version=1")
+    assert pinned.headers["Cache-Control"] == "public, max-age=31536000, immutable"
+    pinned_again = memory_client.get(
+        "/api/songs/1/analysis?version=1", headers={"If-None-Match": pinned.headers["ETag"]}
+    )
+    assert pinned_again.status_code == 304
+
+    db = memory_session_factory()
+    save_analysis_version(db, 1, {"overallHeadline": "Two"})
+    db.commit()
+    db.close()
+    updated = memory_client.get("/api/songs/1/analysis", headers={"If-None-Match": first.headers["ETag"]})
+    assert updated.status_code == 200
+    assert updated.json()["version"] == 2
+
+
+def test_most_viewed_revalidates(memory_client, memory_session_factory):
+    _seed(memory_session_factory)
+    first, second = _revalidate(memory_client, "/api/mostViewed?page=1&size=10")
+    assert first.headers["Cache-Control"] == "public, max-age=30"
+    assert second.status_code == 304
+    assert memory_client.get(
+        "/api/mostViewed?page=1&size=10", headers={"If-None-Match": f'W/{first.headers["ETag"]}, "other"'}
+    ).status_code == 304
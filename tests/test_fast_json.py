@@ -0,0 +1,34 @@
+import json
+from datetime import datetime
+from typing import List
+
+from pydantic import TypeAdapter
+
+from database import schemas
+from database.fast_json import dumps
+
+
+def test_rows_encode_like_the_response_model():
+    rows = [
+        {
+            "content": "Café ✓",
+            "song_id": 1,
+            "id": 2,
+            "created_at": datetime(2026, 1, 2, 3, 4, 5, 678),
+            "updated_at": datetime(2026, 1, 2, 3, 4, 5),
+            "username": "Anonymous",
+            "upvote_count": 0,
+        }
+    ]
+    adapter = TypeAdapter(List[schemas.CommentResponse])
+    expected = adapter.dump_python(adapter.validate_python(rows), mode="json")
+    assert json.loads(dumps(rows)) == expected
+
+
+def test_comment_listing_matches_the_response_model(memory_client):
+    memory_client.post("/api/comments/anonymous", json={"content": "Hello", "song_id": 3})
+    response = memory_client.get("/api/songs/3/comments")
+    assert response.headers["content-type"] == "application/json"
+    body = response.json()
+    assert body == [schemas.CommentResponse(**body[0]).model_dump(mode="json")]
+    assert body[0]["username"] == "Anonymous"
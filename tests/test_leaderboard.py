@@ -0,0 +1,105 @@
+from sqlalchemy import event
+
+import app as app_module
+from database import models
+from database.leaderboard import Leaderboard
+from database.pagination import encode_cursor
+
+
+def _seed_songs(db, view_counts):
+    for song_id, views in view_counts.items():
+        db.add(models.ExternalSongReference(
+            external_id=song_id, title=f"Song {song_id}", artist="Artist", view_count=views
+        ))
+    db.commit()
+
+
+def test_board_serves_pages_inside_top_k(memory_session_factory):
+    db = memory_session_factory()
+    _seed_songs(db, {1: 10, 2: 50, 3: 30, 4: 30, 5: 5})
+    db.close()
+
+    board = Leaderboard(memory_session_factory, size=3)
+    assert board.page(1, 2) is None  # Not loaded yet
+    board.refresh()
+
+    first = board.page(1, 2)
+    assert [item["id"] for item in first["items"]] == [2, 3]
+    assert (first["total"], first["pages"]) == (5, 3)
+    assert board.page(2, 2) is None  # Reaches past the top 3
+
+    board.apply_views({4: 25, 1: 1})
+    assert [item["id"] for item in board.page(1, 3)["items"]] == [4, 2, 3]
+    assert board.page(1, 1)["items"][0]["view_count"] == 55
+
+
+def test_board_covering_every_song_serves_all_pages(memory_session_factory):
+    db = memory_session_factory()
+    _seed_songs(db, {1: 3, 2: 2})
+    db.close()
+
+    board = Leaderboard(memory_session_factory, size=10)
+    board.refresh()
+    assert board.page(2, 5)["items"] == []
+
+    board.apply_views({3: 1})  # A song the board has never seen
+    assert board.page(2, 5) is None
+
+
+def test_most_viewed_endpoint_uses_board_then_database(memory_client, memory_session_factory, monkeypatch):
+    db = memory_session_factory()
+    _seed_songs(db, {song_id: song_id * 10 for song_id in range(1, 8)})
+    db.close()
+
+    board = Leaderboard(memory_session_factory, size=4)
+    board.refresh()
+    monkeypatch.setattr(app_module, "most_viewed_leaderboard", board)
+
+    statements = []
+    event.listen(memory_session_factory.kw["bind"], "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    from_board = memory_client.get("/api/mostViewed?page=2&size=2").json()
+    assert statements == []  # Served from memory
+
+    from_db = memory_client.get("/api/mostViewed?page=3&size=2").json()
+    assert statements  # Reaches past the top 4
+    assert [item["id"] for item in from_db["items"]] == [3, 2]
+
+    board.stop()
+    monkeypatch.setattr(board, "_loaded", False)
+    assert memory_client.get("/api/mostViewed?page=2&size=2").json() == from_board
+    assert [item["id"] for item in from_board["items"]] == [5, 4]
+    assert from_board["total"] == 7
+
+
+def test_most_viewed_cursor_pages_match_offset_pages(memory_client, memory_session_factory, monkeypatch):
+    db = memory_session_factory()
+    _seed_songs(db, {song_id: (song_id % 4) * 10 for song_id in range(1, 12)})
+    db.close()
+
+    offset_ids = []
+    for page in range(1, 5):
+        offset_ids += [item["id"] for item in memory_client.get(f"/api/mostViewed?page={page}&size=3").json()["items"]]
+
+    def walk():
+        ids = []
+        response = memory_client.get("/api/mostViewed?size=3").json()
+        ids += [item["id"] for item in response["items"]]
+        while response["next_cursor"]:
+            response = memory_client.get(f"/api/mostViewed?size=3&cursor={response['next_cursor']}").json()
+            ids += [item["id"] for item in response["items"]]
+        return ids
+
+    assert walk() == offset_ids
+    assert len(offset_ids) == 11
+
+    # The same walk through the in-memory board, falling back to SQL past its end
+    board = Leaderboard(memory_session_factory, size=5)
+    board.refresh()
+    monkeypatch.setattr(app_module, "most_viewed_leaderboard", board)
+    assert walk() == offset_ids
+
+    assert memory_client.get("/api/mostViewed?cursor=not-a-cursor").status_code == 400
+    for bad_values in (("x", 1), (10, "1"), (True, 1), (1.5, 2)):
+        cursor = encode_cursor(*bad_values)
+        assert memory_client.get(f"/api/mostViewed?cursor={cursor}").status_code == 400
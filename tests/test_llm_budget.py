@@ -0,0 +1,80 @@
+import json
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import app as app_module
+from database.llm_budget import LLMBudget, record_llm_usage
+from database.rate_limit import SlidingWindowLimiter
+
+
+def _budget(tokens):
+    return LLMBudget(
+        window=3600,
+        user_limiter=SlidingWindowLimiter(tokens, 3600),
+        ip_limiter=SlidingWindowLimiter(tokens, 3600),
+    )
+
+
+def _used(limiter, key):
+    return limiter._shard(key).counters[key][1]
+
+
+def test_reservation_is_settled_to_reported_usage():
+    budget = _budget(1000)
+    with budget.reserve(400, user_id=None, client_ip="1.1.1.1"):
+        record_llm_usage({"usage": {"total_tokens": 250}})
+    assert _used(budget.ip_limiter, "ip:1.1.1.1") == 250
+
+    with pytest.raises(HTTPException) as rejected:
+        with budget.reserve(800, user_id=None, client_ip="1.1.1.1"):
+            pass
+    assert rejected.value.status_code == 429
+    assert int(rejected.value.headers["Retry-After"]) >= 1
+
+    # Signed-in users draw on their own budget
+    with budget.reserve(800, user_id=7, client_ip="1.1.1.1"):
+        pass
+    assert _used(budget.user_limiter, "user:7") == 800
+
+
+def test_failed_call_is_refunded():
+    budget = _budget(1000)
+    with pytest.raises(ValueError):
+        with budget.reserve(600, user_id=None, client_ip="2.2.2.2"):
+            raise ValueError("model unavailable")
+    assert _used(budget.ip_limiter, "ip:2.2.2.2") == 0
+
+
+def test_usage_outside_a_reservation_is_ignored():
+    record_llm_usage({"usage": {"total_tokens": 10}})  # Background jobs have no budget
+
+
+def test_re_analyze_spends_the_callers_budget(memory_client, monkeypatch):
+    monkeypatch.setattr(app_module, "llm_budget", _budget(1700))
+    updated = {"overallHeadline": "Updated", "sectionAnalyses": []}
+    monkeypatch.setattr(app_module.openai.ChatCompletion, "create", lambda **kwargs: {
+        "choices": [{"message": {"content": json.dumps(updated)}}],
+        "usage": {"total_tokens": 1500},
+    })
+    payload = {"oldAnalysis": {"overallHeadline": "Old"}, "newComment": "Great", "artist": "A", "track": "T"}
+
+    first = memory_client.post("/re_analyze", json=payload)
+    assert first.status_code == 200
+    assert first.json()["version"] == 2
+
+    second = memory_client.post("/re_analyze", json=payload)
+    assert second.status_code == 429
+    assert second.json() == {"detail": "LLM token budget exhausted"}
+    assert "Retry-After" in second.headers
+
+    # Anonymous callers the server reports no address for share the "unknown" budget
+    async def without_client(scope, receive, send):
+        await memory_client.app(dict(scope, client=None), receive, send)
+
+    monkeypatch.setattr(app_module, "llm_budget", _budget(1700))
+    client = TestClient(without_client)
+    assert client.post("/re_analyze", json=payload).status_code == 200
+    assert client.post("/re_analyze", json=payload).status_code == 429
+    assert _used(app_module.llm_budget.ip_limiter, "ip:unknown") == 1500
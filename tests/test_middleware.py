@@ -0,0 +1,61 @@
+import asyncio
+
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from database.middleware import RequestTimingMiddleware
+from database.rate_limit import SlidingWindowLimiter
+from database.security import RateLimitMiddleware
+
+
+async def hello(request):
+    return PlainTextResponse("hello")
+
+
+async def stream(request):
+    async def chunks():
+        for i in range(3):
+            yield f"chunk {i}\n"
+            await asyncio.sleep(0)
+    return StreamingResponse(chunks(), media_type="text/plain")
+
+
+def _app(limit):
+    app = Starlette(routes=[Route("/", hello), Route("/stream", stream)])
+    app.add_middleware(RateLimitMiddleware, limiter=SlidingWindowLimiter(limit, 60), enabled=True)
+    app.add_middleware(RequestTimingMiddleware)
+    return app
+
+
+def test_rejected_requests_get_429_with_retry_after():
+    with TestClient(_app(limit=2)) as client:
+        assert [client.get("/").status_code for _ in range(2)] == [200, 200]
+        rejected = client.get("/")
+        assert rejected.status_code == 429
+        assert rejected.json() == {"detail": "Too many requests"}
+        assert 1 <= int(rejected.headers["Retry-After"]) <= 60
+        assert rejected.headers["Server-Timing"].startswith("app;dur=")
+
+
+def test_streaming_responses_pass_through():
+    with TestClient(_app(limit=10)) as client:
+        response = client.get("/stream")
+        assert response.status_code == 200
+        assert response.text == "chunk 0\nchunk 1\nchunk 2\n"
+        assert "server-timing" in response.headers
+
+
+def test_disabled_in_test_environment(memory_client):
+    assert all(memory_client.get("/").status_code == 200 for _ in range(5))
+
+
+def test_routes_are_weighted_by_cost():
+    app = Starlette(routes=[Route("/", hello), Route("/stream", stream)])
+    app.add_middleware(
+        RateLimitMiddleware, limiter=SlidingWindowLimiter(10, 60), enabled=True, route_costs={"/stream": 4}
+    )
+    with TestClient(app) as client:
+        assert [client.get("/stream").status_code for _ in range(3)] == [200, 200, 429]
+        assert [client.get("/").status_code for _ in range(3)] == [200, 200, 429]
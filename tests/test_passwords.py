@@ -0,0 +1,83 @@
+import asyncio
+import hashlib
+import threading
+
+import anyio
+import pytest
+from starlette.concurrency import run_in_threadpool
+
+from database import models
+from database.passwords import HashingPoolBusy, PasswordHasher
+
+
+def test_hashes_with_bcrypt_and_flags_legacy_hashes():
+    hasher = PasswordHasher(workers=1, queue_limit=1)
+    hashed = hasher.hash("secret")
+
+    assert hashed.startswith("$2b$")
+    assert hasher.verify("secret", hashed) == (True, None)
+    assert hasher.verify("wrong", hashed) == (False, None)
+    assert hasher.verify("secret", "not-a-hash") == (False, None)
+
+    verified, upgraded = hasher.verify("secret", hashlib.sha256(b"secret").hexdigest())
+    assert verified
+    assert upgraded.startswith("$2b$")
+
+
+def test_rejects_calls_beyond_the_queue_limit():
+    hasher = PasswordHasher(workers=1, queue_limit=1)
+    release = threading.Event()
+    hasher._verify_and_update = lambda password, hashed: (release.wait(5), None)
+
+    threads = [threading.Thread(target=hasher.verify, args=("a", "b")) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    while hasher.metrics()["in_flight"] < 2:
+        pass
+
+    with pytest.raises(HashingPoolBusy):
+        hasher.hash("secret")
+    metrics = hasher.metrics()
+    assert metrics["queue_depth"] == 1
+    assert metrics["rejected"] == 1
+
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert hasher.metrics()["completed"] == 2
+
+
+def test_login_upgrades_legacy_hash(memory_client, memory_session_factory):
+    db = memory_session_factory()
+    db.add(models.User(username="legacy", hashed_password=hashlib.sha256(b"secret").hexdigest()))
+    db.commit()
+    db.close()
+
+    assert memory_client.post("/token", json={"username": "legacy", "password": "wrong"}).status_code == 401
+    assert memory_client.post("/token", json={"username": "legacy", "password": "secret"}).status_code == 200
+
+    db = memory_session_factory()
+    stored = db.query(models.User).filter(models.User.username == "legacy").one().hashed_password
+    db.close()
+    assert stored.startswith("$2b$")
+    assert memory_client.post("/token", json={"username": "legacy", "password": "secret"}).status_code == 200
+    assert memory_client.get("/api/metrics").json()["password_hashing"]["completed"] >= 3
+
+
+def test_async_callers_wait_without_holding_request_threads():
+    hasher = PasswordHasher(workers=1, queue_limit=8)
+    release = threading.Event()
+    hasher._verify_and_update = lambda password, hashed: (release.wait(5), None)
+
+    async def burst():
+        # A single request thread: queued logins must leave it free for other endpoints
+        anyio.to_thread.current_default_thread_limiter().total_tokens = 1
+        logins = [asyncio.ensure_future(hasher.verify_async("a", "b")) for _ in range(5)]
+        await asyncio.sleep(0.05)
+        other_endpoint = await asyncio.wait_for(run_in_threadpool(lambda: "served"), timeout=2)
+        release.set()
+        return other_endpoint, await asyncio.gather(*logins)
+
+    other_endpoint, results = asyncio.run(burst())
+    assert other_endpoint == "served"
+    assert results == [(True, None)] * 5
@@ -0,0 +1,132 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from database import models
+from database.config import Base
+from database.precompute import (
+    DEFAULT_SONG_TOKEN_ESTIMATE,
+    PrecomputeJob,
+    current_window_start,
+    parse_windows,
+)
+from database.trending import record_view_rollups
+
+
+@pytest.fixture
+def file_session_factory(tmp_path):
+    """A file-backed database, so concurrent workers each get their own connection."""
+    file_engine = create_engine(
+        f"sqlite:///{tmp_path / 'precompute.db'}", connect_args={"check_same_thread": False}
+    )
+    Base.metadata.create_all(bind=file_engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=file_engine)
+    file_engine.dispose()
+
+
+def _seed_songs(db, view_counts):
+    for song_id, views in view_counts.items():
+        db.add(models.ExternalSongReference(
+            external_id=song_id, title=f"Song {song_id}", artist="Artist", view_count=views
+        ))
+    db.commit()
+
+
+def test_off_peak_windows_wrap_midnight():
+    windows = parse_windows("23:00-02:00, 13:00-14:00")
+    assert current_window_start(datetime(2026, 1, 2, 1, 30), windows) == datetime(2026, 1, 1, 23, 0)
+    assert current_window_start(datetime(2026, 1, 2, 23, 30), windows) == datetime(2026, 1, 2, 23, 0)
+    assert current_window_start(datetime(2026, 1, 2, 13, 15), windows) == datetime(2026, 1, 2, 13, 0)
+    assert current_window_start(datetime(2026, 1, 2, 12, 0), windows) is None
+
+
+def test_run_precomputes_rising_songs_with_bounded_concurrency(file_session_factory):
+    db = file_session_factory()
+    _seed_songs(db, {1: 50, 2: 40, 3: 30, 4: 20, 5: 10})
+    db.add(models.Analysis(external_song_id=1, analysis_data={"overallHeadline": "Existing"}, version=1))
+    # Song 3 has not gained views since the previous run
+    db.add(models.PrecomputeRun(
+        view_snapshot={"2": 0, "3": 30, "4": 0, "5": 0},
+        started_at=datetime.utcnow() - timedelta(hours=1),
+        finished_at=datetime.utcnow()
+    ))
+    db.commit()
+    db.close()
+
+    in_flight = 0
+    max_in_flight = 0
+    lock = threading.Lock()
+
+    def fake_generate(song_id, title, artist):
+        nonlocal in_flight, max_in_flight
+        with lock:
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+        time.sleep(0.05)
+        with lock:
+            in_flight -= 1
+        return {"overallHeadline": f"Precomputed {title}"}, 1000
+
+    job = PrecomputeJob(fake_generate, file_session_factory, concurrency=2, token_budget=10 ** 6)
+    report = job.run()
+
+    assert report["candidates"] == 3
+    assert report["generated"] == 3
+    assert report["tokens_used"] == 3000
+    assert max_in_flight == 2
+
+    db = file_session_factory()
+    analyzed = {row.external_song_id for row in db.query(models.Analysis).all()}
+    assert analyzed == {1, 2, 4, 5}
+    db.close()
+
+
+def test_run_respects_token_budget(memory_session_factory):
+    db = memory_session_factory()
+    _seed_songs(db, {song_id: 100 - song_id for song_id in range(1, 6)})
+    db.close()
+
+    job = PrecomputeJob(
+        lambda song_id, title, artist: ({"overallHeadline": title}, DEFAULT_SONG_TOKEN_ESTIMATE),
+        memory_session_factory,
+        concurrency=1,
+        token_budget=DEFAULT_SONG_TOKEN_ESTIMATE * 2
+    )
+    report = job.run()
+
+    assert report["candidates"] == 5
+    assert report["generated"] == 2
+    assert report["tokens_used"] <= report["token_budget"]
+
+
+def test_coverage_reports_share_of_next_day_views(memory_session_factory):
+    started_at = datetime.utcnow() - timedelta(days=1, hours=2)
+    db = memory_session_factory()
+    _seed_songs(db, {1: 130, 2: 60})
+    db.add(models.PrecomputeRun(
+        started_at=started_at,
+        finished_at=started_at + timedelta(minutes=5),
+        precomputed_views={"1": 100},
+    ))
+    record_view_rollups(db, {1: 25, 2: 5}, at=started_at - timedelta(hours=1))  # Before the run
+    record_view_rollups(db, {1: 10, 2: 5}, at=started_at + timedelta(minutes=10))
+    record_view_rollups(db, {1: 20, 2: 5}, at=started_at + timedelta(hours=20))
+    record_view_rollups(db, {2: 50}, at=started_at + timedelta(days=1, hours=1))  # After the next day
+    db.commit()
+    db.close()
+
+    # Measured on the first check after the day has passed, even outside a window
+    job = PrecomputeJob(lambda *args: ({}, 0), memory_session_factory, windows="")
+    job.tick()
+
+    # 30 of the 40 views in the day after the run went to the precomputed song
+    db = memory_session_factory()
+    run = db.query(models.PrecomputeRun).one()
+    assert run.coverage == 0.75
+    assert run.coverage_measured_at is not None
+    db.close()
+    assert job.run()["coverage"] == []  # Already measured
@@ -0,0 +1,154 @@
+import pytest
+
+from database import models, rate_limit
+from database.rate_limit import (
+    DatabaseBackend,
+    RateLimitBackend,
+    SharedMemoryBackend,
+    SharedRateLimiter,
+    SlidingWindowLimiter,
+)
+
+
+def test_limit_is_enforced_per_key():
+    limiter = SlidingWindowLimiter(limit=3, window=10)
+    assert [limiter.hit("a", now=100.0)[0] for _ in range(4)] == [True, True, True, False]
+    assert limiter.hit("b", now=100.0) == (True, 0.0)
+
+
+def test_previous_window_slides_out():
+    limiter = SlidingWindowLimiter(limit=10, window=10)
+    for _ in range(10):
+        assert limiter.hit("a", now=105.0)[0]
+
+    # Halfway into the next window half of the previous count still applies
+    allowed, retry_after = limiter.hit("a", now=110.0)
+    assert not allowed and retry_after == pytest.approx(1.0)
+    assert [limiter.hit("a", now=115.0)[0] for _ in range(6)] == [True] * 5 + [False]
+
+
+def test_retry_after_is_accurate():
+    limiter = SlidingWindowLimiter(limit=4, window=10)
+    for _ in range(4):
+        limiter.hit("a", now=102.0)
+    allowed, retry_after = limiter.hit("a", now=104.0)
+    assert not allowed
+    assert not limiter.hit("a", now=104.0 + retry_after - 0.01)[0]
+    assert limiter.hit("a", now=104.0 + retry_after + 0.01)[0]
+
+
+def test_idle_keys_are_evicted():
+    limiter = SlidingWindowLimiter(limit=5, window=10, shards=4, evict_interval=30)
+    for i in range(1000):
+        limiter.hit(f"10.0.{i // 256}.{i % 256}", now=100.0)
+    assert len(limiter) == 1000
+
+    for shard in range(4):  # Touch every shard after the keys went idle
+        for i in range(100):
+            limiter.hit(f"late-{shard}-{i}", now=200.0)
+    assert len(limiter) == 400
+
+
+def _fill(limiter, key, requests, now):
+    return sum(limiter.hit(key, now=now)[0] for _ in range(requests))
+
+
+def _two_workers(make_backend):
+    return [SharedRateLimiter(limit=10, window=60, backend=make_backend()) for _ in range(2)]
+
+
+def _check_shared_limit(first, second):
+    assert _fill(first, "1.2.3.4", 6, now=120.0) == 6
+    first.sync(now=120.0)
+    # The second worker learns about the first one's requests on its next sync
+    second.hit("1.2.3.4", now=121.0)
+    second.sync(now=121.0)
+    assert _fill(second, "1.2.3.4", 10, now=121.0) == 3
+
+    second.sync(now=122.0)
+    # Until its next sync the first worker still decides on what it last saw
+    assert first.hit("1.2.3.4", now=122.0)[0]
+    first.sync(now=122.0)
+    assert not first.hit("1.2.3.4", now=122.0)[0]
+
+
+def test_shared_memory_backend_combines_workers(tmp_path):
+    path = str(tmp_path / "rate-limit")
+    _check_shared_limit(*_two_workers(lambda: SharedMemoryBackend("requests", path=path, slots=64)))
+
+
+def test_database_backend_combines_workers(memory_session_factory):
+    first, second = _two_workers(lambda: DatabaseBackend("requests", memory_session_factory))
+    _check_shared_limit(first, second)
+
+    db = memory_session_factory()
+    assert db.query(models.RateLimitCounter).one().count == 11
+    db.close()
+
+
+def _request_limiter_and_budget(make_backend):
+    """The request limiter and an hourly token budget, sharing one backend store as in production."""
+    requests = SharedRateLimiter(limit=100, window=60, backend=make_backend("requests"))
+    budget = SharedRateLimiter(limit=1000, window=3600, backend=make_backend("llm_ip"))
+    return requests, budget
+
+
+def _check_budget_survives_request_prunes(requests, budget):
+    now = 7200.0 + 3000  # Late in the budget's hour, so its window index is far below the request limiter's
+    assert budget.hit("ip:1.2.3.4", cost=900, now=now)[0]
+    budget.sync(now=now)
+    for second in range(5):  # Enough request-limiter syncs to prune, with requests under the same key
+        requests.hit("ip:1.2.3.4", now=now + second)
+        requests.sync(now=now + second)
+
+    budget.reset()
+    budget.hit("ip:1.2.3.4", cost=0, now=now + 10)
+    budget.sync(now=now + 10)
+    assert not budget.hit("ip:1.2.3.4", cost=200, now=now + 10)[0]
+
+
+def test_database_budget_survives_the_request_limiters_prune(memory_session_factory, monkeypatch):
+    monkeypatch.setattr(DatabaseBackend, "PRUNE_EVERY", 2)
+    _check_budget_survives_request_prunes(
+        *_request_limiter_and_budget(lambda scope: DatabaseBackend(scope, memory_session_factory))
+    )
+    db = memory_session_factory()
+    assert {row.scope for row in db.query(models.RateLimitCounter)} == {"requests", "llm_ip"}
+    db.close()
+
+
+def test_shared_memory_budget_survives_the_request_limiters_evictions(tmp_path, monkeypatch):
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_SHM_PATH", str(tmp_path / "rate-limit"))
+    # One slot per file: a shared file would evict the budget for the request key
+    _check_budget_survives_request_prunes(
+        *_request_limiter_and_budget(lambda scope: SharedMemoryBackend(scope, slots=1))
+    )
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["rate-limit-llm_ip", "rate-limit-requests"]
+
+
+def test_backend_serves_one_window_length(tmp_path):
+    backend = SharedMemoryBackend("requests", path=str(tmp_path / "rate-limit"), slots=64)
+    SharedRateLimiter(limit=10, window=60, backend=backend)
+    SharedRateLimiter(limit=20, window=60, backend=backend)
+    with pytest.raises(ValueError, match="own backend"):
+        SharedRateLimiter(limit=1000, window=3600, backend=backend)
+
+
+def test_failed_sync_keeps_increments():
+    class FlakyBackend(RateLimitBackend):
+        def __init__(self):
+            self.calls = []
+
+        def sync(self, increments, keys, index):
+            self.calls.append(dict(increments))
+            if len(self.calls) == 1:
+                raise ConnectionError("backend down")
+            return {key: (sum(increments.values()), 0) for key in keys}
+
+    backend = FlakyBackend()
+    limiter = SharedRateLimiter(limit=10, window=60, backend=backend)
+    _fill(limiter, "a", 3, now=60.0)
+    with pytest.raises(ConnectionError):
+        limiter.sync(now=60.0)
+    limiter.sync(now=60.0)
+    assert backend.calls[1] == {("a", 1): 3}
@@ -0,0 +1,80 @@
+import app as app_module
+from database import models
+from database.reanalysis import ReanalysisScheduler, crossed_threshold
+
+
+def _seed_song(db, song_id=555, comment_upvotes=(12, 15, 11)):
+    db.add(models.ExternalSongReference(external_id=song_id, title="Test Song", artist="Test Artist"))
+    db.add(models.Analysis(
+        external_song_id=song_id,
+        analysis_data={"overallHeadline": "Original", "version": 1},
+        version=1
+    ))
+    comments = [
+        models.Comment(external_song_id=song_id, content=f"Comment {i}", upvote_count=upvotes)
+        for i, upvotes in enumerate(comment_upvotes)
+    ]
+    db.add_all(comments)
+    db.commit()
+    return [comment.id for comment in comments]
+
+
+def test_crossed_threshold_only_fires_once():
+    assert not crossed_threshold(8, 9)
+    assert crossed_threshold(9, 10)
+    assert not crossed_threshold(10, 11)
+    assert not crossed_threshold(25, 26)
+
+
+def test_scheduler_coalesces_comments_into_one_reanalysis(memory_session_factory):
+    db = memory_session_factory()
+    comment_ids = _seed_song(db)
+    db.close()
+
+    calls = []
+
+    def fake_reanalyze(old_analysis, comments, artist, track):
+        calls.append((old_analysis, comments, artist, track))
+        return {**old_analysis, "overallHeadline": "Updated", "version": old_analysis["version"] + 1}
+
+    scheduler = ReanalysisScheduler(fake_reanalyze, memory_session_factory, debounce_seconds=60)
+    for comment_id in comment_ids:
+        scheduler.schedule(555, comment_id)
+    assert scheduler.pending(555) == comment_ids
+
+    scheduler.flush()
+
+    assert len(calls) == 1
+    old_analysis, comments, artist, track = calls[0]
+    assert old_analysis["overallHeadline"] == "Original"
+    assert comments == ["Comment 1", "Comment 0", "Comment 2"]  # Most upvoted first
+    assert (artist, track) == ("Test Artist", "Test Song")
+    assert scheduler.pending(555) == []
+
+    db = memory_session_factory()
+    latest = db.query(models.Analysis).order_by(models.Analysis.version.desc()).first()
+    assert latest.version == 2
+    assert latest.analysis_data["overallHeadline"] == "Updated"
+    db.close()
+
+
+def test_upvote_schedules_only_on_threshold_crossing(memory_client, memory_session_factory, monkeypatch):
+    db = memory_session_factory()
+    comment_ids = _seed_song(db, comment_upvotes=(8,))
+    db.close()
+
+    scheduled = []
+    scheduler = ReanalysisScheduler(lambda *args: {}, memory_session_factory, debounce_seconds=60)
+    monkeypatch.setattr(scheduler, "schedule", lambda song_id, comment_id: scheduled.append((song_id, comment_id)))
+    monkeypatch.setattr(app_module, "reanalysis_scheduler", scheduler)
+    voters = iter(range(4))
+    monkeypatch.setattr(app_module, "voter_key", lambda client_ip: f"voter-{next(voters)}")
+
+    counts = []
+    for _ in range(4):
+        response = memory_client.post(f"/api/comments/{comment_ids[0]}/upvote")
+        assert response.status_code == 200
+        counts.append(response.json()["upvote_count"])
+
+    assert counts == [9, 10, 11, 12]
+    assert scheduled == [(555, comment_ids[0])]
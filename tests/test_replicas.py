@@ -0,0 +1,113 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from database import models, replicas
+from database.config import Base
+from database.replicas import ReplicaRouter, get_async_read_db, get_read_db
+
+
+@pytest.fixture
+def replica_url(tmp_path):
+    """A second database file standing in for a read replica."""
+    url = f"sqlite:///{tmp_path / 'replica.db'}"
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    db.add(models.ExternalSongReference(external_id=1, title="Song", artist="Artist"))
+    db.add(models.Comment(external_song_id=1, content="From replica", upvote_count=0))
+    db.commit()
+    db.close()
+    engine.dispose()
+    return url
+
+
+@pytest.fixture
+def router(replica_url, memory_session_factory, memory_async_session_factory, monkeypatch):
+    router = ReplicaRouter([replica_url], memory_session_factory, memory_async_session_factory)
+    monkeypatch.setattr(replicas, "replica_router", router)
+    yield router
+    for replica in router.replicas:
+        replica.engine.dispose()
+
+
+def _comments(session_factory):
+    db = session_factory()
+    try:
+        return [comment.content for comment in db.query(models.Comment).all()]
+    finally:
+        db.close()
+
+
+def test_reads_go_to_healthy_replicas_in_turn(tmp_path, memory_session_factory, memory_async_session_factory):
+    router = ReplicaRouter(
+        [f"sqlite:///{tmp_path / 'a.db'}", f"sqlite:///{tmp_path / 'b.db'}"],
+        memory_session_factory, memory_async_session_factory
+    )
+    assert [router.choose().name for _ in range(4)] == ["replica0", "replica1", "replica0", "replica1"]
+
+    router.replicas[0].mark(False, "down")
+    assert {router.choose().name for _ in range(4)} == {"replica1"}
+    router.replicas[1].mark(False, "down")
+    assert router.choose() is None
+
+
+def test_unreachable_replica_falls_back_to_primary(tmp_path, memory_session_factory, memory_async_session_factory):
+    router = ReplicaRouter(
+        [f"sqlite:///{tmp_path / 'missing' / 'replica.db'}"], memory_session_factory, memory_async_session_factory
+    )
+    router.check_health()
+    assert router.metrics()["replica0"]["healthy"] is False
+
+    db = memory_session_factory()
+    db.add(models.Comment(external_song_id=1, content="From primary", upvote_count=0))
+    db.commit()
+    db.close()
+    assert _comments(lambda: next(router.read_session())) == ["From primary"]
+
+
+def test_writers_read_their_own_writes(router, memory_client):
+    memory_client.app.dependency_overrides.pop(get_read_db)
+    memory_client.app.dependency_overrides.pop(get_async_read_db)
+
+    before = memory_client.get("/api/songs/1/comments").json()
+    assert [comment["content"] for comment in before] == ["From replica"]
+
+    created = memory_client.post("/api/comments/anonymous", json={"song_id": 1, "content": "Mine"})
+    assert "read_primary_until" in created.headers["set-cookie"]
+
+    after = memory_client.get("/api/songs/1/comments").json()
+    assert [comment["content"] for comment in after] == ["Mine"]
+
+    # Other clients keep reading from the replica
+    memory_client.cookies.clear()
+    assert [c["content"] for c in memory_client.get("/api/songs/1/comments").json()] == ["From replica"]
+    assert router.metrics()["replica0"]["healthy"] is True
+
+
+def test_replica_failing_mid_request_retries_on_the_primary(tmp_path, memory_client, memory_session_factory,
+                                                           memory_async_session_factory, monkeypatch):
+    # Passes the health check, then fails every query: it has no tables
+    router = ReplicaRouter(
+        [f"sqlite:///{tmp_path / 'broken.db'}"], memory_session_factory, memory_async_session_factory
+    )
+    monkeypatch.setattr(replicas, "replica_router", router)
+    router.check_health()
+    assert router.metrics()["replica0"]["healthy"] is True
+
+    db = memory_session_factory()
+    db.add(models.ExternalSongReference(external_id=1, title="Song", artist="Artist"))
+    db.add(models.Comment(external_song_id=1, content="From primary", upvote_count=0))
+    db.commit()
+    db.close()
+
+    assert _comments(lambda: next(router.read_session())) == ["From primary"]
+    assert router.metrics()["replica0"]["healthy"] is False
+
+    router.replicas[0].mark(True)
+    memory_client.app.dependency_overrides.pop(get_async_read_db)
+    response = memory_client.get("/api/songs/1/comments")
+    assert response.status_code == 200
+    assert [comment["content"] for comment in response.json()] == ["From primary"]
+    assert router.metrics()["replica0"]["healthy"] is False
+    router.replicas[0].engine.dispose()
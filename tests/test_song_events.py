@@ -0,0 +1,101 @@
+import asyncio
+import threading
+
+import pytest
+
+from database import models
+from database.analysis_store import save_analysis_version
+from database.song_events import SongEventHub, TooManySubscribers
+
+
+async def _next(stream):
+    return await asyncio.wait_for(stream.__anext__(), 1)
+
+
+def test_events_fan_out_per_song_from_any_thread():
+    async def scenario():
+        hub = SongEventHub()
+        first, second, other = hub.subscribe(1), hub.subscribe(1), hub.subscribe(2)
+        streams = [hub.stream(subscription, heartbeat=5) for subscription in (first, second, other)]
+        for stream in streams:
+            assert await _next(stream) == "retry: 5000\n\n"
+
+        # Endpoints publish from the threadpool
+        thread = threading.Thread(target=hub.publish, args=(1, "upvote", {"comment_id": 3, "upvote_count": 2}))
+        thread.start()
+        thread.join()
+
+        expected = 'event: upvote\ndata: {"comment_id": 3, "upvote_count": 2}\n\n'
+        assert await _next(streams[0]) == expected
+        assert await _next(streams[1]) == expected
+        assert other.queue.empty()
+
+        await streams[0].aclose()
+        assert hub.subscriber_count(1) == 1
+        assert hub.subscriber_count() == 2
+
+    asyncio.run(scenario())
+
+
+def test_slow_subscriber_is_dropped_with_resync():
+    async def scenario():
+        hub = SongEventHub(queue_size=2)
+        subscription = hub.subscribe(1)
+        stream = hub.stream(subscription, heartbeat=5)
+        await _next(stream)
+
+        for i in range(3):
+            hub.publish(1, "comment", {"id": i})
+        assert hub.subscriber_count(1) == 0
+
+        assert "comment" in await _next(stream)
+        assert "comment" in await _next(stream)
+        assert await _next(stream) == "event: resync\ndata: {}\n\n"
+        with pytest.raises(StopAsyncIteration):
+            await _next(stream)
+
+    asyncio.run(scenario())
+
+
+def test_subscriber_limit():
+    async def scenario():
+        hub = SongEventHub(max_subscribers=1)
+        hub.subscribe(1)
+        with pytest.raises(TooManySubscribers):
+            hub.subscribe(2)
+
+    asyncio.run(scenario())
+
+
+def test_committed_analysis_versions_are_published(memory_session_factory):
+    async def scenario():
+        hub = SongEventHub()
+        hub.track_analysis_commits()
+        subscription = hub.subscribe(7)
+
+        db = memory_session_factory()
+        save_analysis_version(db, 7, {"overallHeadline": "Fresh"})
+        db.flush()
+        assert subscription.queue.empty()  # Nothing is sent before the commit
+        db.commit()
+        db.close()
+
+        message = await asyncio.wait_for(subscription.queue.get(), 1)
+        assert message == 'event: analysis\ndata: {"song_id": 7, "version": 1, "overallHeadline": "Fresh"}\n\n'
+
+        # A rolled-back savepoint drops only the versions flushed inside it
+        db = memory_session_factory()
+        savepoint = db.begin_nested()
+        db.add(models.Analysis(external_song_id=7, analysis_data={"overallHeadline": "Lost"}, version=5))
+        db.flush()
+        savepoint.rollback()
+        save_analysis_version(db, 7, {"overallHeadline": "Kept"})
+        db.commit()
+        db.close()
+
+        message = await asyncio.wait_for(subscription.queue.get(), 1)
+        assert message == 'event: analysis\ndata: {"song_id": 7, "version": 2, "overallHeadline": "Kept"}\n\n'
+        assert subscription.queue.empty()
+
+    asyncio.run(scenario())
+
@@ -0,0 +1,101 @@
+import time
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event
+
+from database import models, security
+from database.tokens import TokenDenyList, TokenSigner, TTLCache
+
+
+def _register(client, username="alice"):
+    response = client.post("/register", json={"username": username, "password": "secret"})
+    assert response.status_code == 200
+    return response.json()["access_token"]
+
+
+def test_rotation_keeps_old_tokens_valid_until_their_key_is_dropped():
+    old = TokenSigner({"k1": b"first"}, active_kid="k1")
+    token = old.sign({"sub": "1", "exp": time.time() + 60, "jti": "a"})
+
+    rotated = TokenSigner({"k1": b"first", "k2": b"second"}, active_kid="k2")
+    assert rotated.verify(token)["sub"] == "1"
+    assert rotated.verify(rotated.sign({"sub": "2", "exp": time.time() + 60}))["sub"] == "2"
+
+    retired = TokenSigner({"k2": b"second"}, active_kid="k2")
+    assert retired.verify(token) is None
+
+
+def test_rejects_forged_expired_and_unkeyed_tokens():
+    signer = TokenSigner({"k1": b"secret"})
+    token = signer.sign({"sub": "1", "exp": time.time() + 60})
+    header, payload, signature = token.split(".")
+
+    assert signer.verify(f"{header}.{payload}.{'0' * len(signature)}") is None
+    assert TokenSigner({"k1": b"other"}).verify(token) is None
+    assert signer.verify(signer.sign({"sub": "1", "exp": time.time() - 1})) is None
+    assert signer.verify("not-a-token") is None
+
+
+def test_missing_signing_keys_only_fall_back_to_a_random_key_in_tests(monkeypatch):
+    assert "ephemeral" in TokenSigner({}).keys
+
+    monkeypatch.setattr("database.tokens.ENV", "production")
+    with pytest.raises(RuntimeError, match="TOKEN_SIGNING_KEYS"):
+        TokenSigner({})
+
+
+def test_ttl_cache_expires_and_evicts():
+    cache = TTLCache(max_size=2)
+    cache.put("a", 1, ttl=60)
+    cache.put("b", 2, ttl=60)
+    cache.put("c", 3, ttl=60)
+    assert cache.get("a") is None
+    assert cache.get("c") == 3
+    cache.put("d", 4, ttl=0)
+    assert cache.get("d") is None
+
+
+def test_cached_token_is_verified_without_queries(memory_client, memory_session_factory):
+    token = _register(memory_client)
+    db = memory_session_factory()
+    assert security.verify_token(token, db).username == "alice"
+
+    statements = []
+    event.listen(memory_session_factory.kw["bind"], "before_cursor_execute",
+                 lambda *args: statements.append(args[2]))
+    user = security.verify_token(token, db)
+    db.close()
+
+    assert user.username == "alice"
+    assert statements == []
+
+
+def test_logout_revokes_token(memory_client, memory_session_factory):
+    token = _register(memory_client)
+    headers = {"Authorization": f"Bearer {token}"}
+    comment = {"song_id": 1, "content": "Hello"}
+
+    assert memory_client.post("/api/comments/authenticated", json=comment, headers=headers).status_code == 200
+    assert memory_client.post("/logout", headers=headers).status_code == 204
+    assert memory_client.post("/api/comments/authenticated", json=comment, headers=headers).status_code == 401
+    assert memory_client.post("/logout", headers=headers).status_code == 401
+
+
+def test_revocations_from_other_processes_apply_after_refresh(memory_session_factory):
+    signer = TokenSigner({"k1": b"secret"})
+    claims = {"sub": "1", "exp": time.time() + 60, "jti": "shared"}
+    other = TokenDenyList(memory_session_factory)
+    local = TokenDenyList(memory_session_factory)
+
+    db = memory_session_factory()
+    other.revoke(db, claims["jti"], claims["exp"])
+    db.add(models.RevokedToken(jti="stale", expires_at=datetime.utcnow()))
+    db.commit()
+    db.close()
+
+    assert "shared" not in local
+    local.refresh()
+    assert "shared" in local
+    assert "stale" not in local
+    assert signer.verify(signer.sign(claims))["jti"] in local
@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta
+
+from database import models
+from database.trending import prune_view_rollups, record_view_rollups, trending_songs
+from database.view_counter import ViewCounterBuffer
+
+
+def _seed_songs(db, song_ids):
+    for song_id in song_ids:
+        db.add(models.ExternalSongReference(external_id=song_id, title=f"Song {song_id}", artist="Artist"))
+    db.commit()
+
+
+def test_rollups_accumulate_per_bucket(memory_session_factory):
+    db = memory_session_factory()
+    now = datetime(2026, 3, 1, 12, 30)
+    record_view_rollups(db, {1: 2, 2: 1}, at=now)
+    record_view_rollups(db, {1: 3}, at=now + timedelta(minutes=10))
+    record_view_rollups(db, {1: 4}, at=now + timedelta(hours=1))
+    db.commit()
+
+    hourly = {
+        (row.external_song_id, row.bucket_start): row.views
+        for row in db.query(models.SongViewHourly).all()
+    }
+    assert hourly == {
+        (1, datetime(2026, 3, 1, 12)): 5,
+        (2, datetime(2026, 3, 1, 12)): 1,
+        (1, datetime(2026, 3, 1, 13)): 4,
+    }
+    daily = {row.external_song_id: row.views for row in db.query(models.SongViewDaily).all()}
+    assert daily == {1: 9, 2: 1}
+    db.close()
+
+
+def test_trending_prefers_recent_views(memory_session_factory):
+    db = memory_session_factory()
+    _seed_songs(db, [1, 2, 3])
+    now = datetime(2026, 3, 2, 12, 0)
+    record_view_rollups(db, {1: 100}, at=now - timedelta(hours=20))  # Big but old
+    record_view_rollups(db, {2: 40}, at=now)                         # Fresh
+    record_view_rollups(db, {3: 500}, at=now - timedelta(hours=30))  # Outside the window
+    db.commit()
+
+    ranked = trending_songs(db, window="24h", now=now)
+    assert [item["id"] for item in ranked] == [2, 1]
+    assert ranked[0]["trending_score"] == 40
+    assert ranked[1]["window_views"] == 100
+
+    ranked = trending_songs(db, window="7d", now=now)
+    assert [item["id"] for item in ranked] == [3, 1, 2]
+    db.close()
+
+
+def test_retention_prunes_old_buckets(memory_session_factory):
+    db = memory_session_factory()
+    now = datetime(2026, 6, 1, 12, 0)
+    record_view_rollups(db, {1: 1}, at=now - timedelta(days=10))
+    record_view_rollups(db, {1: 1}, at=now - timedelta(days=100))
+    record_view_rollups(db, {1: 1}, at=now)
+    db.commit()
+
+    assert prune_view_rollups(db, now=now) == (2, 1)
+    assert db.query(models.SongViewHourly).count() == 1
+    assert db.query(models.SongViewDaily).count() == 2
+    db.close()
+
+
+def test_view_flush_feeds_trending_endpoint(memory_client, memory_session_factory):
+    buffer = ViewCounterBuffer(memory_session_factory, flush_interval=60)
+    buffer.increment(7, title="Fresh", artist="Artist", views=3)
+    buffer.increment(8, views=1)
+    buffer.flush()
+
+    response = memory_client.get("/api/trending?window=24h")
+    assert response.status_code == 200
+    assert [(item["id"], item["window_views"]) for item in response.json()] == [(7, 3), (8, 1)]
+    assert memory_client.get("/api/trending?window=1y").status_code == 400
@@ -0,0 +1,41 @@
+from database import models
+from database.upserts import ensure_song_reference, upsert_song_reference, upsert_song_references
+
+
+def test_upserts_insert_then_update(memory_session_factory):
+    db = memory_session_factory()
+    ensure_song_reference(db, 1, title="First", artist="Artist")
+    ensure_song_reference(db, 1, title="Ignored", artist="Ignored")
+    upsert_song_reference(db, 2, views=2)
+    upsert_song_reference(db, 2, title="Named later", views=3)
+    upsert_song_references(db, [
+        {"external_id": 1, "views": 4},
+        {"external_id": 3, "title": "Third", "artist": "Band", "views": 1},
+    ])
+    db.commit()
+
+    songs = {song.external_id: song for song in db.query(models.ExternalSongReference).all()}
+    assert (songs[1].title, songs[1].artist, songs[1].view_count) == ("First", "Artist", 4)
+    assert (songs[2].title, songs[2].artist, songs[2].view_count) == ("Named later", "Unknown", 5)
+    assert (songs[3].title, songs[3].view_count) == ("Third", 1)
+    db.close()
+
+
+def test_anonymous_comment_creates_reference_in_one_transaction(memory_client, memory_session_factory):
+    response = memory_client.post(
+        "/api/comments/anonymous?title=Song&artist=Artist",
+        json={"content": "First!", "song_id": 99}
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["username"] == "Anonymous"
+    assert data["created_at"] is not None
+
+    response = memory_client.post("/api/comments/anonymous", json={"content": "Second", "song_id": 99})
+    assert response.status_code == 200
+
+    db = memory_session_factory()
+    song = db.query(models.ExternalSongReference).filter(models.ExternalSongReference.external_id == 99).one()
+    assert (song.title, song.artist) == ("Song", "Artist")
+    assert db.query(models.Comment).filter(models.Comment.external_song_id == 99).count() == 2
+    db.close()
@@ -0,0 +1,56 @@
+import threading
+
+import app as app_module
+from database import models
+from database.view_counter import ViewCounterBuffer
+
+
+def test_buffered_views_flush_as_atomic_increments(memory_session_factory):
+    db = memory_session_factory()
+    db.add(models.ExternalSongReference(external_id=1, title="Song 1", artist="Artist", view_count=5))
+    db.commit()
+    db.close()
+
+    buffer = ViewCounterBuffer(memory_session_factory, flush_interval=60)
+    threads = [
+        threading.Thread(target=lambda: [buffer.increment(1) for _ in range(100)])
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    buffer.increment(2, title="New Song", artist="New Artist", views=3)
+
+    metrics = buffer.metrics()
+    assert metrics["pending_views"] == 803
+    assert metrics["pending_songs"] == 2
+
+    assert buffer.flush() == 803
+    assert buffer.metrics()["pending_views"] == 0
+    assert buffer.metrics()["flush_lag_seconds"] == 0
+
+    db = memory_session_factory()
+    songs = {song.external_id: song for song in db.query(models.ExternalSongReference).all()}
+    assert songs[1].view_count == 805
+    assert (songs[2].title, songs[2].artist, songs[2].view_count) == ("New Song", "New Artist", 3)
+    db.close()
+
+
+def test_view_endpoint_buffers_until_shutdown(memory_client, memory_session_factory, monkeypatch):
+    buffer = ViewCounterBuffer(memory_session_factory, flush_interval=60)
+    monkeypatch.setattr(app_module, "view_counter", buffer)
+    app_module.app.dependency_overrides[app_module.get_current_user] = lambda: None
+
+    for _ in range(3):
+        response = memory_client.post("/api/songs/42/view?title=Song&artist=Artist")
+        assert response.status_code == 200
+    assert buffer.pending(42) == 3
+    assert memory_client.get("/api/metrics").json()["view_counter"]["pending_views"] == 3
+
+    buffer.stop()  # What the shutdown hook does for the app's buffer, without stopping the other jobs
+
+    db = memory_session_factory()
+    song = db.query(models.ExternalSongReference).filter(models.ExternalSongReference.external_id == 42).one()
+    assert (song.title, song.view_count) == ("Song", 3)
+    db.close()
@@ -0,0 +1,147 @@
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+
+import app as app_module
+from database import models
+from database.config import Base
+from database.votes import BloomFilter, DuplicateVoteError, VoteRecorder, voter_key
+
+
+def _seed_comment(session_factory):
+    db = session_factory()
+    db.add(models.ExternalSongReference(external_id=1, title="Song", artist="Artist"))
+    comment = models.Comment(external_song_id=1, content="Comment", upvote_count=0)
+    db.add(comment)
+    db.commit()
+    comment_id = comment.id
+    db.close()
+    return comment_id
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    for i in range(1000):
+        bloom.add(f"vote-{i}")
+    assert all(f"vote-{i}" in bloom for i in range(1000))
+    false_positives = sum(f"other-{i}" in bloom for i in range(10000))
+    assert false_positives < 300
+
+
+def test_repeat_vote_is_rejected(memory_client, memory_session_factory, monkeypatch):
+    monkeypatch.setattr(app_module, "vote_recorder", VoteRecorder(capacity=1000))
+    comment_id = _seed_comment(memory_session_factory)
+
+    first = memory_client.post(f"/api/comments/{comment_id}/upvote")
+    assert first.status_code == 200
+    assert first.json()["upvote_count"] == 1
+
+    assert memory_client.post(f"/api/comments/{comment_id}/upvote").status_code == 400
+    assert memory_client.post("/api/comments/9999/upvote").status_code == 404
+
+    db = memory_session_factory()
+    assert db.query(models.CommentVote).count() == 1
+    assert db.get(models.Comment, comment_id).upvote_count == 1
+    db.close()
+
+
+def test_votes_without_a_reported_client_count_as_unknown(memory_client, memory_session_factory, monkeypatch):
+    monkeypatch.setattr(app_module, "vote_recorder", VoteRecorder(capacity=1000))
+    comment_id = _seed_comment(memory_session_factory)
+
+    async def without_client(scope, receive, send):
+        await memory_client.app(dict(scope, client=None), receive, send)
+
+    client = TestClient(without_client)
+    assert client.post(f"/api/comments/{comment_id}/upvote").status_code == 200
+    assert client.post(f"/api/comments/{comment_id}/upvote").status_code == 400
+
+    db = memory_session_factory()
+    assert db.query(models.CommentVote).one().voter_key == voter_key("unknown")
+    db.close()
+
+
+def test_constraint_catches_votes_the_filter_has_not_seen(memory_session_factory):
+    comment_id = _seed_comment(memory_session_factory)
+    db = memory_session_factory()
+    assert VoteRecorder(capacity=1000).record(db, comment_id, "voter") == (1, 1)
+    db.commit()
+
+    # A fresh process starts with an empty filter; the unique constraint rejects the repeat
+    recorder = VoteRecorder(capacity=1000)
+    with pytest.raises(DuplicateVoteError):
+        recorder.record(db, comment_id, "voter")
+    db.rollback()
+
+    # Later repeats are flagged by the filter and confirmed with a read, without writing
+    statements = []
+    bind = memory_session_factory.kw["bind"]
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(bind, "before_cursor_execute", listener)
+    try:
+        with pytest.raises(DuplicateVoteError):
+            recorder.record(db, comment_id, "voter")
+    finally:
+        event.remove(bind, "before_cursor_execute", listener)
+    assert len(statements) == 1 and statements[0].lstrip().upper().startswith("SELECT")
+    db.close()
+
+
+def test_filter_false_positives_do_not_reject_first_votes(memory_session_factory):
+    comment_id = _seed_comment(memory_session_factory)
+    recorder = VoteRecorder(capacity=1000)
+    recorder.committed(comment_id, "new-voter")  # As if the filter collided on this vote
+
+    db = memory_session_factory()
+    assert recorder.record(db, comment_id, "new-voter") == (1, 1)
+    db.commit()
+    assert db.query(models.CommentVote).count() == 1
+    db.close()
+
+
+def test_missing_comment_is_not_voted_with_foreign_keys_enforced(memory_session_factory):
+    event.listen(
+        memory_session_factory.kw["bind"], "connect",
+        lambda connection, record: connection.execute("PRAGMA foreign_keys=ON")
+    )
+    memory_session_factory.kw["bind"].dispose()
+    comment_id = _seed_comment(memory_session_factory)
+
+    db = memory_session_factory()
+    assert db.execute(text("PRAGMA foreign_keys")).scalar() == 1
+    assert VoteRecorder(capacity=1000).record(db, comment_id + 1, "voter") is None
+    db.rollback()
+    assert db.query(models.CommentVote).count() == 0
+    db.close()
+
+
+def test_concurrent_votes_are_not_lost(tmp_path):
+    file_engine = create_engine(
+        f"sqlite:///{tmp_path / 'votes.db'}", connect_args={"check_same_thread": False, "timeout": 30}
+    )
+    Base.metadata.create_all(bind=file_engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=file_engine)
+    comment_id = _seed_comment(session_factory)
+    recorder = VoteRecorder(capacity=1000)
+
+    def vote(voter):
+        db = session_factory()
+        try:
+            recorder.record(db, comment_id, voter)
+            db.commit()
+        finally:
+            db.close()
+
+    threads = [threading.Thread(target=vote, args=(f"voter-{i}",)) for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    db = session_factory()
+    assert db.get(models.Comment, comment_id).upvote_count == 20
+    db.close()
+    file_engine.dispose()